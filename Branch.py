@@ -5,8 +5,13 @@ Version: v0.5.19
 VERSION = 'v0.5.19'
 
 # built-ins
-import os, re, ast, math, json, copy, random, operator, time
-from typing import Any, Dict, List, Optional, Tuple, Union
+import os, re, ast, sys, math, json, copy, mmap, bisect, codecs, random, struct, sqlite3, operator, time, queue, tempfile, threading
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 # tkinter
 import tkinter as tk
@@ -17,6 +22,12 @@ import tkinter.ttk as ttk
 # customtkinter
 import customtkinter as ctk
 
+# numpy (optional, only the ending solver needs it)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 _ALLOWED_MATH_FUNCS = { # allowed (math) functions
     'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'sqrt': math.sqrt,
     'abs': abs, 'min': min, 'max': max, 'round': round, 'int': int, 'float': float
@@ -33,71 +44,80 @@ _ALLOWED_OPERATORS = { # allowed (math) operators
     ast.FloorDiv: operator.floordiv,
 }
 
+_ALLOWED_COMPARISONS = (ast.Eq, ast.NotEq, ast.Gt, ast.GtE, ast.Lt, ast.LtE)
+_EXPR_CACHE: Dict[str, Any] = {} # compiled expressions (or the error they raised), keyed by expression text
+_EXPR_CACHE_MAX = 4096 # the cache is simply flushed when it grows past this
+_EXPR_GLOBALS = {'__builtins__': {}} # whitelisted functions are renamed to '__fn_<name>' so variables can't shadow them
+_EXPR_GLOBALS.update({f'__fn_{name}': fn for name, fn in _ALLOWED_MATH_FUNCS.items()})
+
+def _validate_expr(n): # checks an expression tree against the whitelist, raising ValueError like safe_eval_expr always has
+    if isinstance(n, ast.Expression):
+        return _validate_expr(n.body)
+    if isinstance(n, ast.Constant):
+        return
+    if isinstance(n, ast.BinOp):
+        _validate_expr(n.left)
+        _validate_expr(n.right)
+        op = type(n.op)
+        if op not in _ALLOWED_OPERATORS:
+            raise ValueError(f"Operator {op} not allowed")
+        return
+    if isinstance(n, ast.UnaryOp):
+        _validate_expr(n.operand)
+        op = type(n.op)
+        if op not in _ALLOWED_OPERATORS:
+            raise ValueError(f"Unary operator {op} not allowed")
+        return
+    if isinstance(n, ast.Name):
+        # dunder names would be looked up in the eval globals (__builtins__, the '__fn_' functions), never in the variables
+        if n.id.startswith('__'):
+            raise ValueError(f"Name '{n.id}' not defined")
+        return
+    if isinstance(n, ast.Call):
+        # only allow simple function calls (no attribute calls)
+        if isinstance(n.func, ast.Name) and n.func.id in _ALLOWED_MATH_FUNCS:
+            for a in n.args:
+                _validate_expr(a)
+            # keyword arguments have always been ignored
+            n.keywords = []
+            n.func = ast.copy_location(ast.Name(id=f'__fn_{n.func.id}', ctx=ast.Load()), n.func)
+            return
+        raise ValueError("Function calls not allowed or not whitelisted")
+    if isinstance(n, ast.Compare):
+        _validate_expr(n.left)
+        for op, comparator in zip(n.ops, n.comparators):
+            if not isinstance(op, _ALLOWED_COMPARISONS):
+                raise ValueError("Comparison operator not allowed")
+            _validate_expr(comparator)
+        return
+    raise ValueError(f"Unsupported AST: {type(n)}")
+
+def _compile_expr(expr: str): # parses, validates and compiles an expression once; later calls hit the cache
+    cached = _EXPR_CACHE.get(expr)
+    if cached is None:
+        try:
+            tree = ast.parse(expr, mode='eval')
+            _validate_expr(tree)
+            cached = compile(tree, '<expr>', 'eval')
+        except Exception as e:
+            cached = e
+        if len(_EXPR_CACHE) >= _EXPR_CACHE_MAX:
+            _EXPR_CACHE.clear()
+        _EXPR_CACHE[expr] = cached
+    if isinstance(cached, Exception):
+        raise cached.with_traceback(None)
+    return cached
+
 def safe_eval_expr(expr: str, names: dict): # evaluates an expression safely
     expr = expr.strip()
     if not expr:
         return None
 
-    # parse
-    node = ast.parse(expr, mode='eval')
-
-    def _eval(n):
-        if isinstance(n, ast.Expression):
-            return _eval(n.body)
-        if isinstance(n, ast.Constant):
-            return n.value
-        if isinstance(n, ast.BinOp):
-            left = _eval(n.left)
-            right = _eval(n.right)
-            op = type(n.op)
-            if op in _ALLOWED_OPERATORS:
-                return _ALLOWED_OPERATORS[op](left, right)
-            raise ValueError(f"Operator {op} not allowed")
-        if isinstance(n, ast.UnaryOp):
-            operand = _eval(n.operand)
-            op = type(n.op)
-            if op in _ALLOWED_OPERATORS:
-                return _ALLOWED_OPERATORS[op](operand)
-            raise ValueError(f"Unary operator {op} not allowed")
-        if isinstance(n, ast.Name):
-            # allow names from provided names dict
-            if n.id in names:
-                return names[n.id]
-            # allow numeric-looking strings? No - return 0 or raise
-            raise ValueError(f"Name '{n.id}' not defined")
-        if isinstance(n, ast.Call):
-            # only allow simple function calls (no attribute calls)
-            if isinstance(n.func, ast.Name):
-                fname = n.func.id
-                if fname in _ALLOWED_MATH_FUNCS:
-                    args = [_eval(a) for a in n.args]
-                    return _ALLOWED_MATH_FUNCS[fname](*args)
-            raise ValueError("Function calls not allowed or not whitelisted")
-        if isinstance(n, ast.Compare):
-            left = _eval(n.left)
-            results = []
-            for op, comparator in zip(n.ops, n.comparators):
-                right = _eval(comparator)
-                if isinstance(op, ast.Eq):
-                    results.append(left == right)
-                elif isinstance(op, ast.NotEq):
-                    results.append(left != right)
-                elif isinstance(op, ast.Gt):
-                    results.append(left > right)
-                elif isinstance(op, ast.GtE):
-                    results.append(left >= right)
-                elif isinstance(op, ast.Lt):
-                    results.append(left < right)
-                elif isinstance(op, ast.LtE):
-                    results.append(left <= right)
-                else:
-                    raise ValueError("Comparison operator not allowed")
-                left = right
-            return all(results)
-        raise ValueError(f"Unsupported AST: {type(n)}")
-
-    ret = _eval(node)
-    return ret
+    code = _compile_expr(expr)
+    try:
+        return eval(code, _EXPR_GLOBALS, names)
+    except NameError as e:
+        raise ValueError(str(e)) from None
 
 # dictionaries and whatnot
 nodes: Dict[int, Dict] = {}
@@ -112,53 +132,438 @@ THEME_PATH = "./theme.json" # path for 'theme.json' (saves your in-app theme on
 CURRENT_FILE = None 
 MIN_W, MIN_H = 30, 20 # minimum size for comments
 
+class _EditorState: # runtime state backed by the module globals above; used whenever no PlaySession is given
+    rng = random
+
+    @property
+    def vars(self) -> Dict[str, Any]:
+        return vars_store
+
+    @property
+    def inventory(self) -> List[str]:
+        return inventory
+
+    def node_context(self, node_id: int, node: Dict) -> Dict:
+        return node
+
+EDITOR_STATE = _EditorState()
+
 # A "LEAF" (it doesn't matter if it's uppercased) is simply a name for an option line in the Node Inspector.
 
-def parse_option_line(line: Union[str, Dict]) -> Optional[Dict]:
-    if isinstance(line, dict):
-        return line
+# ------- DSL parser -------
+# Options lines are tokenized in one regex scan and parsed once into Actions that carry their column span in the line.
+# The editor's highlighting and error underlining and the runtime's compiled actions all come from this one parse.
+ACTION_PARSERS: Dict[str, Callable[[str, int], Optional["Action"]]] = {} # leading keyword ('@' or a word) -> action parser (see register_action)
+ACTION_BUILDERS: Dict[str, Callable[["Action"], Callable[[Dict, Any], None]]] = {} # Action kind -> closure factory
+DSL_KEYWORDS = {'has_item', 'not_has_item', 'hlet'} # highlighted words: these condition keywords plus every registered action keyword
+ACTION_REGISTRY_VERSION = 0 # bumped by register_action; whatever was cached from an earlier parse (highlighted lines) is stale then
+_ACTION_KEYWORD = re.compile(r"@|[A-Za-z_][A-Za-z0-9_]*")
+_DSL_TOKEN = re.compile(r"""
+    (?P<string>"[^"|]*"|'[^'|]*')
+  | (?P<variable>\{[A-Za-z_][A-Za-z0-9_]*\})
+  | (?P<function>(?<=&)[A-Za-z_][A-Za-z0-9_]*(?=\())
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>\d+(?:\.\d+)?(?![A-Za-z0-9_]))
+  | (?P<operator>[+\-*/]?=)
+  | (?P<separator>\||>>?|[:&;])
+  | (?P<open>[(\[{])
+  | (?P<close>[)\]}])
+""", re.VERBOSE)
+_DSL_BRACKETS = {')': '(', ']': '[', '}': '{'}
+_DSL_BRACKET_KINDS = {'(': "separator", ')': "separator", '[': "bracket", ']': "bracket", '{': "bracket", '}': "bracket"}
+_ACTION_PIECES = re.compile(r"[^&;]+")
+_ACTION_SEPARATOR = re.compile(r"[&;]")
+_TIMER_LINE = re.compile(r"@timer\((\d+(?:\.\d+)?)\):(>>?|:)(.+)")
+_GUARDED = re.compile(r"<(.+?)>(.*)$")
+_IF_BLOCK = re.compile(r"^if\((.+?)\):?<(.+?)>(.*)$")
+_IF_THEN = re.compile(r"^if\((.+?)\)(>>?)(.+)$")
+_ONCE = re.compile(r"^once:(>>?|:)?(.+)$")
+_CHANCE = re.compile(r"^chance\((.+)\)>(.+?)(?:>(.+))?$")
+_REPEAT = re.compile(r"^repeat:(.+?)(>>?|:)(.+)$")
+_CLAMP = re.compile(r"^clamp\((.+?):(.+?),(.+?)\)$")
+_CONSUME = re.compile(r"^consume\((.+?):(.+)\)$")
+_ASSIGN = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)\s*([\+\-\*/]?=)\s*(.+)$")
+
+class Action: # one parsed action: its kind, its [start, end) columns in the line, its arguments and its nested actions
+    __slots__ = ("kind", "start", "end", "args", "children")
+
+    def __init__(self, kind: str, start: int, end: int, args: Optional[Dict[str, Any]] = None, children: Optional[Dict[str, List["Action"]]] = None):
+        self.kind = kind # 'invalid' for anything the runtime would ignore; args["error"] says why
+        self.start = start
+        self.end = end
+        self.args = args or {}
+        self.children = children or {}
+
+    def __repr__(self):
+        return f"Action({self.kind!r}, {self.start}, {self.end}, {self.args!r}, {self.children!r})"
+
+class OptionSyntax: # one options line parsed once: its tokens, the leaf dict it describes, its actions and its errors
+    __slots__ = ("kind", "tokens", "option", "actions", "errors")
+
+    def __init__(self, kind: str, tokens: List[Tuple[str, int, int]], option: Optional[Dict], actions: List[Action], errors: List[Tuple[int, int, str]]):
+        self.kind = kind # 'blank', 'comment', 'timer', 'instant' or 'leaf'
+        self.tokens = tokens
+        self.option = option # what parse_option_line returns
+        self.actions = actions
+        self.errors = errors # (start, end, message)
+
+def tokenize_line(line: str) -> Tuple[List[Tuple[str, int, int]], List[Tuple[int, int]]]:
+    # one scan of an options line -> ([(kind, start, end)], spans of unbalanced brackets)
+    stripped = line.lstrip()
+    if stripped.startswith("#"):
+        return [("comment", len(line) - len(stripped), len(line))], []
+    tokens = []
+    stack: List[Tuple[str, int]] = []
+    unbalanced = []
+    for m in _DSL_TOKEN.finditer(line):
+        kind, start, end = m.lastgroup, m.start(), m.end()
+        if kind == "word":
+            kind = "keyword" if m.group() in DSL_KEYWORDS else "name"
+        elif kind == "open":
+            char = m.group()
+            stack.append((char, start))
+            kind = _DSL_BRACKET_KINDS[char]
+        elif kind == "close":
+            char = m.group()
+            if not stack or stack.pop()[0] != _DSL_BRACKETS[char]:
+                unbalanced.append((start, end))
+            kind = _DSL_BRACKET_KINDS[char]
+        tokens.append((kind, start, end))
+    unbalanced.extend((start, start + 1) for _, start in stack) # unclosed opening brackets
+    return tokens, unbalanced
+
+def _piece(text: str, offset: int, start: int, stop: int) -> Tuple[str, int]: # text[start:stop] stripped, and the column it starts at
+    raw = text[start:stop]
+    return raw.strip(), offset + start + len(raw) - len(raw.lstrip())
+
+def parse_actions(act: str, offset: int = 0) -> List[Action]: # an action string split into its '&'/';' separated actions, the way they run
+    if not act:
+        return []
+    if act.strip().startswith('if('):
+        return [parse_action(*_piece(act, offset, 0, len(act)))]
+    actions = []
+    for m in _ACTION_PIECES.finditer(act):
+        sub, col = _piece(act, offset, m.start(), m.end())
+        if sub:
+            actions.append(parse_action(sub, col))
+    return actions
+
+def parse_separated(expr: str, sep: str, offset: int = 0) -> List[Action]:
+    # actions after a '>' (first action only), '>>' (all of them) or ':' (<COND>ACTS) separator
+    if sep == ">":
+        m = _ACTION_SEPARATOR.search(expr)
+        return parse_actions(*_piece(expr, offset, 0, m.start() if m else len(expr)))
+    if sep == ">>":
+        return parse_actions(expr, offset)
+    if sep == ":":
+        stripped, col = _piece(expr, offset, 0, len(expr))
+        m = _GUARDED.match(stripped)
+        if m:
+            cond, cond_col = _piece(stripped, col, *m.span(1))
+            rest, rest_col = _piece(stripped, col, *m.span(2))
+            return [Action("guarded", col, col + len(stripped), {"cond": cond},
+                           {"then": parse_actions(cond, cond_col), "else": parse_actions(rest, rest_col)})]
+    return [Action("invalid", offset, offset + len(expr), {"error": f"expected <CONDITION>ACTIONS after '{sep}'"})]
+
+def _invalid(sub: str, offset: int, error: str) -> Action:
+    return Action("invalid", offset, offset + len(sub), {"error": error})
+
+def parse_action(sub: str, offset: int = 0) -> Action:
+    # one stripped action (no top-level '&'/';'), dispatched on its leading keyword; offset is its column in the line
+    m = _ACTION_KEYWORD.match(sub)
+    parse = ACTION_PARSERS.get(m.group()) if m else None
+    action = parse(sub, offset) if parse is not None else None
+    return action if action is not None else _parse_assignment(sub, offset)
+
+def _action_parser(*keywords: str): # registers a built-in action parser under its leading keyword(s)
+    def register(parse):
+        for keyword in keywords:
+            ACTION_PARSERS[keyword] = parse
+            DSL_KEYWORDS.add(keyword)
+        return parse
+    return register
+
+# rename_item:OLD,NEW
+@_action_parser("rename_item")
+def _parse_rename_item(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("rename_item:"):
+        return None
+    parts = sub.split(":", 1)[1].strip().split(",", 1)
+    if len(parts) != 2:
+        return _invalid(sub, offset, "rename_item needs OLD,NEW")
+    return Action("rename_item", offset, offset + len(sub), {"old": parts[0].strip(), "new": parts[1].strip()})
+
+# ------------------ rlet:index:new_char ------------------
+@_action_parser("rlet")
+def _parse_rlet(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("rlet:"):
+        return None
+    parts = sub[5:].split(":", 1)
+    if len(parts) != 2:
+        return _invalid(sub, offset, "rlet needs INDEX:CHAR")
+    return Action("rlet", offset, offset + len(sub), {"index": parts[0].strip(), "char": parts[1].strip()})
+
+# ------------------ instant @ action ------------------
+@_action_parser("@")
+def _parse_instant(sub: str, offset: int) -> Optional[Action]:
+    return Action("instant", offset, offset + len(sub), children={"body": parse_actions(*_piece(sub, offset, 1, len(sub)))})
+
+@_action_parser("if")
+def _parse_if(sub: str, offset: int) -> Optional[Action]:
+    end = offset + len(sub)
+    # ------------------ if(COND):<CONDITIONAL>UNCONDITIONAL ------------------
+    m = _IF_BLOCK.match(sub)
+    if m:
+        return Action("if_block", offset, end, {"cond": m.group(1).strip()},
+                      {"then": parse_actions(*_piece(sub, offset, *m.span(2))), "else": parse_actions(*_piece(sub, offset, *m.span(3)))})
+
+    # ------------------ if(COND)>ACT or if(COND)>>ACTS ------------------
+    m = _IF_THEN.match(sub)
+    if m:
+        body, col = _piece(sub, offset, *m.span(3))
+        if m.group(2) == ">":
+            first = _ACTION_SEPARATOR.search(body)
+            body, col = _piece(body, col, 0, first.start() if first else len(body))
+        return Action("if_then", offset, end, {"cond": m.group(1).strip()}, {"body": parse_actions(body, col)})
+    return None
 
-    if not isinstance(line, str):
+# ------------------ once:ACT ------------------
+@_action_parser("once")
+def _parse_once(sub: str, offset: int) -> Optional[Action]:
+    m = _ONCE.match(sub)
+    if not m:
         return None
+    sep = m.group(1) or ">" # default to single
+    body, col = _piece(sub, offset, *m.span(2))
+    # the unstripped action text is the once-memory key
+    return Action("once", offset, offset + len(sub), {"key": m.group(2)}, {"body": parse_separated(body, sep, col)})
+
+# ------------------ chance(CHANCE)>ACT(>ELSE) ------------------
+@_action_parser("chance")
+def _parse_chance(sub: str, offset: int) -> Optional[Action]:
+    m = _CHANCE.match(sub)
+    if not m:
+        return None
+    children = {"hit": parse_actions(*_piece(sub, offset, *m.span(2)))}
+    if m.group(3):
+        children["miss"] = parse_actions(*_piece(sub, offset, *m.span(3)))
+    return Action("chance", offset, offset + len(sub), {"chance": m.group(1).strip()}, children)
+
+# ------------------ repeat ------------------
+@_action_parser("repeat")
+def _parse_repeat(sub: str, offset: int) -> Optional[Action]:
+    m = _REPEAT.match(sub)
+    if not m:
+        return None
+    body, col = _piece(sub, offset, *m.span(3))
+    return Action("repeat", offset, offset + len(sub), {"times": m.group(1).strip()}, {"body": parse_separated(body, m.group(2), col)})
 
+# ------------------ weighted(VAR: item=weight, ...) ------------------
+@_action_parser("weighted")
+def _parse_weighted(sub: str, offset: int) -> Optional[Action]:
+    if not (sub.startswith("weighted(") and sub.endswith(")")):
+        return None
+    payload = sub[9:-1].strip()
+    if ":" not in payload:
+        return _invalid(sub, offset, "weighted needs VAR: item=weight, ...")
+    varname, items = payload.split(":", 1)
+    pairs = []
+    for pair in items.split(","):
+        if "=" in pair:
+            item, weight = pair.split("=", 1)
+            pairs.append((item.strip(), weight.strip()))
+    if not pairs:
+        return _invalid(sub, offset, "weighted needs VAR: item=weight, ...")
+    return Action("weighted", offset, offset + len(sub), {"var": varname.strip(), "pairs": pairs})
+
+# ------------------ clamp(VAR:MIN,MAX) ------------------
+@_action_parser("clamp")
+def _parse_clamp(sub: str, offset: int) -> Optional[Action]:
+    m = _CLAMP.match(sub)
+    if not m:
+        return None
+    var_name, min_expr, max_expr = (g.strip() for g in m.groups())
+    return Action("clamp", offset, offset + len(sub), {"var": var_name, "min": min_expr, "max": max_expr})
+
+# ------------------ consume(ITEM:ACT) ------------------
+@_action_parser("consume")
+def _parse_consume(sub: str, offset: int) -> Optional[Action]:
+    m = _CONSUME.match(sub)
+    if not m:
+        return None
+    return Action("consume", offset, offset + len(sub), {"item": m.group(1).strip()}, {"body": parse_actions(*_piece(sub, offset, *m.span(2)))})
+
+@_action_parser("clearinv")
+def _parse_clearinv(sub: str, offset: int) -> Optional[Action]:
+    return Action("clearinv", offset, offset + len(sub)) if sub == "clearinv" else None
+
+# add_item/remove_item
+@_action_parser("add_item")
+def _parse_add_item(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("add_item:"):
+        return None
+    item_name = sub.split(":", 1)[1].strip()
+    if not item_name:
+        return _invalid(sub, offset, "add_item needs an item name")
+    return Action("add_item", offset, offset + len(sub), {"item": item_name})
+
+@_action_parser("remove_item")
+def _parse_remove_item(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("remove_item:"):
+        return None
+    return Action("remove_item", offset, offset + len(sub), {"item": sub.split(":", 1)[1].strip()})
+
+# goto:target
+@_action_parser("goto")
+def _parse_goto(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("goto:"):
+        return None
+    return Action("goto", offset, offset + len(sub), {"target": sub.split(":", 1)[1].strip()})
+
+# randr(variable: min, max)
+@_action_parser("randr")
+def _parse_randr(sub: str, offset: int) -> Optional[Action]:
+    if not (sub.startswith("randr(") and sub.endswith(")")):
+        return None
+    payload = sub[6:-1].strip()
+    if ":" not in payload or "," not in payload:
+        return _invalid(sub, offset, "randr needs VAR: MIN, MAX")
+    varname, range_vals = payload.split(":", 1)
+    try:
+        min_val, max_val = [float(v.strip()) for v in range_vals.split(",", 1)]
+    except Exception:
+        return _invalid(sub, offset, "randr's MIN and MAX must be numbers")
+    return Action("randr", offset, offset + len(sub), {"var": varname.strip(), "min": min_val, "max": max_val})
+
+# rands(variable: item1, item2, ...)
+@_action_parser("rands")
+def _parse_rands(sub: str, offset: int) -> Optional[Action]:
+    if not (sub.startswith("rands(") and sub.endswith(")")):
+        return None
+    payload = sub[6:-1].strip()
+    if ":" not in payload:
+        return _invalid(sub, offset, "rands needs VAR: item1, item2, ...")
+    varname, items = payload.split(":", 1)
+    choices = [i.strip() for i in re.split(r'[,/]', items) if i.strip()]
+    if not choices:
+        return _invalid(sub, offset, "rands needs VAR: item1, item2, ...")
+    return Action("rands", offset, offset + len(sub), {"var": varname.strip(), "choices": choices})
+
+# set:variable=value (legacy)
+@_action_parser("set")
+def _parse_set(sub: str, offset: int) -> Optional[Action]:
+    if not sub.startswith("set:"):
+        return None
+    payload = sub.split(":", 1)[1]
+    if "=" not in payload:
+        return _invalid(sub, offset, "set needs VAR=VALUE")
+    name, raw = payload.split("=", 1)
+    return Action("set", offset, offset + len(sub), {"name": name.strip(), "raw": raw.strip()})
+
+def _parse_assignment(sub: str, offset: int) -> Action: # anything no keyword claimed: an assignment, or not an action at all
+    # ------------------ assignment without var: (X=5, Y+=2, etc) ------------------
+    m = _ASSIGN.match(sub)
+    if m:
+        return Action("assign", offset, offset + len(sub), {"name": m.group(1), "op": m.group(2), "rhs": m.group(3)})
+
+    # fallback: generic name=val
+    if "=" in sub:
+        name, val_expr = sub.split("=", 1)
+        return Action("assign_any", offset, offset + len(sub), {"name": name.strip(), "expr": val_expr.strip()})
+
+    return _invalid(sub, offset, "unknown action")
+
+def _keyword_arg_parser(keyword: str) -> Callable[[str, int], Optional[Action]]: # parser for register_action's default "keyword:ARG" / "keyword(ARG)" form
+    def parse(sub: str, offset: int) -> Optional[Action]:
+        rest = sub[len(keyword):]
+        if not rest:
+            arg = ""
+        elif rest[0] == ":":
+            arg = rest[1:]
+        elif rest[0] == "(" and rest.endswith(")"):
+            arg = rest[1:-1]
+        else:
+            return None
+        return Action(keyword, offset, offset + len(sub), {"arg": arg.strip()})
+    return parse
+
+def action_errors(actions: List[Action]) -> List[Tuple[int, int, str]]: # (start, end, message) of every invalid action, nested ones included
+    errors = []
+    for action in actions:
+        if action.kind == "invalid":
+            errors.append((action.start, action.end, action.args["error"]))
+        for nested in action.children.values():
+            errors.extend(action_errors(nested))
+    return errors
+
+def parse_option_syntax(line: str) -> OptionSyntax: # tokenizes and parses one options line
+    tokens, unbalanced = tokenize_line(line)
+    errors: List[Tuple[int, int, str]] = []
     raw = line.strip()
     if not raw or raw.startswith("#"):
-        return None
-    
+        return OptionSyntax("comment" if raw else "blank", tokens, None, [], [])
+    lead = len(line) - len(line.lstrip())
+
     # @timer
-    timer_match = re.match(r"@timer\((\d+(?:\.\d+)?)\):(>>?|:)(.+)", raw)
+    timer_match = _TIMER_LINE.match(raw)
     if timer_match:
         seconds, sep, acts = timer_match.groups()
-        return {
+        kind = "timer"
+        option = {
             "instant": True,
             "timer": float(seconds),
             "actions": [acts.strip()],
             "separator": sep
         }
+        body, col = _piece(raw, lead, *timer_match.span(3))
+        actions = parse_separated(body, sep, col)
+
+    # instant leaf (starts with @); its actions run with the default '>' separator
+    elif raw.startswith("@"):
+        kind = "instant"
+        body, col = _piece(raw, lead, 1, len(raw))
+        option = {"instant": True, "actions": [body]}
+        actions = parse_separated(body, ">", col)
+        if raw.startswith("@timer"): # runs, but as an instant leaf rather than a timer
+            errors.append((lead, lead + len(raw), "malformed timer (expected @timer(SECONDS):>ACTIONS)"))
+
+    else:
+        kind = "leaf"
+        bounds = [-1] + [i for i, char in enumerate(raw) if char == "|"] + [len(raw)]
+        fields = [_piece(raw, lead, bounds[k] + 1, bounds[k + 1]) for k in range(len(bounds) - 1)]
+        while len(fields) < 4:
+            fields.append(("", lead + len(raw)))
+        (text, _), (nxt, _), (cond, _), (acts, acts_col) = fields[:4]
+
+        # the actions field is split on '&'/';', and each piece runs as its own action string
+        action_strings = []
+        actions = []
+        for m in _ACTION_PIECES.finditer(acts):
+            sub, col = _piece(acts, acts_col, m.start(), m.end())
+            if sub:
+                action_strings.append(sub)
+                actions.extend(parse_actions(sub, col))
+        option = {
+            "text": text,
+            "next": nxt if nxt else None,
+            "condition": cond if cond else None,
+            "actions": action_strings,
+            "instant": False
+        }
 
-    # instant leaf (starts with @)
-    if raw.startswith("@"):
-        return {"instant": True, "actions": [raw[1:].strip()]}
+    if line.count('|') > 3: # anything past the fourth field is dropped
+        errors = [(0, len(line), "too many '|' separators (a leaf is TEXT | NEXT | CONDITION | ACTIONS)")]
+    else:
+        errors += [(start, end, "unbalanced bracket") for start, end in unbalanced] + action_errors(actions)
+    return OptionSyntax(kind, tokens, option, actions, errors)
 
-    parts = [p.strip() for p in raw.split("|")]
-    while len(parts) < 4:
-        parts.append("")
-        
-    text, nxt, cond, acts = parts[0], parts[1], parts[2], parts[3]
-    
-    # Correctly split the actions string by semicolons
-    actions = [a.strip() for a in re.split(r'[&;]', acts) if a.strip()]
-    
-    cond = cond if cond else None
-    nxt = nxt if nxt else None
-    
-    return {
-        "text": text,
-        "next": nxt,
-        "condition": cond,
-        "actions": actions,
-        "instant": False
-    }
+def parse_option_line(line: Union[str, Dict]) -> Optional[Dict]:
+    if isinstance(line, dict):
+        return line
+
+    if not isinstance(line, str):
+        return None
+    return parse_option_syntax(line).option
 
 def format_option_line(opt: Dict) -> str:
     if opt.get("instant"):
@@ -176,28 +581,30 @@ def format_option_line(opt: Dict) -> str:
     nxt = "" if opt.get("next") is None else str(opt.get("next"))
     return f"{opt.get('text','')} | {nxt} | {cond} | {acts}"
 
-def evaluate_condition(cond: Optional[str], current_node: Dict) -> bool:
+def evaluate_condition(cond: Optional[str], current_node: Dict, state=None) -> bool:
     if not cond:
         return True
+    if state is None:
+        state = EDITOR_STATE
     parts = [p.strip() for p in re.split(r'[&;]', cond) if p.strip()]
     for part in parts:
         is_negated = part.startswith("!")
         if is_negated:
             sub_cond = part[1:].strip()
             # Recursively evaluate the sub-condition and invert the result
-            if evaluate_condition(sub_cond, current_node):
+            if evaluate_condition(sub_cond, current_node, state):
                 return False  # The sub-condition is true, so the negated condition is false
             else:
                 continue # The sub-condition is false, so the negated condition is true        
         try:
             if part.startswith("has_item:"):
                 name = part.split(":", 1)[1].strip()
-                if name not in inventory:
+                if name not in state.inventory:
                     return False
                 continue
             if part.startswith("not_has_item:"):
                 name = part.split(":", 1)[1].strip()
-                if name in inventory:
+                if name in state.inventory:
                     return False
                 continue
             elif part.startswith("hlet:"):
@@ -214,7 +621,7 @@ def evaluate_condition(cond: Optional[str], current_node: Dict) -> bool:
                     return False            
             expr = part[4:].strip() if part.startswith("var:") else part
             try:
-                res = safe_eval_expr(expr, vars_store)
+                res = safe_eval_expr(expr, state.vars)
             except Exception:
                 return False
             if isinstance(res, bool):
@@ -227,288 +634,338 @@ def evaluate_condition(cond: Optional[str], current_node: Dict) -> bool:
             return False
     return True
 
-def execute_actions(actions: List[str], current_node: Dict):
-    for act in actions:
-        if not act:
-            continue
-        if act.strip().startswith('if('):
-            subs = [act.strip()]
-        else:
-            subs = [s.strip() for s in re.split(r'[&;]', act) if s.strip()]
-        for sub in subs:
-            try:
-                # rename_item:OLD,NEW
-                if sub.startswith("rename_item:"):
-                    try:
-                        parts = sub.split(":", 1)[1].strip().split(",", 1)
-                        if len(parts) == 2:
-                            old_name = parts[0].strip()
-                            new_name = parts[1].strip()
-                            if old_name in inventory:
-                                # Remove the old item
-                                inventory.remove(old_name)
-                                # Add the new item
-                                inventory.append(new_name)
-                    except (ValueError, IndexError):
-                        # Handle cases where the format is incorrect
-                        pass
-                    continue                    
-                # ------------------ rlet:index:new_char ------------------
-                if sub.startswith("rlet:"):
-                    parts = sub[5:].split(":", 1)
-                    if len(parts) == 2:
-                        index = parts[0].strip()
-                        index = safe_eval_expr(index, vars_store) - 1
-                        new_char = parts[1].strip()
-                        current_header = current_node.get('header', '')
-                        if 0 <= index < len(current_header):
-                            new_header = current_header[:index] + new_char + current_header[index+1:]
-                            current_node['header'] = new_header
-                
-                # ------------------ instant @ action ------------------
-                if sub.startswith("@"):
-                    instant_act = sub[1:].strip()
-                    execute_actions([instant_act], current_node)
-                    continue
-
-                # ------------------ if(COND):<CONDITIONAL>UNCONDITIONAL ------------------
-                m_new_if = re.match(r"^if\((.+?)\):?<(.+?)>(.*)$", sub)
-                if m_new_if:
-                    cond_expr, conditional_expr, unconditional_expr = m_new_if.groups()
-                    if evaluate_condition(cond_expr.strip(), current_node):
-                        execute_actions([conditional_expr.strip()], current_node)
-                    if unconditional_expr.strip():
-                        execute_actions([unconditional_expr.strip()], current_node)
-                    continue
+# Action strings are compiled once into closures and cached by their text, so picking an option
+# or firing a timer no longer re-runs the whole regex cascade below on every execution.
+_ACTION_CACHE: Dict[Any, Callable[[Dict, Any], None]] = {} # compiled actions, keyed by action text
+_ACTION_CACHE_MAX = 4096 # the cache is simply flushed when it grows past this
 
-                # ------------------ if(COND)>ACT or if(COND)>>ACTS ------------------
-                m_if = re.match(r"^if\((.+?)\)(>>?)(.+)$", sub)
-                if m_if:
-                    cond_expr = m_if.group(1).strip()
-                    separator = m_if.group(2)
-                    act_expr = m_if.group(3).strip()
-                    if separator == '>':
-                        first_act = re.split(r'[&;]', act_expr, 1)[0].strip()
-                        if evaluate_condition(cond_expr, current_node):
-                            execute_actions([first_act], current_node)
-                    else:
-                        if evaluate_condition(cond_expr, current_node):
-                            execute_actions([act_expr], current_node)
-                    continue
+def _noop_action(current_node: Dict, state):
+    pass
 
-                # ------------------ once:ACT ------------------
-                m_once = re.match(r"^once:(>>?|:)?(.+)$", sub)
-                if m_once:
-                    sep, act_expr = m_once.groups()
-                    sep = sep or ">"  # default to single
-                    if "__once_memory" not in vars_store:
-                        vars_store["__once_memory"] = set()
-                    once_mem = vars_store["__once_memory"]
-
-                    # Use act_expr itself as the memory key
-                    if act_expr not in once_mem:
-                        once_mem.add(act_expr)
-                        handle_action_with_separators(act_expr.strip(), sep, current_node)
-                    continue
+def _cached_compile(key, factory) -> Callable[[Dict, Any], None]: # looks up (or builds) a compiled action
+    fn = _ACTION_CACHE.get(key)
+    if fn is None:
+        if len(_ACTION_CACHE) >= _ACTION_CACHE_MAX:
+            _ACTION_CACHE.clear()
+        fn = factory()
+        _ACTION_CACHE[key] = fn
+    return fn
 
-                # ------------------ chance(CHANCE)>ACT(>ELSE) ------------------
-                m_chance = re.match(r"^chance\((.+)\)>(.+?)(?:>(.+))?$", sub)
-                if m_chance:
-                    chance_expr, act_expr, else_expr = (
-                        m_chance.group(1).strip(),
-                        m_chance.group(2).strip(),
-                        m_chance.group(3).strip() if m_chance.group(3) else None
-                    )
-                    try:
-                        chance_val = float(safe_eval_expr(chance_expr, vars_store))
-                    except Exception:
-                        chance_val = float(chance_expr) if chance_expr.replace('.','',1).isdigit() else 0
-                    roll = random.uniform(0, 100)
-                    if roll <= chance_val:
-                        execute_actions([act_expr], current_node)
-                    elif else_expr:
-                        execute_actions([else_expr], current_node)
-                    continue
-
-                # ------------------ repeat ------------------
-                m_repeat = re.match(r"^repeat:(.+?)(>>?|:)(.+)$", sub)
-                if m_repeat:
-                    times_expr, sep, act_expr = m_repeat.groups()
-                    try:
-                        times = int(safe_eval_expr(times_expr.strip(), vars_store))
-                    except Exception:
-                        try:
-                            times = int(times_expr.strip())
-                        except:
-                            times = 0
+def compile_action(act: str) -> Callable[[Dict, Any], None]: # compiles one action string (may hold several '&'/';' separated actions)
+    return _cached_compile(act, lambda: _compile_action(act))
 
-                    for _ in range(max(0, times)):
-                        handle_action_with_separators(act_expr.strip(), sep, current_node)
-                    continue
-
-                # ------------------ weighted(VAR: item=weight, ...) ------------------
-                if sub.startswith("weighted(") and sub.endswith(")"):
-                    payload = sub[9:-1].strip()
-                    if ":" in payload:
-                        varname, items = payload.split(":", 1)
-                        varname = varname.strip()
-                        choices, weights = [], []
-                        for pair in items.split(","):
-                            if "=" in pair:
-                                item, weight = pair.split("=", 1)
-                                item, weight = item.strip(), weight.strip()
-                                try:
-                                    w = float(safe_eval_expr(weight, vars_store))
-                                except Exception:
-                                    try: w = float(weight)
-                                    except: w = 1.0
-                                choices.append(item)
-                                weights.append(w)
-                        if choices and weights:
-                            vars_store[varname] = random.choices(choices, weights=weights, k=1)[0]
-                    continue
+def compile_separated_action(expr: str, sep: str) -> Callable[[Dict, Any], None]: # compiled form of handle_action_with_separators
+    return _cached_compile((sep, expr), lambda: _compile_separated_action(expr, sep))
 
-                # ------------------ clamp(VAR:MIN,MAX) ------------------
-                m_clamp = re.match(r"^clamp\((.+?):(.+?),(.+?)\)$", sub)
-                if m_clamp:
-                    var_name, min_expr, max_expr = m_clamp.groups()
-                    var_name = var_name.strip()
-                    try:
-                        min_val = float(safe_eval_expr(min_expr.strip(), vars_store))
-                        max_val = float(safe_eval_expr(max_expr.strip(), vars_store))
-                        current_val = vars_store.get(var_name)
-                        if current_val is not None:
-                            try:
-                                current_val_num = float(current_val)
-                                clamped_val = max(min_val, min(current_val_num, max_val))
-                                if isinstance(current_val, int):
-                                    vars_store[var_name] = int(clamped_val)
-                                else:
-                                    vars_store[var_name] = clamped_val
-                            except (ValueError, TypeError):
-                                pass
-                    except Exception:
-                        pass
-                    continue
-                m_consume = re.match(r"^consume\((.+?):(.+)\)$", sub)
-                if m_consume:
-                    item_name, action_expr = m_consume.groups()
-                    item_name = item_name.strip()
-                    action_expr = action_expr.strip()
-                    if item_name in inventory:
-                        inventory.remove(item_name)
-                        execute_actions([action_expr], current_node)
-                    continue
-                if sub == "clearinv":
-                    inventory.clear()
-                    continue
-
-                # ------------------ assignment without var: (X=5, Y+=2, etc) ------------------
-                m_var = re.match(r"^([A-Za-z_][A-Za-z0-9_]*)\s*([\+\-\*/]?=)\s*(.+)$", sub)
-                if m_var:
-                    name, op, rhs = m_var.group(1), m_var.group(2), m_var.group(3)
-                    try:
-                        rhs_val = safe_eval_expr(rhs, vars_store)
-                    except Exception:
-                        rhs_val = rhs.strip('"').strip("'")
-                        try: rhs_val = int(rhs_val)
-                        except:
-                            try: rhs_val = float(rhs_val)
-                            except: pass
-                    cur = vars_store.get(name, 0)
-                    if op == "=":
-                        vars_store[name] = rhs_val
-                    elif op == "+=":
-                        try: vars_store[name] = (cur or 0) + rhs_val
-                        except: vars_store[name] = rhs_val
-                    elif op == "-=":
-                        try: vars_store[name] = (cur or 0) - rhs_val
-                        except: vars_store[name] = cur
-                    elif op == "*=":
-                        try: vars_store[name] = (cur or 0) * rhs_val
-                        except: vars_store[name] = cur
-                    elif op == "/=":
-                        try: vars_store[name] = (cur or 0) / rhs_val
-                        except: vars_store[name] = cur
-                    continue
+def execute_actions(actions: List[str], current_node: Dict, state=None):
+    if state is None:
+        state = EDITOR_STATE
+    for act in actions:
+        if not act:
+            continue
+        compile_action(act)(current_node, state)
 
-                # add_item/remove_item
-                if sub.startswith("add_item:"):
-                    name = sub.split(":",1)[1].strip()
-                    if name and name not in inventory:
-                        inventory.append(name)
-                    continue
+def _compile_action(act: str) -> Callable[[Dict, Any], None]:
+    return _build_actions(parse_actions(act))
 
-                if sub.startswith("remove_item:"):
-                    name = sub.split(":",1)[1].strip()
-                    if name in inventory:
-                        inventory.remove(name)
-                    continue
+def _build_actions(actions: List[Action]) -> Callable[[Dict, Any], None]: # one closure running parsed actions in order; a failing one is skipped
+    steps = [_build_action(action) for action in actions]
+    steps = [step for step in steps if step is not _noop_action]
+    if not steps:
+        return _noop_action
 
-                # goto:target
-                if sub.startswith("goto:"):
-                    vars_store["__goto"] = sub.split(":",1)[1].strip()
-                    continue
+    def run(current_node: Dict, state):
+        for step in steps:
+            try:
+                step(current_node, state)
+            except Exception:
+                continue
+    return run
+
+def _build_action(action: Action) -> Callable[[Dict, Any], None]: # turns a parsed action into a closure via its kind's builder
+    build = ACTION_BUILDERS.get(action.kind)
+    return build(action) if build is not None else _noop_action
+
+def _action_builder(*kinds: str): # registers a built-in closure factory for Action kinds
+    def register(build):
+        for kind in kinds:
+            ACTION_BUILDERS[kind] = build
+        return build
+    return register
+
+@_action_builder("rename_item")
+def _build_rename_item(action: Action) -> Callable[[Dict, Any], None]:
+    old_name, new_name = action.args["old"], action.args["new"]
+
+    def rename_item(current_node, state):
+        if old_name in state.inventory:
+            # Remove the old item, then add the new one
+            state.inventory.remove(old_name)
+            state.inventory.append(new_name)
+    return rename_item
+
+@_action_builder("rlet")
+def _build_rlet(action: Action) -> Callable[[Dict, Any], None]:
+    index_expr, new_char = action.args["index"], action.args["char"]
+
+    def rlet(current_node, state):
+        index = safe_eval_expr(index_expr, state.vars) - 1
+        current_header = current_node.get('header', '')
+        if 0 <= index < len(current_header):
+            current_node['header'] = current_header[:index] + new_char + current_header[index+1:]
+    return rlet
+
+@_action_builder("instant")
+def _build_instant(action: Action) -> Callable[[Dict, Any], None]:
+    return _build_actions(action.children["body"])
+
+@_action_builder("if_block", "guarded")
+def _build_if_block(action: Action) -> Callable[[Dict, Any], None]:
+    cond_expr = action.args["cond"]
+    conditional = _build_actions(action.children["then"])
+    unconditional = _build_actions(action.children["else"])
+
+    def if_block(current_node, state):
+        if evaluate_condition(cond_expr, current_node, state):
+            conditional(current_node, state)
+        unconditional(current_node, state)
+    return if_block
+
+@_action_builder("if_then")
+def _build_if_then(action: Action) -> Callable[[Dict, Any], None]:
+    cond_expr = action.args["cond"]
+    body = _build_actions(action.children["body"])
+
+    def if_then(current_node, state):
+        if evaluate_condition(cond_expr, current_node, state):
+            body(current_node, state)
+    return if_then
+
+@_action_builder("once")
+def _build_once(action: Action) -> Callable[[Dict, Any], None]:
+    act_expr = action.args["key"]
+    body = _build_actions(action.children["body"])
+
+    def once(current_node, state):
+        if "__once_memory" not in state.vars:
+            state.vars["__once_memory"] = set()
+        once_mem = state.vars["__once_memory"]
+
+        # Use act_expr itself as the memory key
+        if act_expr not in once_mem:
+            once_mem.add(act_expr)
+            body(current_node, state)
+    return once
+
+@_action_builder("chance")
+def _build_chance(action: Action) -> Callable[[Dict, Any], None]:
+    chance_expr = action.args["chance"]
+    on_hit = _build_actions(action.children["hit"])
+    on_miss = _build_actions(action.children["miss"]) if "miss" in action.children else None
+
+    def chance(current_node, state):
+        try:
+            chance_val = float(safe_eval_expr(chance_expr, state.vars))
+        except Exception:
+            chance_val = float(chance_expr) if chance_expr.replace('.','',1).isdigit() else 0
+        roll = state.rng.uniform(0, 100)
+        if roll <= chance_val:
+            on_hit(current_node, state)
+        elif on_miss:
+            on_miss(current_node, state)
+    return chance
+
+@_action_builder("repeat")
+def _build_repeat(action: Action) -> Callable[[Dict, Any], None]:
+    times_expr = action.args["times"]
+    body = _build_actions(action.children["body"])
+
+    def repeat(current_node, state):
+        try:
+            times = int(safe_eval_expr(times_expr, state.vars))
+        except Exception:
+            try:
+                times = int(times_expr)
+            except:
+                times = 0
 
-                # randr(variable: min, max)
-                if sub.startswith("randr(") and sub.endswith(")"):
-                    payload = sub[6:-1].strip()
-                    if ":" in payload and "," in payload:
-                        varname, range_vals = payload.split(":", 1)
-                        varname = varname.strip()
-                        try:
-                            min_val, max_val = [float(v.strip()) for v in range_vals.split(",", 1)]
-                            vars_store[varname] = random.uniform(min_val, max_val)
-                        except Exception:
-                            continue
-                    continue
+        for _ in range(max(0, times)):
+            body(current_node, state)
+    return repeat
 
-                # rands(variable: item1, item2, ...)
-                if sub.startswith("rands(") and sub.endswith(")"):
-                    payload = sub[6:-1].strip()
-                    if ":" in payload:
-                        varname, items = payload.split(":", 1)
-                        varname = varname.strip()
-                        choices = [i.strip() for i in re.split(r'[,/]', items) if i.strip()]
-                        if choices:
-                            vars_store[varname] = random.choice(choices)
-                    continue
+@_action_builder("weighted")
+def _build_weighted(action: Action) -> Callable[[Dict, Any], None]:
+    varname, pairs = action.args["var"], action.args["pairs"]
+    choices = [item for item, _ in pairs]
 
-                # set:variable=value (legacy)
-                if sub.startswith("set:"):
-                    payload = sub.split(":", 1)[1]
-                    if "=" not in payload:
-                        continue
-                    name, raw = payload.split("=", 1)
-                    name, raw = name.strip(), raw.strip()
-                    try:
-                        val = safe_eval_expr(raw, vars_store)
-                    except Exception:
-                        if raw.lower() == "true":
-                            val = True
-                        elif raw.lower() == "false":
-                            val = False
-                        else:
-                            try: val = int(raw)
-                            except:
-                                try: val = float(raw)
-                                except: val = raw.strip('"').strip("'")
-                    vars_store[name] = val
-                    continue
+    def weighted(current_node, state):
+        weights = []
+        for _, weight in pairs:
+            try:
+                w = float(safe_eval_expr(weight, state.vars))
+            except Exception:
+                try: w = float(weight)
+                except: w = 1.0
+            weights.append(w)
+        state.vars[varname] = state.rng.choices(choices, weights=weights, k=1)[0]
+    return weighted
+
+@_action_builder("clamp")
+def _build_clamp(action: Action) -> Callable[[Dict, Any], None]:
+    var_name, min_expr, max_expr = action.args["var"], action.args["min"], action.args["max"]
+
+    def clamp(current_node, state):
+        min_val = float(safe_eval_expr(min_expr, state.vars))
+        max_val = float(safe_eval_expr(max_expr, state.vars))
+        current_val = state.vars.get(var_name)
+        if current_val is not None:
+            try:
+                current_val_num = float(current_val)
+                clamped_val = max(min_val, min(current_val_num, max_val))
+                if isinstance(current_val, int):
+                    state.vars[var_name] = int(clamped_val)
+                else:
+                    state.vars[var_name] = clamped_val
+            except (ValueError, TypeError):
+                pass
+    return clamp
+
+@_action_builder("consume")
+def _build_consume(action: Action) -> Callable[[Dict, Any], None]:
+    item_name = action.args["item"]
+    body = _build_actions(action.children["body"])
+
+    def consume(current_node, state):
+        if item_name in state.inventory:
+            state.inventory.remove(item_name)
+            body(current_node, state)
+    return consume
+
+@_action_builder("clearinv")
+def _build_clearinv(action: Action) -> Callable[[Dict, Any], None]:
+    return lambda current_node, state: state.inventory.clear()
+
+@_action_builder("assign")
+def _build_assign(action: Action) -> Callable[[Dict, Any], None]:
+    name, op, rhs = action.args["name"], action.args["op"], action.args["rhs"]
+    literal = rhs.strip('"').strip("'")
+    try: literal = int(literal)
+    except:
+        try: literal = float(literal)
+        except: pass
+
+    def assign(current_node, state):
+        try:
+            rhs_val = safe_eval_expr(rhs, state.vars)
+        except Exception:
+            rhs_val = literal
+        cur = state.vars.get(name, 0)
+        if op == "=":
+            state.vars[name] = rhs_val
+        elif op == "+=":
+            try: state.vars[name] = (cur or 0) + rhs_val
+            except: state.vars[name] = rhs_val
+        elif op == "-=":
+            try: state.vars[name] = (cur or 0) - rhs_val
+            except: state.vars[name] = cur
+        elif op == "*=":
+            try: state.vars[name] = (cur or 0) * rhs_val
+            except: state.vars[name] = cur
+        elif op == "/=":
+            try: state.vars[name] = (cur or 0) / rhs_val
+            except: state.vars[name] = cur
+    return assign
+
+@_action_builder("add_item")
+def _build_add_item(action: Action) -> Callable[[Dict, Any], None]:
+    item_name = action.args["item"]
+
+    def add_item(current_node, state):
+        if item_name not in state.inventory:
+            state.inventory.append(item_name)
+    return add_item
+
+@_action_builder("remove_item")
+def _build_remove_item(action: Action) -> Callable[[Dict, Any], None]:
+    item_name = action.args["item"]
+
+    def remove_item(current_node, state):
+        if item_name in state.inventory:
+            state.inventory.remove(item_name)
+    return remove_item
+
+@_action_builder("goto")
+def _build_goto(action: Action) -> Callable[[Dict, Any], None]:
+    target = action.args["target"]
+
+    def goto(current_node, state):
+        state.vars["__goto"] = target
+    return goto
+
+@_action_builder("randr")
+def _build_randr(action: Action) -> Callable[[Dict, Any], None]:
+    varname, min_val, max_val = action.args["var"], action.args["min"], action.args["max"]
+
+    def randr(current_node, state):
+        state.vars[varname] = state.rng.uniform(min_val, max_val)
+    return randr
+
+@_action_builder("rands")
+def _build_rands(action: Action) -> Callable[[Dict, Any], None]:
+    varname, choices = action.args["var"], action.args["choices"]
+
+    def rands(current_node, state):
+        state.vars[varname] = state.rng.choice(choices)
+    return rands
+
+@_action_builder("set")
+def _build_set(action: Action) -> Callable[[Dict, Any], None]:
+    name, raw = action.args["name"], action.args["raw"]
+    if raw.lower() == "true":
+        literal = True
+    elif raw.lower() == "false":
+        literal = False
+    else:
+        try: literal = int(raw)
+        except:
+            try: literal = float(raw)
+            except: literal = raw.strip('"').strip("'")
+
+    def set_var(current_node, state):
+        try:
+            val = safe_eval_expr(raw, state.vars)
+        except Exception:
+            val = literal
+        state.vars[name] = val
+    return set_var
 
-                # fallback: generic name=val
-                if "=" in sub:
-                    name, val_expr = sub.split("=",1)
-                    name, val_expr = name.strip(), val_expr.strip()
-                    try:
-                        vars_store[name] = safe_eval_expr(val_expr, vars_store)
-                    except Exception:
-                        vars_store[name] = val_expr
+@_action_builder("assign_any")
+def _build_assign_any(action: Action) -> Callable[[Dict, Any], None]:
+    name, val_expr = action.args["name"], action.args["expr"]
 
-            except Exception as e:
-                continue
-            
-def resolve_next(next_ref: Union[int, str]) -> Optional[int]: # resolve the next node for options
+    def assign_any(current_node, state):
+        try:
+            state.vars[name] = safe_eval_expr(val_expr, state.vars)
+        except Exception:
+            state.vars[name] = val_expr
+    return assign_any
+
+def register_action(keyword: str, build: Callable[[Action], Callable[[Dict, Any], None]],
+                    parse: Optional[Callable[[str, int], Optional[Action]]] = None):
+    # adds (or replaces) an action that starts with `keyword`; it is dispatched with one dict lookup like the built-ins.
+    # parse(sub, offset) returns an Action, or None to leave the text to the assignment forms; by default
+    # "keyword:ARG", "keyword(ARG)" and a bare "keyword" give Action(keyword, args={"arg": ARG}).
+    # build(action) returns the closure(current_node, state) run for Actions of kind `keyword`
+    global ACTION_REGISTRY_VERSION
+    ACTION_PARSERS[keyword] = parse or _keyword_arg_parser(keyword)
+    ACTION_BUILDERS[keyword] = build
+    DSL_KEYWORDS.add(keyword)
+    _ACTION_CACHE.clear() # actions compiled before now may have meant something else
+    ACTION_REGISTRY_VERSION += 1
+
+def resolve_next(next_ref: Union[int, str], state=None) -> Optional[int]: # resolve the next node for options
+    if state is None:
+        state = EDITOR_STATE
     if isinstance(next_ref, int):
         return next_ref
     if isinstance(next_ref, str):
@@ -523,110 +980,1697 @@ def resolve_next(next_ref: Union[int, str]) -> Optional[int]: # resolve the next
                 try:
                     resolved.append(int(c))
                 except Exception:
-                    val = vars_store.get(c)
+                    val = state.vars.get(c)
                     try:
                         resolved.append(int(val))
                     except Exception:
                         try:
                             # try evaluating expression
-                            ev = safe_eval_expr(c, vars_store)
+                            ev = safe_eval_expr(c, state.vars)
                             resolved.append(int(ev))
                         except Exception:
                             continue
             if not resolved:
                 return None
-            return random.choice(resolved)
+            return state.rng.choice(resolved)
         else:
             try:
                 return int(s)
             except Exception:
-                val = vars_store.get(s)
+                val = state.vars.get(s)
                 try:
                     return int(val)
                 except Exception:
                     try:
-                        ev = safe_eval_expr(s, vars_store)
+                        ev = safe_eval_expr(s, state.vars)
                         return int(ev)
                     except Exception:
                         return None
     return None
 
+def node_targets(data: Dict) -> Tuple[Dict[int, bool], List[Tuple[str, bool]], List[Dict]]:
+    # a node's leaves -> ({target id: random}, [(variable name, random)], leaves whose next names a variable)
+    targets: Dict[int, bool] = {}
+    var_targets = []
+    dynamic = []
+    for opt in data.get("options", []):
+        nxt_raw = opt.get("next")
+        if not nxt_raw:
+            continue
+        is_multi_choice = isinstance(nxt_raw, str) and "/" in nxt_raw
+        plain = True
+        for part in (nxt_raw.split("/") if is_multi_choice else [nxt_raw]):
+            try:
+                targets.setdefault(int(part), is_multi_choice)
+            except (TypeError, ValueError):
+                name = str(part).strip()
+                if name:
+                    var_targets.append((name, is_multi_choice))
+                    plain = False
+        if not plain:
+            dynamic.append(opt)
+    return targets, var_targets, dynamic
+
+class StoryGraph: # forward/reverse adjacency index over a nodes dict, kept up to date as nodes change
+    def __init__(self, story_nodes: Optional[Dict[int, Dict]] = None):
+        self.rebuild({} if story_nodes is None else story_nodes)
+
+    def rebuild(self, story_nodes: Dict[int, Dict]): # re-index everything (after load, undo, new story, ...)
+        self.nodes = story_nodes
+        self.forward: Dict[int, Dict[int, bool]] = {} # node -> {target: reached through a '/' random next}
+        self.reverse: Dict[int, set] = {} # target -> nodes with a leaf pointing at it
+        self.var_targets: Dict[int, List[Tuple[str, bool]]] = {} # node -> [(variable/expression next, random)]
+        self.dynamic: Dict[int, List[Dict]] = {} # node -> leaves whose next isn't only node ids (the only possible dead ends)
+        self.touched: Optional[set] = None # nodes edited since take_touched(); None means all of them
+        for nid in story_nodes:
+            self.update_node(nid)
+
+    def touch(self, nid: int): # records an edit that doesn't change the node's leaves (position, color, ...)
+        if self.touched is not None:
+            self.touched.add(nid)
+
+    def take_touched(self) -> Optional[set]: # nodes added, edited or deleted since the last call (None: everything, e.g. after a rebuild)
+        touched, self.touched = self.touched, set()
+        return touched
+
+    def update_node(self, nid: int): # re-index one node's leaves (after it was added, edited or deleted)
+        self.touch(nid)
+        for tgt in self.forward.pop(nid, ()):
+            sources = self.reverse.get(tgt)
+            if sources is not None:
+                sources.discard(nid)
+                if not sources:
+                    del self.reverse[tgt]
+        self.var_targets.pop(nid, None)
+        self.dynamic.pop(nid, None)
+
+        data = self.nodes.get(nid)
+        if data is None:
+            return
+        targets, var_targets, dynamic = node_targets(data)
+
+        self.forward[nid] = targets
+        for tgt in targets:
+            self.reverse.setdefault(tgt, set()).add(nid)
+        if var_targets:
+            self.var_targets[nid] = var_targets
+        if dynamic:
+            self.dynamic[nid] = dynamic
+
+    def remove_node(self, nid: int): # drops a deleted node's outgoing edges (edges pointing at it stay, they're dangling now)
+        self.update_node(nid)
+
+    def successors(self, nid: int) -> List[int]: # node ids this node's leaves point at
+        return list(self.forward.get(nid, ()))
+
+    def predecessors(self, nid: int) -> List[int]: # nodes with a leaf pointing at this node
+        return list(self.reverse.get(nid, ()))
+
+    def has_edge(self, src: int, tgt: int) -> bool:
+        return tgt in self.forward.get(src, ())
+
+    def edges(self, nid: int, variables: Optional[Dict[str, Any]] = None) -> Dict[int, bool]: # {target: random} including variable targets
+        targets = self.forward.get(nid, {})
+        if variables is None or nid not in self.var_targets:
+            return targets
+        targets = dict(targets)
+        for name, is_multi_choice in self.var_targets[nid]:
+            val = variables.get(name)
+            if val is not None:
+                try:
+                    targets.setdefault(int(val), is_multi_choice)
+                except (TypeError, ValueError):
+                    pass
+        return targets
+
+    def missing_targets(self) -> Dict[int, List[int]]: # node ids that are pointed at but don't exist -> who points at them
+        return {tgt: sorted(srcs) for tgt, srcs in self.reverse.items() if tgt not in self.nodes}
+
+story_graph = StoryGraph(nodes) # index for the editor's nodes; rebuild() it whenever 'nodes' is replaced or cleared
+
 def create_node(num: int, header: str = "", x: int = 50, y: int = 50, options: Optional[List[Dict]] = None, color: str = '#222222'): # self-explanatory: creates a node
     nodes[num] = {"header": header, "options": options or [], "x": x, "y": y, "color": color}
+    story_graph.update_node(num)
 
 def delete_node(num: int): # deletes node with node id of 'num' (int)
     if num in nodes:
         del nodes[num]
+        story_graph.remove_node(num)
+
+def rename_node(old_id: int, new_id: int) -> List[int]: # moves a node to a new id and repoints every leaf that referenced it; returns the nodes that changed
+    nodes[new_id] = nodes.pop(old_id)
+    story_graph.remove_node(old_id)
+    story_graph.update_node(new_id)
+
+    changed = []
+    for nid in story_graph.predecessors(old_id):
+        if repoint_leaves(nodes[nid], old_id, new_id):
+            story_graph.update_node(nid)
+            changed.append(nid)
+    return changed
+
+def repoint_leaves(data: Dict, old_id: int, new_id: int) -> bool: # makes a node's leaves that lead to old_id lead to new_id; True if any did
+    options_changed = False
+
+    # 1. Update the parsed options list
+    for opt in data.get("options", []):
+        next_val = opt.get("next")
+        if next_val is None: continue
+
+        if isinstance(next_val, str) and "/" in next_val:
+            parts = [p.strip() for p in next_val.split("/")]
+            if str(old_id) in parts:
+                new_parts = [str(new_id) if p == str(old_id) else p for p in parts]
+                opt["next"] = "/".join(new_parts)
+                options_changed = True
+        elif str(next_val) == str(old_id):
+            opt["next"] = str(new_id)
+            options_changed = True
+
+    # 2. If references were found, regenerate the raw_options string to match
+    if options_changed:
+        data["raw_options"] = "\n".join([format_option_line(opt) for opt in data["options"]])
+    return options_changed
     
 def list_nodes() -> List[int]: # lists nodes, pretty self-explanatory
     return sorted(nodes.keys())
 
-def find_dead_ends() -> List[Tuple[int, Dict]]: # finds dead ends in nodes
+def find_dead_ends() -> List[Tuple[int, Dict]]: # finds dead ends in nodes (only leaves with a variable/expression next can be one)
     bad = []
-    for nid, data in nodes.items():
-        for opt in data["options"]:
-            if opt.get("next") is None or opt.get("next") == "":
-                continue
+    for nid, opts in story_graph.dynamic.items():
+        for opt in opts:
             if resolve_next(opt.get("next")) is None:
                 bad.append((nid, opt))
     return bad
 
-def run_instant_leaves(node_id: int) -> int:
+def instant_leaves(node: Dict) -> Iterator[Tuple[Dict, str]]: # a node's instant leaves in order (timer leaves excluded), with their action separator
+    for opt_raw in node.get("options", []):
+        # parse if it's a string
+        if isinstance(opt_raw, str):
+            opt = parse_option_line(opt_raw)
+        elif isinstance(opt_raw, dict):
+            opt = opt_raw
+        else:
+            continue
+        # Timer leaves are handled by the play loop, not here.
+        if opt and opt.get("instant") and "timer" not in opt:
+            yield opt, opt.get("separator", ">")
+
+def run_instant_leaves(node_id: int, state=None, story_nodes: Optional[Dict[int, Dict]] = None) -> int:
+    if state is None:
+        state = EDITOR_STATE
+    if story_nodes is None:
+        story_nodes = nodes
     current = node_id
     while True:
-        node = nodes.get(current)
+        node = story_nodes.get(current)
         if not node:
             return current
+        context = state.node_context(current, node)
         changed = False
-        for opt_raw in node.get("options", []):
-            # parse if it's a string
-            if isinstance(opt_raw, str):
+        for opt, sep in instant_leaves(node):
+            for act in opt.get("actions", []):
+                handle_action_with_separators(act, sep, context, state)
+            # handle cascading goto
+            if "__goto" in state.vars:
+                nxt = resolve_next(state.vars.pop("__goto"), state)
+                if nxt is not None and nxt != current:
+                    current = nxt
+                    changed = True
+                    break  # restart processing instant leaves in new node
+        if not changed:
+            break
+    return current
+
+def handle_action_with_separators(expr: str, sep: str, current_node: Dict, state=None):
+    if state is None:
+        state = EDITOR_STATE
+    compile_separated_action(expr, sep)(current_node, state)
+
+def _compile_separated_action(expr: str, sep: str) -> Callable[[Dict, Any], None]:
+    return _build_actions(parse_separated(expr, sep))
+
+def substitute_vars(text: str, variables: Optional[Dict[str, Any]] = None) -> str: # substitute variables, used for inline variable support such as "Clicks: {CLICKS}" ({CLICKS} gets replaced with the variable 'CLICKS' if it exists)
+    if not text:
+        return ""
+    if variables is None:
+        variables = vars_store
+    def repl(match):
+        key = match.group(1)
+        return str(variables.get(key, f"{{{key}}}"))
+    return re.sub(r"\{(\w+)\}", repl, text)
+
+def _split_choice_condition(opt: Dict) -> Tuple[Optional[int], List[float], str]: # splits a leaf's condition into lifetime(N), chance(N) parts and the rest
+    cond_str = opt.get("condition", "") or ""
+    lifetime = None
+    lifetime_match = re.search(r'lifetime\((\d+)\)', cond_str)
+    if lifetime_match:
+        lifetime = int(lifetime_match.group(1))
+        cond_str = cond_str[:lifetime_match.start()] + cond_str[lifetime_match.end():]
+
+    chances, other_conds = [], []
+    for part in [p.strip() for p in re.split(r'[&;]', cond_str) if p.strip()]:
+        if part.startswith('chance(') and part.endswith(')'):
+            try:
+                chances.append(float(part[7:-1]))
+            except (ValueError, IndexError):
+                pass
+        else:
+            other_conds.append(part)
+    return lifetime, chances, " & ".join(other_conds)
+
+class StoryEngine: # headless story runtime: one loaded (read-only) story shared by any number of PlaySessions
+    def __init__(self, story_nodes: Dict[int, Dict], start_node: int = START_NODE,
+                 default_vars: Optional[Dict[str, Any]] = None, default_inventory: Optional[List[str]] = None):
+        self.nodes = story_nodes
+        self.start_node = start_node
+        self.default_vars = dict(default_vars or {})
+        self.default_inventory = list(default_inventory or [])
+        self._choices: Dict[int, Tuple[Optional[Dict], List[Tuple]]] = {}
+
+    @classmethod
+    def from_data(cls, data: Dict) -> "StoryEngine": # builds an engine from story data in the save format
+        story_nodes = {int(k): v for k, v in data.get("nodes", {}).items()}
+        return cls(story_nodes, data.get("start_node", START_NODE), data.get("vars_store", {}), data.get("inventory", []))
+
+    @classmethod
+    def load(cls, path: str, mapped: bool = False) -> "StoryEngine": # loads a saved story file; binary and .branchdb stories decode nodes as the engine reaches them
+        if is_sqlite_story(path):
+            story = SqliteStory(path)
+            return cls(story, story.meta.get("start_node", START_NODE), story.meta.get("vars_store", {}), story.meta.get("inventory", []))
+        if is_binary_story(path):
+            story = BinaryStory(path, mapped=mapped)
+            return cls(story, story.meta.get("start_node", START_NODE), story.meta.get("vars_store", {}), story.meta.get("inventory", []))
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_data(json.load(f))
+
+    def node_choices(self, node_id: int) -> Tuple[Optional[Dict], List[Tuple]]: # a node's timer leaf and its choosable leaves, parsed once
+        cached = self._choices.get(node_id)
+        if cached is None:
+            timer = None
+            choices = []
+            node = self.nodes.get(node_id) or {}
+            for i, opt_raw in enumerate(node.get("options", [])):
                 opt = parse_option_line(opt_raw)
-            elif isinstance(opt_raw, dict):
-                opt = opt_raw
+                if not opt:
+                    continue
+                if opt.get("instant"):
+                    # Only one timer per node is supported
+                    if timer is None and "timer" in opt and opt.get("timer") and opt.get("actions"):
+                        timer = opt
+                    continue
+                choices.append((i, opt) + _split_choice_condition(opt))
+            cached = self._choices[node_id] = (timer, choices)
+        return cached
+
+    def start(self, node: Optional[int] = None, seed: Any = None) -> "PlaySession": # starts a new playthrough (at the start node by default)
+        session = PlaySession(self, seed)
+        session.restart(node)
+        return session
+
+class _SessionNode: # what actions see as 'current_node' during a PlaySession; writes (rlet) stay in the session
+    __slots__ = ("session", "node_id", "node")
+
+    def __init__(self, session: "PlaySession", node_id: int, node: Dict):
+        self.session, self.node_id, self.node = session, node_id, node
+
+    def get(self, key, default=None):
+        overrides = self.session.overrides.get(self.node_id)
+        if overrides and key in overrides:
+            return overrides[key]
+        return self.node.get(key, default)
+
+    def __getitem__(self, key):
+        overrides = self.session.overrides.get(self.node_id)
+        if overrides and key in overrides:
+            return overrides[key]
+        return self.node[key]
+
+    def __setitem__(self, key, value):
+        self.session.overrides.setdefault(self.node_id, {})[key] = value
+
+    def __contains__(self, key):
+        return key in self.node or key in self.session.overrides.get(self.node_id, ())
+
+class PlaySession: # one playthrough of a StoryEngine: its own variables, inventory, RNG, position and timers
+    __slots__ = ("engine", "rng", "vars", "inventory", "current", "path", "overrides", "options",
+                 "ended", "end_reason", "node_time", "timer_left", "_timer", "_deadline", "_last_rendered")
+
+    def __init__(self, engine: StoryEngine, seed: Any = None):
+        self.engine = engine
+        self.rng = random.Random(seed)
+
+    def restart(self, node: Optional[int] = None):
+        engine = self.engine
+        self.vars = {k: (v.copy() if isinstance(v, (set, list, dict)) else v) for k, v in engine.default_vars.items()}
+        self.inventory = list(engine.default_inventory)
+        self.current = engine.start_node if node is None else node
+        self.path: List[int] = []
+        self.overrides: Dict[int, Dict[str, Any]] = {}
+        self.options: List[Dict] = []
+        self.ended = False
+        self.end_reason: Optional[str] = None # 'missing' (node not found), 'dead_end' (no leaves left) or 'end' (picked leaf has no next)
+        self.node_time = 0.0
+        self.timer_left: Optional[float] = None
+        self._timer = None
+        self._deadline = None
+        self._last_rendered = None
+        self._render()
+
+    def node_context(self, node_id: int, node: Dict) -> _SessionNode:
+        return _SessionNode(self, node_id, node)
+
+    @property
+    def header(self) -> str: # current node's header, including any rlet edits made in this session
+        node = self.engine.nodes.get(self.current)
+        if node is None:
+            return ""
+        return self.node_context(self.current, node).get("header", "")
+
+    def visible_options(self) -> List[Dict]: # leaves the player can pick right now
+        return self.options
+
+    def pick(self, index: int):
+        opt = self.options[index]
+        self._timer = self.timer_left = self._deadline = None
+
+        node = self.engine.nodes.get(self.current)
+        if node is not None:
+            execute_actions(opt.get("actions", []), self.node_context(self.current, node), self)
+
+        nxt = resolve_next(opt.get("next"), self)
+        if nxt is None:
+            self._finish("end")
+            return
+        self.current = nxt
+        self._render()
+
+    def tick(self, dt: float) -> bool: # advance play time by dt seconds; returns True if the timer or a lifetime() fired
+        if self.ended:
+            return False
+        self.node_time += dt
+
+        if self._timer is not None:
+            self.timer_left -= dt
+            if self.timer_left <= 0:
+                timer = self._timer
+                self._timer = self.timer_left = None
+                node = self.engine.nodes.get(self.current)
+                if node is not None:
+                    context = self.node_context(self.current, node)
+                    for act in timer.get("actions", []):
+                        handle_action_with_separators(act, timer.get("separator", ">"), context, self)
+                moved = "__goto" in self.vars
+                if moved:
+                    nxt = resolve_next(self.vars.pop("__goto"), self)
+                    if nxt is None:
+                        return True
+                    self.current = nxt
+                self._render(entered=moved)
+                return True
+
+        if self._deadline is not None and self.node_time >= self._deadline:
+            self._render(entered=False) # a lifetime() leaf expired: same node, fewer leaves
+            return True
+        return False
+
+    def next_event_in(self) -> Optional[float]: # seconds until tick() has something to do, or None
+        due = []
+        if self._timer is not None:
+            due.append(self.timer_left)
+        if self._deadline is not None:
+            due.append(self._deadline - self.node_time)
+        return max(0.0, min(due)) if due else None
+
+    def _finish(self, reason: str):
+        self.ended = True
+        self.end_reason = reason
+        self.options = []
+        self._timer = self.timer_left = self._deadline = None
+
+    def _render(self, entered: bool = True):
+        # (re)enter the current node: run instant leaves, arm its timer, work out the visible leaves.
+        # entered=False refreshes the node in place (a timer without a goto, an expired lifetime()) and isn't a step on the path
+        if self.current != self._last_rendered:
+            self.node_time = 0.0
+            self._last_rendered = self.current
+
+        engine = self.engine
+        self.current = run_instant_leaves(self.current, self, engine.nodes)
+        self._timer = self.timer_left = self._deadline = None
+
+        node = engine.nodes.get(self.current)
+        if node is None:
+            self._finish("missing")
+            return
+        if entered or not self.path or self.path[-1] != self.current:
+            self.path.append(self.current)
+
+        timer, choices = engine.node_choices(self.current)
+        if timer is not None:
+            self._timer = timer
+            self.timer_left = float(timer["timer"])
+
+        context = self.node_context(self.current, node)
+        visible = []
+        for _, opt, lifetime, chances, cond in choices:
+            # Handle lifetime(N) condition
+            if lifetime is not None:
+                if self.node_time >= lifetime:
+                    continue
+                if self._deadline is None or lifetime < self._deadline:
+                    self._deadline = lifetime
+            if any(self.rng.uniform(0, 100) > chance for chance in chances):
+                continue
+            if evaluate_condition(cond, context, self):
+                visible.append(opt)
+        self.options = visible
+
+        if not visible and self._timer is None and self._deadline is None:
+            self._finish("dead_end")
+
+# ------- simulator -------
+# Monte Carlo playthroughs over a process pool. Every run gets its own seed
+# derived from (seed, run index), so results don't depend on the worker count.
+
+SIM_STUCK_REASONS = ("dead_end", "missing", "max_steps")
+
+def sim_policy_random(session: PlaySession, visible: List[Dict]) -> Optional[int]: # uniform over the visible leaves, plus 'wait' when a timer/lifetime() is pending
+    n = len(visible) + (session.next_event_in() is not None)
+    i = session.rng.randrange(n) if n else 0
+    return i if i < len(visible) else None
+
+def sim_policy_first(session: PlaySession, visible: List[Dict]) -> Optional[int]: # always the first visible leaf
+    return 0 if visible else None
+
+SIM_POLICIES: Dict[str, Callable[[PlaySession, List[Dict]], Optional[int]]] = {
+    "random": sim_policy_random,
+    "first": sim_policy_first,
+}
+
+def simulate_run(engine: StoryEngine, seed: Any, policy=sim_policy_random, max_steps: int = 1000) -> Tuple[str, Optional[int], int]:
+    # plays one run; returns (outcome, node, path length) where outcome is 'ending' or one of SIM_STUCK_REASONS
+    session = engine.start(seed=seed)
+    for _ in range(max_steps):
+        if session.ended:
+            break
+        visible = session.visible_options()
+        index = policy(session, visible) if visible else None
+        if index is not None:
+            session.pick(index)
+            continue
+        delay = session.next_event_in()
+        if delay is None:
+            break
+        session.tick(delay + 1e-9)
+    else:
+        return "max_steps", session.current, len(session.path)
+
+    length = len(session.path)
+    if session.end_reason == "end":
+        return "ending", session.current, length
+    if session.end_reason == "dead_end" and not engine.node_choices(session.current)[1]:
+        return "ending", session.current, length # node has no leaves at all, so it's an intended ending
+    return session.end_reason or "dead_end", session.current, length
+
+_SIM_WORKER_ENGINE: Optional[StoryEngine] = None
+
+def _sim_engine(story: Union[str, Dict]) -> StoryEngine: # a binary story path is memory-mapped (a .branchdb one paged), anything else is story data
+    if isinstance(story, str):
+        return StoryEngine.load(story, mapped=True)
+    return StoryEngine.from_data(story)
+
+def _process_pool(workers: int, initializer: Callable, initargs: Tuple):
+    # worker pool for the simulator and the linter; spawned rather than forked, since forking a process that
+    # runs Tk and background threads can copy a held lock into the child and hang it
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+def _sim_worker_init(story: Union[str, Dict]):
+    global _SIM_WORKER_ENGINE
+    _SIM_WORKER_ENGINE = _sim_engine(story)
+
+def _sim_chunk(seed: Any, start: int, stop: int, policy: str, max_steps: int, engine: Optional[StoryEngine] = None) -> Dict:
+    engine = engine or _SIM_WORKER_ENGINE
+    pick = SIM_POLICIES[policy]
+    endings, stuck, lengths = {}, {}, {}
+    for i in range(start, stop):
+        outcome, node, length = simulate_run(engine, f"{seed}:{i}", pick, max_steps)
+        if outcome == "ending":
+            endings[node] = endings.get(node, 0) + 1
+        else:
+            key = (outcome, node)
+            stuck[key] = stuck.get(key, 0) + 1
+        lengths[length] = lengths.get(length, 0) + 1
+    return {"endings": endings, "stuck": stuck, "path_lengths": lengths}
+
+def simulate_story(data: Union[str, Dict], runs: int = 1000, workers: Optional[int] = None, seed: Any = 0,
+                   policy: str = "random", max_steps: int = 1000, chunk_size: int = 250) -> Dict:
+    # runs `runs` playthroughs of story data (save format) or a binary/.branchdb story file, and aggregates endings, stuck runs and path lengths
+    if policy not in SIM_POLICIES:
+        raise ValueError(f"Unknown policy '{policy}' (expected one of: {', '.join(SIM_POLICIES)})")
+    workers = workers or os.cpu_count() or 1
+    chunks = [(seed, start, min(start + chunk_size, runs), policy, max_steps) for start in range(0, runs, chunk_size)]
+
+    if workers == 1 or len(chunks) == 1:
+        engine = _sim_engine(data)
+        parts = [_sim_chunk(*chunk, engine=engine) for chunk in chunks]
+    else:
+        story, tmp_path = data, None
+        if not isinstance(data, str):
+            # workers map one prebuilt binary file instead of each unpickling their own copy of the story
+            fd, tmp_path = tempfile.mkstemp(suffix=BINARY_STORY_EXT)
+            os.close(fd)
+            write_story_binary(tmp_path, data)
+            story = tmp_path
+        try:
+            with _process_pool(workers, _sim_worker_init, (story,)) as pool:
+                parts = list(pool.map(_sim_chunk, *zip(*chunks)))
+        finally:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+
+    endings, stuck, lengths = {}, {}, {}
+    for part in parts:
+        for hist, counts in ((endings, part["endings"]), (stuck, part["stuck"]), (lengths, part["path_lengths"])):
+            for key, n in counts.items():
+                hist[key] = hist.get(key, 0) + n
+
+    total_stuck = sum(stuck.values())
+    return {
+        "runs": runs,
+        "endings": dict(sorted(endings.items(), key=lambda kv: -kv[1])),
+        "stuck": dict(sorted(stuck.items(), key=lambda kv: -kv[1])),
+        "stuck_rate": total_stuck / runs if runs else 0.0,
+        "avg_path_length": sum(k * n for k, n in lengths.items()) / runs if runs else 0.0,
+        "path_lengths": dict(sorted(lengths.items())),
+    }
+
+def format_simulation(result: Dict) -> str: # plain-text report for simulate_story results
+    runs = result["runs"] or 1
+    lines = [f"Runs: {result['runs']}",
+             f"Average path length: {result['avg_path_length']:.2f}",
+             f"Stuck rate: {result['stuck_rate']:.2%}",
+             "Endings:"]
+    for node, n in result["endings"].items():
+        lines.append(f"  node {node}: {n} ({n / runs:.2%})")
+    if result["stuck"]:
+        lines.append("Stuck:")
+        for (reason, node), n in result["stuck"].items():
+            lines.append(f"  {reason} at node {node}: {n} ({n / runs:.2%})")
+    return "\n".join(lines)
+
+# ------- ending solver -------
+# Exact reach/ending probabilities for a story treated as an absorbing Markov
+# chain: the player picks uniformly among visible leaves, chance() hides
+# leaves with its probability and '/' targets are uniform. Anything that
+# depends on variables, inventory or time can't be modelled exactly; those
+# nodes are reported and modelled as if their leaves were always visible.
+
+
+def _static_targets(next_ref: Any) -> Tuple[List[Tuple[Union[int, str, None], float]], bool]:
+    # [(target, probability)] for a next/goto reference and whether it depends on variables; a target of None means
+    # there is none (the story ends there), a string is a variable or expression only known during play.
+    # Each part of a '/' random target gets the same share
+    if next_ref is None or isinstance(next_ref, int):
+        return [(next_ref, 1.0)], False
+    parts = [p.strip() for p in str(next_ref).split("/") if p.strip()]
+    if not parts:
+        return [(None, 1.0)], False
+    targets: List[Union[int, str]] = []
+    for part in parts:
+        try:
+            targets.append(int(part))
+        except ValueError:
+            targets.append(part)
+    dependent = any(isinstance(t, str) for t in targets)
+    return [(t, 1.0 / len(targets)) for t in targets], dependent
+
+def _has_goto(action: Action) -> bool: # a goto anywhere in an action or the actions nested in it
+    return action.kind == "goto" or any(_has_goto(child) for nested in action.children.values() for child in nested)
+
+def _leaf_goto(opt: Dict, sep: str) -> Tuple[Any, bool]: # where an instant or timer leaf's actions send the player (None: nowhere), and whether that's uncertain
+    goto, dependent = None, False
+    for act in opt.get("actions", []):
+        for action in parse_separated(act, sep):
+            if action.kind == "goto":
+                goto = action.args["target"] # the last one run wins
+            elif _has_goto(action):
+                dependent = True # a goto that may or may not run
+    return goto, dependent
+
+def _node_transitions(engine: StoryEngine, node_id: int) -> Tuple[List[Tuple[Any, float]], bool]:
+    # outgoing transitions of one node as [(node id or ('end'|'unresolved'|'dead_end'|'missing', node), probability)]
+    node = engine.nodes.get(node_id)
+    if node is None:
+        return [(("missing", node_id), 1.0)], False
+    dependent = False
+    out: Dict[Any, float] = {}
+
+    def outcome(target):
+        if target is None:
+            return ("end", node_id)
+        return ("unresolved", node_id) if isinstance(target, str) else target
+
+    # instant leaves run on entry, parsed and separated exactly as run_instant_leaves runs them: a goto to another
+    # node leaves, while a goto back here (or none at all) carries on with the next instant leaf, then the choices
+    staying = 1.0
+    for opt, sep in instant_leaves(node):
+        goto, dep = _leaf_goto(opt, sep)
+        dependent = dependent or dep
+        if goto is None:
+            continue
+        targets, dep = _static_targets(goto)
+        dependent = dependent or dep
+        stay = 0.0
+        for target, p in targets:
+            if target is None or target == node_id:
+                stay += p
+            else:
+                out[outcome(target)] = out.get(outcome(target), 0.0) + staying * p
+        staying *= stay
+        if staying == 0.0:
+            return list(out.items()), dependent
+
+    timer, choices = engine.node_choices(node_id)
+    if any(lifetime is not None for _, _, lifetime, _, _ in choices):
+        dependent = True
+    if not choices and timer is None:
+        out[("end", node_id)] = out.get(("end", node_id), 0.0) + staying
+        return list(out.items()), dependent
+
+    # leaves as (visible probability, targets)
+    leaves = []
+    if timer is not None:
+        # waiting for the timer is one more choice, always there (the random simulator policy counts it the same way).
+        # Its goto moves on; without one the node is shown again, which is a step back to this node
+        goto, dep = _leaf_goto(timer, timer.get("separator", ">"))
+        dependent = dependent or dep
+        if goto is None:
+            leaves.append((1.0, [(node_id, 1.0)]))
+        else:
+            targets, dep = _static_targets(goto)
+            dependent = dependent or dep
+            # an empty goto leaves the player where they are without the timer, which this model can't follow
+            leaves.append((1.0, [(("unresolved", node_id) if t is None else outcome(t), p) for t, p in targets]))
+    for _, opt, _, chances, cond in choices:
+        if cond:
+            dependent = True
+        p_visible = 1.0
+        for chance in chances:
+            p_visible *= min(max(chance, 0.0), 100.0) / 100.0
+        targets, dep = _static_targets(opt.get("next"))
+        dependent = dependent or dep
+        leaves.append((p_visible, [(outcome(t), p) for t, p in targets]))
+
+    sure = [leaf for leaf in leaves if leaf[0] >= 1.0]
+    maybe = [leaf for leaf in leaves if 0.0 < leaf[0] < 1.0]
+    # every combination of chance() leaves being shown (2^k, k is small in practice)
+    for mask in range(1 << len(maybe)):
+        p_combo = staying
+        shown = list(sure)
+        for bit, leaf in enumerate(maybe):
+            if mask >> bit & 1:
+                p_combo *= leaf[0]
+                shown.append(leaf)
             else:
+                p_combo *= 1.0 - leaf[0]
+        if p_combo == 0.0:
+            continue
+        if not shown:
+            out[("dead_end", node_id)] = out.get(("dead_end", node_id), 0.0) + p_combo
+            continue
+        for _, targets in shown:
+            for target, p in targets:
+                out[target] = out.get(target, 0.0) + p_combo * p / len(shown)
+    return list(out.items()), dependent
+
+SOLVER_DENSE_MAX = 1000 # loops up to this many nodes are solved as a dense block (8 MB); bigger ones are iterated
+SOLVER_TOLERANCE = 1e-13 # probability still going round a big loop when its iteration stops
+SOLVER_MAX_SWEEPS = 1000000 # ... or after this many steps, whatever is left counts as never leaving
+
+def _spread_through_loop(entering: List[float], links: List[Tuple[int, int, float]]):
+    # expected visits inside one big loop, in memory linear in its links: the entering probability is pushed one step at
+    # a time until (almost) none is left. N's diagonal isn't known this way, so these nodes get no reach probability.
+    # The extra last element is the probability that never left
+    src, dst, prob = (np.array(column) for column in zip(*links))
+    mass = np.asarray(entering, dtype=float)
+    counts = mass.copy()
+    for _ in range(SOLVER_MAX_SWEEPS):
+        mass = np.bincount(dst, weights=mass[src] * prob, minlength=len(mass))
+        counts += mass
+        if mass.sum() <= SOLVER_TOLERANCE:
+            return np.append(counts, 0.0)
+    return np.append(counts, mass.sum())
+
+def solve_endings(data: Dict, start_node: Optional[int] = None) -> Dict:
+    # solves story data (save format) as an absorbing Markov chain; needs NumPy
+    if np is None:
+        raise RuntimeError("The ending solver needs NumPy (pip install numpy)")
+    engine = StoryEngine.from_data(data)
+    start = engine.start_node if start_node is None else start_node
+
+    # explore from the start node
+    transitions: Dict[int, List[Tuple[Any, float]]] = {}
+    dependent = set()
+    stack = [start]
+    while stack:
+        nid = stack.pop()
+        if nid in transitions:
+            continue
+        transitions[nid], dep = _node_transitions(engine, nid)
+        if dep:
+            dependent.add(nid)
+        for target, _ in transitions[nid]:
+            if isinstance(target, int) and target not in transitions:
+                stack.append(target)
+
+    # nodes that can never reach an outcome are trapped cycles; entering one is its own outcome
+    can_finish = {nid for nid, outs in transitions.items() if any(not isinstance(t, int) for t, _ in outs)}
+    reverse: Dict[int, List[int]] = {}
+    for nid, outs in transitions.items():
+        for target, _ in outs:
+            if isinstance(target, int):
+                reverse.setdefault(target, []).append(nid)
+    stack = list(can_finish)
+    while stack:
+        for src in reverse.get(stack.pop(), ()):
+            if src not in can_finish:
+                can_finish.add(src)
+                stack.append(src)
+    for nid in transitions:
+        if nid not in can_finish:
+            transitions[nid] = [(("loop", nid), 1.0)]
+
+    # The fundamental matrix N = (I - Q)^-1 is block triangular over the strongly connected components, since a walk
+    # that leaves a loop never comes back. So it is solved one component at a time in topological order (forward
+    # substitution over the condensation), and no story-sized matrix is ever built. Expected visits are the entries
+    # into a component times its block of N; reach is visits over N's diagonal
+    edges = {nid: [t for t, _ in outs if isinstance(t, int)] for nid, outs in transitions.items()}
+    entries: Dict[int, float] = {start: 1.0} # expected entries into a node from earlier components
+    visits: Dict[int, float] = {}
+    reach: Dict[int, float] = {}
+    absorbed: Dict[Tuple[str, int], float] = {}
+    for component in reversed(strongly_connected_components(edges)):
+        entering = [entries.pop(nid, 0.0) for nid in component]
+        if not any(entering):
+            continue
+        if len(component) == 1:
+            stay = sum(p for target, p in transitions[component[0]] if target == component[0])
+            counts, returns = [entering[0] / (1.0 - stay)], [1.0 / (1.0 - stay)]
+        else:
+            position = {nid: i for i, nid in enumerate(component)}
+            links = [(i, j, p) for nid, i in position.items() for target, p in transitions[nid]
+                     if (j := position.get(target)) is not None]
+            if len(component) <= SOLVER_DENSE_MAX:
+                block = np.eye(len(component))
+                for i, j, p in links:
+                    block[i, j] -= p
+                N = np.linalg.inv(block)
+                counts, returns = np.asarray(entering) @ N, np.diag(N)
+            else:
+                counts, returns = _spread_through_loop(entering, links), [None] * len(component)
+                if counts[-1] > 0.0:
+                    absorbed[("loop", component[0])] = absorbed.get(("loop", component[0]), 0.0) + float(counts[-1])
+        members = set(component)
+        for nid, count, diag in zip(component, counts, returns):
+            visits[nid] = float(count)
+            if diag is not None:
+                reach[nid] = float(count / diag)
+            for target, p in transitions[nid]:
+                if not isinstance(target, int):
+                    absorbed[target] = absorbed.get(target, 0.0) + count * p
+                elif target not in members:
+                    entries[target] = entries.get(target, 0.0) + count * p
+
+    endings: Dict[int, float] = {}
+    unresolved: Dict[int, float] = {}
+    stuck: Dict[Tuple[str, int], float] = {}
+    for o, p in sorted(absorbed.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        if p <= 1e-12:
+            continue
+        if o[0] == "end":
+            endings[o[1]] = float(p)
+        elif o[0] == "unresolved":
+            unresolved[o[1]] = float(p)
+        else:
+            stuck[o] = float(p)
+
+    return {
+        "endings": dict(sorted(endings.items(), key=lambda kv: -kv[1])),
+        "unresolved": dict(sorted(unresolved.items(), key=lambda kv: -kv[1])),
+        "stuck": dict(sorted(stuck.items(), key=lambda kv: -kv[1])),
+        "reach": {nid: p for nid, p in reach.items() if visits[nid] > 1e-12},
+        "expected_visits": {nid: v for nid, v in visits.items() if v > 1e-12},
+        "variable_dependent": sorted(dependent),
+    }
+
+def format_solution(result: Dict) -> str: # plain-text report for solve_endings results
+    lines = ["Endings:"]
+    for node, p in result["endings"].items():
+        lines.append(f"  node {node}: {p:.4%}")
+    if result["unresolved"]:
+        lines.append("Unresolved (the next node depends on variables):")
+        for node, p in result["unresolved"].items():
+            lines.append(f"  leaving node {node}: {p:.4%}")
+    if result["stuck"]:
+        lines.append("Stuck:")
+        for (reason, node), p in result["stuck"].items():
+            lines.append(f"  {reason} at node {node}: {p:.4%}")
+    lines.append("Reach probability:")
+    for node, p in sorted(result["reach"].items()):
+        lines.append(f"  node {node}: {p:.4%}")
+    if result["variable_dependent"]:
+        lines.append("Not exact (depends on variables, inventory or time): nodes "
+                     + ", ".join(map(str, result["variable_dependent"])))
+    return "\n".join(lines)
+
+# ------- graph analysis -------
+# Reachability, strongly connected components and trapped cycles over the whole story, in O(nodes + links).
+# A node's links are its leaves' next targets (each part of a '/' random target) and any goto in its actions;
+# targets named by a variable or expression are resolved with the story's starting values.
+def node_exits(node: Dict, defaults: Dict[str, Any]) -> Tuple[List[int], bool, bool]:
+    # where a node can lead: (target ids, whether the story can end here, whether some target can't be worked out before play)
+    targets: List[int] = []
+    state = None
+    has_choice = can_end = is_open = False
+
+    def follow(ref):
+        nonlocal is_open, state
+        for part in str(ref).split("/"):
+            part = part.strip()
+            if not part:
                 continue
+            try:
+                targets.append(int(part))
+            except ValueError:
+                if state is None:
+                    state = SimpleNamespace(vars=defaults, inventory=[], rng=random.Random(0))
+                target = resolve_next(part, state)
+                if target is None:
+                    is_open = True
+                else:
+                    targets.append(target)
+
+    def walk(actions: List[Action]):
+        for action in actions:
+            if action.kind == "goto":
+                follow(action.args["target"])
+            for nested in action.children.values():
+                walk(nested)
+
+    for opt in node.get("options", []):
+        if not isinstance(opt, dict):
+            opt = parse_option_line(str(opt))
+            if not opt:
+                continue
+        if not opt.get("instant"):
+            has_choice = True
+            if opt.get("next") is None:
+                can_end = True # picking it ends the story
+            else:
+                follow(opt["next"])
+        for act in opt.get("actions", []):
+            if "goto" in act: # only gotos lead anywhere; skip parsing the rest
+                walk(parse_actions(act))
+    return targets, can_end or not has_choice, is_open
+
+def reachable_from(edges: Dict[int, List[int]], start: int) -> set: # breadth-first search over existing nodes
+    if start not in edges:
+        return set()
+    reached = {start}
+    frontier = deque([start])
+    while frontier:
+        for target in edges[frontier.popleft()]:
+            if target not in reached and target in edges:
+                reached.add(target)
+                frontier.append(target)
+    return reached
+
+def strongly_connected_components(edges: Dict[int, List[int]]) -> List[List[int]]:
+    # Tarjan's algorithm without recursion (stories can be far deeper than Python's stack); links to missing nodes are ignored.
+    # Components come out in reverse topological order of the condensation: a component only links to ones listed before it
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack = set()
+    components = []
+    for root in edges:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root); on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            nid, targets = work[-1]
+            for target in targets:
+                if target not in edges:
+                    continue
+                if target not in index:
+                    index[target] = low[target] = len(index)
+                    stack.append(target); on_stack.add(target)
+                    work.append((target, iter(edges[target])))
+                    break
+                if target in on_stack:
+                    low[nid] = min(low[nid], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[nid])
+                if low[nid] == index[nid]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == nid:
+                            break
+                    components.append(component)
+    return components
+
+def analyze_graph(story_nodes: Mapping[int, Dict], start_node: int, defaults: Optional[Dict[str, Any]] = None,
+                  cache: Optional[Dict[int, Tuple]] = None) -> Dict:
+    # reachability and cycle analysis of a nodes mapping. `cache` (kept by the caller) reuses node_exits for node dicts
+    # that are the very same objects as last time, so callers whose node values are replaced rather than mutated (the editor's
+    # undo base) only re-read what changed
+    defaults = defaults if defaults is not None else {}
+    edges: Dict[int, List[int]] = {}
+    endings, open_nodes = set(), set()
+    for nid, node in story_nodes.items():
+        entry = cache.get(nid) if cache is not None else None
+        if entry is None or entry[0] is not node or entry[1] is not defaults:
+            entry = (node, defaults, node_exits(node, defaults))
+            if cache is not None:
+                cache[nid] = entry
+        targets, can_end, is_open = entry[2]
+        edges[nid] = targets
+        if can_end:
+            endings.add(nid)
+        if is_open:
+            open_nodes.add(nid)
+    if cache is not None and len(cache) > len(edges):
+        for nid in [nid for nid in cache if nid not in edges]:
+            del cache[nid]
+
+    reachable = reachable_from(edges, start_node)
+    cycles, trapped = [], []
+    for component in strongly_connected_components(edges):
+        if len(component) == 1 and component[0] not in edges[component[0]]:
+            continue # a single node without a self-link isn't a cycle
+        component.sort()
+        cycles.append(component)
+        members = set(component)
+        # trapped: nothing inside can end the story or go anywhere unknown, and every link stays inside
+        if not (members & endings or members & open_nodes) and all(t in members for nid in component for t in edges[nid]):
+            trapped.append(component)
+    return {
+        "start_node": start_node,
+        "reachable": reachable,
+        "unreachable": sorted(nid for nid in edges if nid not in reachable),
+        "cycles": sorted(cycles),
+        "trapped": sorted(trapped),
+        "open": sorted(open_nodes),
+    }
 
-            if opt and opt.get("instant"):
-                # Timer leaves are handled by the play loop, not here.
-                if "timer" in opt:
+def analyze_story(data: Dict) -> Dict: # analyze_graph for story data in the save format
+    story_nodes = {int(k): v for k, v in data.get("nodes", {}).items()}
+    return analyze_graph(story_nodes, data.get("start_node", START_NODE), data.get("vars_store", {}))
+
+def format_analysis(result: Dict, limit: int = 20) -> str: # plain-text report for analyze_graph results
+    def ids(group: List[int]) -> str:
+        shown = ", ".join(map(str, group[:limit]))
+        return shown + (f", … ({len(group)} in all)" if len(group) > limit else "")
+
+    lines = [f"Reachable from node {result['start_node']}: {len(result['reachable'])} node(s)"]
+    if result["unreachable"]:
+        lines.append(f"Unreachable: {ids(result['unreachable'])}")
+    lines.append(f"Cycles: {len(result['cycles'])}")
+    for component in result["trapped"][:limit]:
+        where = "" if component[0] in result["reachable"] else " (unreachable)"
+        lines.append(f"Trapped cycle{where} (can never be left or ended): {ids(component)}")
+    if result["open"]:
+        lines.append(f"Targets decided during play (not followed): {ids(result['open'])}")
+    return "\n".join(lines)
+
+# ------- story lint -------
+# Whole-story checks, run on a process pool a chunk of nodes at a time. Each chunk reports its own problems plus the
+# variables it reads and sets and the links it makes; the story-wide checks (variables that are never set,
+# nodes that can't be reached) are finished from those once every chunk is in.
+LINT_CHUNK_SIZE = 500 # nodes per lint task
+_LINT_CONTEXT: Optional[Tuple[frozenset, Dict[str, Any]]] = None # (node ids, starting variables) in a lint worker process
+_CONDITION_PREFIXES = ("has_item:", "not_has_item:", "hlet:")
+
+def _lint_worker_init(ids: frozenset, defaults: Dict[str, Any]):
+    global _LINT_CONTEXT
+    _LINT_CONTEXT = (ids, defaults)
+
+def _expr_names(expr: str) -> Optional[List[str]]: # variables an expression reads, or None if it isn't a valid expression
+    try:
+        code = _compile_expr(expr)
+    except Exception:
+        return None
+    return [name for name in code.co_names if not name.startswith("__fn_")]
+
+def _lint_chunk(chunk: List[Tuple[int, Dict]], context: Optional[Tuple[frozenset, Dict[str, Any]]] = None) -> Dict:
+    # problems in a chunk of (id, node) pairs, plus what lint_story needs for the story-wide checks
+    ids, defaults = context or _LINT_CONTEXT
+    start_state = SimpleNamespace(vars=defaults, inventory=[], rng=random.Random(0))
+    problems = []
+    used: Dict[str, Tuple[int, int]] = {} # variable -> first (node, line) that reads it
+    assigned = set()
+    edges: Dict[int, List[int]] = {}
+
+    for nid, node in chunk:
+        targets = edges[nid] = []
+
+        def check_target(ref, line: int, what: str):
+            for part in str(ref).split("/"):
+                part = part.strip()
+                if not part:
                     continue
+                try:
+                    target = int(part)
+                except ValueError:
+                    names = _expr_names(part)
+                    if names is None:
+                        problems.append((nid, line, "error", f"{what} '{part}' is neither a node id nor a valid expression"))
+                        continue
+                    for name in names:
+                        used.setdefault(name, (nid, line))
+                    # variable targets are followed with the starting values; a missing one may just be set later
+                    target = resolve_next(part, start_state)
+                    if target in ids:
+                        targets.append(target)
+                    continue
+                if target in ids:
+                    targets.append(target)
+                else:
+                    problems.append((nid, line, "error", f"{what} leads to node {target}, which doesn't exist"))
 
-                sep = opt.get("separator", ">")
-                for act in opt.get("actions", []):
-                    handle_action_with_separators(act, sep, node)
-                # handle cascading goto
-                if "__goto" in vars_store:
-                    nxt = resolve_next(vars_store.pop("__goto"))
-                    if nxt is not None and nxt != current:
-                        current = nxt
-                        changed = True
-                        break  # restart processing instant leaves in new node
-        if not changed:
-            break
-    return current
+        def check_condition(cond: str, line: int):
+            for part in re.split(r'[&;]', cond):
+                part = part.strip().lstrip("!").strip()
+                if not part or part.startswith(_CONDITION_PREFIXES):
+                    continue
+                names = _expr_names(part[4:].strip() if part.startswith("var:") else part)
+                if names is None:
+                    problems.append((nid, line, "error", f"condition '{part}' is never true (not a valid expression)"))
+                    continue
+                for name in names:
+                    used.setdefault(name, (nid, line))
+
+        def check_text(text: str, line: int):
+            for name in re.findall(r"\{(\w+)\}", text or ""):
+                used.setdefault(name, (nid, line))
+
+        def walk(actions: List[Action], line: int):
+            for action in actions:
+                kind, args = action.kind, action.args
+                if kind in ("assign", "assign_any", "set"):
+                    assigned.add(args["name"])
+                elif kind in ("weighted", "randr", "rands"):
+                    assigned.add(args["var"])
+                elif kind == "goto":
+                    check_target(args["target"], line, "goto")
+                elif kind in ("if_block", "if_then"):
+                    check_condition(args["cond"], line)
+                for nested in action.children.values():
+                    walk(nested, line)
+
+        check_text(node.get("header", ""), 0)
+        raw = node.get("raw_options")
+        if isinstance(raw, str):
+            lines = raw.split("\n")
+        else:
+            lines = [format_option_line(opt) if isinstance(opt, dict) else str(opt) for opt in node.get("options", [])]
+        for line_num, line in enumerate(lines, 1):
+            syntax = parse_option_syntax(line)
+            for start, end, message in syntax.errors:
+                problems.append((nid, line_num, "error", f"{message}: {line[start:end].strip()}"))
+            opt = syntax.option
+            if opt is None:
+                continue
+            if syntax.kind == "leaf":
+                check_text(opt["text"], line_num)
+                if opt["next"]:
+                    check_target(opt["next"], line_num, "next")
+                check_condition(_split_choice_condition(opt)[2], line_num)
+            walk(syntax.actions, line_num)
+
+    return {"problems": problems, "used": used, "assigned": assigned, "edges": edges}
+
+def lint_story(data: Dict, workers: Optional[int] = None, chunk_size: int = LINT_CHUNK_SIZE,
+               on_chunk: Optional[Callable[[List[Tuple[int, int, str, str]], int, int], None]] = None) -> List[Tuple[int, int, str, str]]:
+    # checks story data (save format) for invalid actions and conditions, malformed lines, links to missing nodes,
+    # variables that are never set and nodes that can't be reached. Returns (node id, options line or 0, 'error'|'warning', message)
+    # sorted by node; on_chunk(problems, nodes checked, total nodes) is called as each chunk finishes (the story-wide checks come last)
+    story_nodes = sorted((int(k), v) for k, v in data.get("nodes", {}).items())
+    defaults = dict(data.get("vars_store", {}))
+    ids = frozenset(nid for nid, _ in story_nodes)
+    chunks = [story_nodes[i:i + chunk_size] for i in range(0, len(story_nodes), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    problems: List[Tuple[int, int, str, str]] = []
+    used: Dict[str, Tuple[int, int]] = {}
+    assigned = set(defaults)
+    edges: Dict[int, List[int]] = {}
+    done = 0
+
+    def merge(part: Dict, size: int):
+        nonlocal done
+        done += size
+        problems.extend(part["problems"])
+        for name, where in part["used"].items():
+            used[name] = min(where, used.get(name, where))
+        assigned.update(part["assigned"])
+        edges.update(part["edges"])
+        if on_chunk:
+            on_chunk(part["problems"], done, len(story_nodes))
+
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            merge(_lint_chunk(chunk, (ids, defaults)), len(chunk))
+    else:
+        from concurrent.futures import as_completed
+        with _process_pool(workers, _lint_worker_init, (ids, defaults)) as pool:
+            futures = {pool.submit(_lint_chunk, chunk): len(chunk) for chunk in chunks}
+            for future in as_completed(futures):
+                merge(future.result(), futures[future])
+
+    story_wide = []
+    for name, (nid, line) in sorted(used.items(), key=lambda item: item[1]):
+        if name not in assigned:
+            story_wide.append((nid, line, "warning", f"variable '{name}' is read here but never set"))
+    start = data.get("start_node", START_NODE)
+    if ids and start not in ids:
+        story_wide.append((start, 0, "error", f"the start node ({start}) doesn't exist"))
+    reached = reachable_from(edges, start)
+    story_wide.extend((nid, 0, "warning", f"can't be reached from the start node ({start})") for nid in sorted(ids - reached))
+    problems.extend(story_wide)
+    if on_chunk:
+        on_chunk(story_wide, done, len(story_nodes))
+    problems.sort(key=lambda p: (p[0], p[1]))
+    return problems
+
+def format_lint(problems: List[Tuple[int, int, str, str]]) -> str: # plain-text report for lint_story results
+    if not problems:
+        return "No problems found."
+    lines = [f"node {nid}{f', line {line}' if line else ''}: {severity}: {message}" for nid, line, severity, message in problems]
+    errors = sum(1 for p in problems if p[2] == "error")
+    lines.append(f"{errors} error(s), {len(problems) - errors} warning(s)")
+    return "\n".join(lines)
+
+# ------- binary story format -------
+# Layout (little-endian):
+#   header   magic, version, flags, then offsets of the three sections below
+#   meta     u32 length + JSON (vars_store, inventory, start_node)
+#   strings  u32 count, u64 offsets[count + 1] into the blob, UTF-8 blob; every string in the story is stored once
+#   index    u32 count, then columns sorted by node id: i64 ids, u64 body offsets, u32 body lengths, f64 xs, f64 ys
+# Node bodies sit between meta and strings. Each is a tagged encoding of the node dict whose strings are string-table indexes.
+BINARY_STORY_EXT = ".branchb"
+_BIN_HEADER = struct.Struct("<4sHHQQQ")
+_BIN_MAGIC, _BIN_VERSION = b"BRNB", 1
+_BIN_NONE, _BIN_FALSE, _BIN_TRUE, _BIN_INT, _BIN_FLOAT, _BIN_STR, _BIN_LIST, _BIN_DICT, _BIN_BIGINT = range(9)
+_BIN_U32, _BIN_I64, _BIN_F64 = struct.Struct("<I"), struct.Struct("<q"), struct.Struct("<d")
+MAPPED_NODE_CACHE = 4096 # decoded nodes (and strings) a memory-mapped BinaryStory keeps around; the oldest are dropped
+
+def is_binary_story(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == _BIN_MAGIC
+    except OSError:
+        return False
 
-def handle_action_with_separators(expr: str, sep: str, current_node: Dict):
-    if sep == ">":
-        first_act = re.split(r'[&;]', expr, 1)[0].strip()
-        execute_actions([first_act], current_node)
+def _le_array(typecode: str, raw: bytes) -> array: # array from little-endian bytes
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _bin_encode(value, out: bytearray, strings: Dict[str, int]): # appends one tagged value; strings are interned into `strings`
+    if value is None:
+        out.append(_BIN_NONE)
+    elif value is True or value is False:
+        out.append(_BIN_TRUE if value else _BIN_FALSE)
+    elif isinstance(value, int):
+        if -2**63 <= value < 2**63:
+            out.append(_BIN_INT); out += _BIN_I64.pack(value)
+        else:
+            out.append(_BIN_BIGINT); out += _BIN_U32.pack(strings.setdefault(str(value), len(strings)))
+    elif isinstance(value, float):
+        out.append(_BIN_FLOAT); out += _BIN_F64.pack(value)
+    elif isinstance(value, str):
+        out.append(_BIN_STR); out += _BIN_U32.pack(strings.setdefault(value, len(strings)))
+    elif isinstance(value, (list, tuple)):
+        out.append(_BIN_LIST); out += _BIN_U32.pack(len(value))
+        for item in value:
+            _bin_encode(item, out, strings)
+    elif isinstance(value, dict):
+        out.append(_BIN_DICT); out += _BIN_U32.pack(len(value))
+        for key, item in value.items():
+            out += _BIN_U32.pack(strings.setdefault(str(key), len(strings)))
+            _bin_encode(item, out, strings)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} can't be stored in a binary story")
+
+def write_story_binary(path: str, data: Dict): # saves story data (the JSON save format) as a binary story, atomically
+    strings: Dict[str, int] = {}
+    story_nodes = sorted((int(k), v) for k, v in data.get("nodes", {}).items())
+    meta = json.dumps({k: v for k, v in data.items() if k != "nodes"}, separators=(",", ":")).encode("utf-8")
+
+    def write(f):
+        f.write(b"\0" * _BIN_HEADER.size)
+        meta_offset = f.tell()
+        f.write(_BIN_U32.pack(len(meta))); f.write(meta)
+
+        offsets, lengths, xs, ys = array("Q"), array("I"), array("d"), array("d")
+        for nid, node in story_nodes:
+            body = bytearray()
+            _bin_encode(node, body, strings)
+            offsets.append(f.tell()); lengths.append(len(body))
+            xs.append(float(node.get("x", 0) or 0)); ys.append(float(node.get("y", 0) or 0))
+            f.write(body)
+
+        strings_offset = f.tell()
+        blob = bytearray()
+        string_offsets = array("Q", [0])
+        for text in strings: # dicts keep insertion order, which is index order
+            blob += text.encode("utf-8")
+            string_offsets.append(len(blob))
+        f.write(_BIN_U32.pack(len(strings))); f.write(_le_bytes(string_offsets)); f.write(blob)
+
+        index_offset = f.tell()
+        f.write(_BIN_U32.pack(len(story_nodes)))
+        for column in (array("q", [nid for nid, _ in story_nodes]), offsets, lengths, xs, ys):
+            f.write(_le_bytes(column))
+
+        f.seek(0)
+        f.write(_BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, 0, meta_offset, strings_offset, index_offset))
+
+    write_atomic(path, write, binary=True)
+
+class BinaryStory(Mapping): # read-only node id -> node dict view of a binary story; nodes are decoded when first looked up
+    # mapped=True reads through a read-only mmap instead: the index and strings are never copied into the process,
+    # so every process that maps the same file shares its pages, and only a bounded number of decoded nodes is kept
+    def __init__(self, path: str, mapped: bool = False):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+        if mapped:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._file.close()
+        magic, version, _flags, meta_offset, strings_offset, index_offset = _BIN_HEADER.unpack(self._read(0, _BIN_HEADER.size))
+        if magic != _BIN_MAGIC or version > _BIN_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a binary story this version of Branch can read")
+
+        (meta_len,) = _BIN_U32.unpack(self._read(meta_offset, 4))
+        self.meta: Dict[str, Any] = json.loads(self._read(meta_offset + 4, meta_len))
+
+        (string_count,) = _BIN_U32.unpack(self._read(strings_offset, 4))
+        self._string_offsets = self._column("Q", strings_offset + 4, string_count + 1)
+        self._blob_offset = strings_offset + 4 + 8 * (string_count + 1)
+        self._blob = self._view(self._blob_offset, self._string_offsets[-1]) if mapped else None # read on first decode otherwise
+        self._strings: Dict[int, str] = {} if not mapped else OrderedDict()
+
+        (count,) = _BIN_U32.unpack(self._read(index_offset, 4))
+        pos = index_offset + 4
+        columns = []
+        for typecode, width in (("q", 8), ("Q", 8), ("I", 4), ("d", 8), ("d", 8)):
+            columns.append(self._column(typecode, pos, count))
+            pos += width * count
+        self._ids, self._offsets, self._lengths, self._xs, self._ys = columns
+        self._decoded: Dict[int, Dict] = {} if not mapped else OrderedDict()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._mm is not None:
+            return self._mm[offset:offset + size]
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _view(self, offset: int, size: int) -> memoryview: # zero-copy window into the mapping
+        view = memoryview(self._mm)[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def _column(self, typecode: str, offset: int, count: int): # an index column: a view straight into the mapping when possible
+        size = array(typecode).itemsize * count
+        if self._mm is None or sys.byteorder == "big":
+            return _le_array(typecode, self._read(offset, size))
+        column = self._view(offset, size).cast(typecode)
+        self._views.append(column)
+        return column
+
+    def _recall(self, cache: Dict, key): # a cache hit moves to the back, so the bounded caches drop the least recently used entry
+        value = cache.get(key)
+        if value is not None and self._mm is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _remember(self, cache: Dict, key, value): # bounded cache in mapped mode, so a worker's memory stays flat
+        cache[key] = value
+        if self._mm is not None and len(cache) > MAPPED_NODE_CACHE:
+            cache.popitem(last=False)
+        return value
+
+    def close(self):
+        if self._mm is not None:
+            for view in reversed(self._views): # casts first, then the windows they were cast from
+                view.release()
+            self._views.clear()
+            self._blob = None
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _slot(self, nid) -> int: # position of a node id in the index, or -1
+        if not isinstance(nid, int):
+            return -1
+        i = bisect.bisect_left(self._ids, nid)
+        return i if i < len(self._ids) and self._ids[i] == nid else -1
+
+    def _string(self, index: int) -> str:
+        text = self._recall(self._strings, index)
+        if text is None:
+            if self._blob is None:
+                self._blob = self._read(self._blob_offset, self._string_offsets[-1])
+            text = self._remember(self._strings, index, str(self._blob[self._string_offsets[index]:self._string_offsets[index + 1]], "utf-8"))
+        return text
+
+    def _decode(self, buf: bytes, pos: int):
+        tag = buf[pos]; pos += 1
+        if tag == _BIN_STR:
+            return self._string(_BIN_U32.unpack_from(buf, pos)[0]), pos + 4
+        if tag == _BIN_INT:
+            return _BIN_I64.unpack_from(buf, pos)[0], pos + 8
+        if tag == _BIN_DICT:
+            (n,) = _BIN_U32.unpack_from(buf, pos); pos += 4
+            value = {}
+            for _ in range(n):
+                key = self._string(_BIN_U32.unpack_from(buf, pos)[0])
+                value[key], pos = self._decode(buf, pos + 4)
+            return value, pos
+        if tag == _BIN_LIST:
+            (n,) = _BIN_U32.unpack_from(buf, pos); pos += 4
+            items = []
+            for _ in range(n):
+                item, pos = self._decode(buf, pos)
+                items.append(item)
+            return items, pos
+        if tag == _BIN_FLOAT:
+            return _BIN_F64.unpack_from(buf, pos)[0], pos + 8
+        if tag == _BIN_BIGINT:
+            return int(self._string(_BIN_U32.unpack_from(buf, pos)[0])), pos + 4
+        return (None, False, True)[tag], pos
+
+    def __getitem__(self, nid) -> Dict:
+        node = self._recall(self._decoded, nid)
+        if node is None:
+            i = self._slot(nid)
+            if i < 0:
+                raise KeyError(nid)
+            node = self._remember(self._decoded, nid, self._decode(self._read(self._offsets[i], self._lengths[i]), 0)[0])
+        return node
+
+    def __contains__(self, nid) -> bool:
+        return self._slot(nid) >= 0
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def position(self, nid: int) -> Tuple[float, float]: # a node's x, y straight from the index, without decoding it
+        i = self._slot(nid)
+        if i < 0:
+            raise KeyError(nid)
+        return self._xs[i], self._ys[i]
+
+def load_story_file(path: str) -> Dict: # story data in the save format, from a JSON, binary or .branchdb story file
+    if is_sqlite_story(path):
+        with SqliteStory(path) as story:
+            return story.export_data()
+    if is_binary_story(path):
+        with BinaryStory(path) as story:
+            data = dict(story.meta)
+            data["nodes"] = dict(story.items())
+        return data
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+STREAM_CHUNK_SIZE = 1 << 20 # bytes read at a time by iter_story_json
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+
+def iter_story_json(path: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    # parses a JSON story a node at a time without holding the whole text; yields
+    # ("node", id, data, fraction read) for each node and ("meta", key, value, fraction read) for other top-level keys
+    decoder = json.JSONDecoder()
+    total = os.path.getsize(path) or 1
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    with open(path, "rb") as f:
+        def fill():
+            nonlocal buf, pos, eof
+            raw = f.read(chunk_size)
+            eof = not raw
+            buf = buf[pos:] + utf8.decode(raw, final=eof)
+            pos = 0
+
+        def peek() -> str: # next non-whitespace character ('' at the end)
+            nonlocal pos
+            while True:
+                pos = _JSON_WS.match(buf, pos).end()
+                if pos < len(buf) or eof:
+                    return buf[pos:pos + 1]
+                fill()
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            c = peek()
+            if not c or c not in chars:
+                raise ValueError(f"Malformed story file: expected one of {chars!r} at {f.tell()} bytes")
+            pos += 1
+            return c
+
+        def value():
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    result, end = decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof: # at the very end of the buffer a number could still be cut short
+                        pos = end
+                        return result
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        expect("{")
+        if peek() == "}":
+            return
+        while True:
+            key = value()
+            expect(":")
+            if key == "nodes":
+                expect("{")
+                if peek() != "}":
+                    while True:
+                        nid = value()
+                        expect(":")
+                        node = value()
+                        yield "node", int(nid), node, f.tell() / total
+                        if expect(",}") == "}":
+                            break
+                else:
+                    expect("}")
+            else:
+                yield "meta", key, value(), f.tell() / total
+            if expect(",}") == "}":
+                return
 
-    elif sep == ">>":
-        execute_actions([expr], current_node)
+def iter_story_file(path: str):
+    # iter_story_json events for a JSON, binary or .branchdb story
+    if is_sqlite_story(path):
+        with SqliteStory(path) as story:
+            for key, val in story.meta.items():
+                yield "meta", key, val, 0.0
+            total = len(story) or 1
+            for i, (nid, node) in enumerate(story.rows()):
+                yield "node", nid, node, (i + 1) / total
+        return
+    if not is_binary_story(path):
+        yield from iter_story_json(path)
+        return
+    with BinaryStory(path, mapped=True) as story:
+        for key, val in story.meta.items():
+            yield "meta", key, val, 0.0
+        total = len(story) or 1
+        for i, nid in enumerate(story):
+            yield "node", nid, story[nid], (i + 1) / total
+
+# ------- SQLite project store -------
+# A .branchdb project is an SQLite database (stdlib sqlite3, nothing to install). Each node is a row holding its JSON
+# and position, keyed by node id, so a node (or its position) is one indexed lookup and nothing else has to be read.
+SQLITE_STORY_EXT = ".branchdb"
+SQLITE_NODE_CACHE = 4096 # decoded nodes a SqliteStory keeps around; the least recently used are dropped
+_SQLITE_MAGIC = b"SQLite format 3\0"
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, x REAL, y REAL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS comments (id INTEGER PRIMARY KEY, text TEXT NOT NULL DEFAULT '', x REAL, y REAL, w REAL, h REAL);
+"""
 
-    elif sep == ":":
-        m = re.match(r"<(.+?)>(.*)$", expr.strip())
-        if m:
-            cond_acts, uncond_acts = m.groups()
-            if evaluate_condition(cond_acts.strip(), current_node):
-                execute_actions([cond_acts.strip()], current_node)
-            if uncond_acts.strip():
-                execute_actions([uncond_acts.strip()], current_node)
+def is_sqlite_story(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC
+    except OSError:
+        return False
+
+class SqliteStory(Mapping): # node id -> node dict view of a .branchdb project; rows are paged in through a bounded cache
+    def __init__(self, path: str, cache_size: int = SQLITE_NODE_CACHE):
+        self.path = path
+        self.cache_size = cache_size
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SQLITE_SCHEMA)
+        self._cache: "OrderedDict[int, Dict]" = OrderedDict()
+        self.meta: Dict[str, Any] = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+
+    def close(self):
+        self._cache.clear()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remember(self, nid: int, node: Dict) -> Dict:
+        self._cache[nid] = node
+        self._cache.move_to_end(nid)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return node
+
+    def __getitem__(self, nid) -> Dict:
+        node = self._cache.get(nid)
+        if node is not None:
+            self._cache.move_to_end(nid)
+            return node
+        row = self.conn.execute("SELECT data FROM nodes WHERE id = ?", (nid,)).fetchone()
+        if row is None:
+            raise KeyError(nid)
+        return self._remember(nid, json.loads(row[0]))
+
+    def __contains__(self, nid) -> bool:
+        return nid in self._cache or self.conn.execute("SELECT 1 FROM nodes WHERE id = ?", (nid,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter([nid for (nid,) in self.conn.execute("SELECT id FROM nodes ORDER BY id")])
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def rows(self):
+        # (id, node) for every node in id order, streamed straight from the table without filling the cache
+        for nid, data in self.conn.execute("SELECT id, data FROM nodes ORDER BY id"):
+            yield nid, json.loads(data)
+
+    def position(self, nid: int) -> Tuple[float, float]: # a node's x, y without decoding it
+        row = self.conn.execute("SELECT x, y FROM nodes WHERE id = ?", (nid,)).fetchone()
+        if row is None:
+            raise KeyError(nid)
+        return row
+
+    # --- writes ---
+    def _write_node(self, nid: int, node: Dict):
+        self.conn.execute("INSERT OR REPLACE INTO nodes (id, x, y, data) VALUES (?, ?, ?, ?)",
+                          (nid, node.get("x", 0), node.get("y", 0), json.dumps(node, separators=(",", ":"))))
+
+    def set_meta(self, key: str, value):
+        self.meta[key] = value
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def set_comments(self, story_comments: Dict):
+        self.conn.execute("DELETE FROM comments")
+        self.conn.executemany("INSERT INTO comments (id, text, x, y, w, h) VALUES (?, ?, ?, ?, ?, ?)",
+                              [(int(cid), c.get("text", ""), c.get("x", 0), c.get("y", 0), c.get("w", COMMENT_W), c.get("h", COMMENT_H))
+                               for cid, c in story_comments.items()])
+
+    def comments(self) -> Dict[int, Dict]:
+        return {cid: {"text": text, "x": x, "y": y, "w": w, "h": h}
+                for cid, text, x, y, w, h in self.conn.execute("SELECT id, text, x, y, w, h FROM comments ORDER BY id")}
+
+    def import_data(self, data: Dict): # replaces everything with story data in the save format, in one transaction
+        with self.conn:
+            for table in ("meta", "nodes", "comments"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self._cache.clear()
+            self.meta = {}
+            for key, value in data.items():
+                if key not in ("nodes", "comments"):
+                    self.set_meta(key, value)
+            for nid, node in data.get("nodes", {}).items():
+                self._write_node(int(nid), node)
+            self.set_comments(data.get("comments", {}))
+
+    def export_data(self) -> Dict: # story data in the save format
+        data = dict(self.meta)
+        data["nodes"] = dict(self.rows())
+        story_comments = self.comments()
+        if story_comments:
+            data["comments"] = story_comments
+        return data
+
+def write_story_sqlite(path: str, data: Dict): # saves story data (the JSON save format) as a .branchdb project, atomically
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=SQLITE_STORY_EXT)
+    os.close(fd)
+    try:
+        with SqliteStory(tmp_path) as story:
+            story.import_data(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 NODE_W = 180 # node width
 NODE_H = 80 # node height
+_LAYOUT_CACHE: "OrderedDict[Tuple, str]" = OrderedDict() # truncate_text_to_fit results, keyed by (text, FontRegistry font name, box size); least recently used first
+_LAYOUT_CACHE_MAX = 8192
+LINE_TOKEN_CACHE_MAX = 4096 # options lines whose highlight spans the editor keeps (the cache is emptied when full)
+CULL_MARGIN = 200 # items this far outside the visible canvas area still get drawn, so panning doesn't show pop-in
+CANVAS_SCROLLREGION = (-100000, -100000, 100000, 100000)
+ZOOM_MIN, ZOOM_MAX = 0.05, 3.0
+LOD_FULL, LOD_ID, LOD_DOTS = 0, 1, 2 # level-of-detail tiers: full text, id only, dots with clustered edges
+LOD_ID_ZOOM = 0.6 # below this zoom nodes only show their id
+LOD_DOT_ZOOM = 0.25 # below this zoom nodes are dots and edges are bundled per cluster
+LOD_DOT_RADIUS = 4 # dot radius (canvas px at the zoom the dot was created)
+LOD_CLUSTER_SIZE = 600 # model-space size of the cells edges are bundled into at the dot tier
+LOAD_BATCH = 500 # nodes the loader thread hands to the Tk thread at a time
+LOAD_FRAME_MS = 30 # Tk time spent adding loaded nodes per after() tick
+FONT_LAYOUT = "layout" # FontRegistry tier for fonts that are only measured (text layout), never zoomed
 COMMENT_W, COMMENT_H = 150, 50 # comment width, comment height
 HANDLE_SIZE = 8  # size of draggable corner handles on comments
+_ABSENT = object() # sync_frozen / undo patch value for "this key didn't exist"
 DEFAULT_SETTINGS = {
     "disable_delete_confirm": False,
     "show_path": False,
@@ -643,9 +2687,258 @@ DEFAULT_SETTINGS = {
     'disable_text_truncation': False,
     "autosave_enabled": True,
     "autosave_time": 300,  # in seconds (5 min default)
+    "disable_zooming": False,
+    "undo_memory_mb": 64, # oldest undo steps are dropped past this
     
 }
 
+def lod_tier(zoom: float) -> int: # level-of-detail tier for a zoom level
+    if zoom < LOD_DOT_ZOOM:
+        return LOD_DOTS
+    if zoom < LOD_ID_ZOOM:
+        return LOD_ID
+    return LOD_FULL
+
+class SpatialGrid: # uniform grid over rectangles (nodes, comments) for point and rectangle hit-testing
+    def __init__(self, cell: int = 256):
+        self.cell = cell
+        self.rects: Dict[Any, Tuple[float, float, float, float]] = {}
+        self.cells: Dict[Tuple[int, int], Dict[Any, None]] = {} # (gx, gy) -> keys touching that cell (dict keeps insertion order)
+
+    def _cells(self, x0: float, y0: float, x1: float, y1: float):
+        c = self.cell
+        for gx in range(int(x0 // c), int(x1 // c) + 1):
+            for gy in range(int(y0 // c), int(y1 // c) + 1):
+                yield gx, gy
+
+    def insert(self, key, x0: float, y0: float, x1: float, y1: float): # add or move a rectangle; a no-op if it didn't move
+        rect = (x0, y0, x1, y1)
+        old = self.rects.get(key)
+        if old == rect:
+            return
+        if old is not None:
+            self.remove(key)
+        self.rects[key] = rect
+        for cell in self._cells(*rect):
+            self.cells.setdefault(cell, {})[key] = None
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        for cell in self._cells(*rect):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self.cells[cell]
+
+    def clear(self):
+        self.rects.clear()
+        self.cells.clear()
+
+    def query_point(self, x: float, y: float) -> List: # keys whose rectangle contains (x, y), edges included
+        c = self.cell
+        hits = []
+        for key in self.cells.get((int(x // c), int(y // c)), ()):
+            x0, y0, x1, y1 = self.rects[key]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                hits.append(key)
+        return hits
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float) -> List: # keys whose rectangle overlaps the given one, edges included
+        c = self.cell
+        n_cells = (int(x1 // c) - int(x0 // c) + 1) * (int(y1 // c) - int(y0 // c) + 1)
+        if n_cells > len(self.cells):
+            candidates = self.rects # a huge selection; cheaper to check everything once
+        else:
+            candidates = {}
+            for cell in self._cells(x0, y0, x1, y1):
+                candidates.update(self.cells.get(cell, {}))
+        hits = []
+        for key in candidates:
+            rx0, ry0, rx1, ry1 = self.rects[key]
+            if rx1 >= x0 and rx0 <= x1 and ry1 >= y0 and ry0 <= y1:
+                hits.append(key)
+        return hits
+
+class FontRegistry: # shared tkFont.Font objects keyed by (family, size, tier); canvas items reference them by name
+    def __init__(self):
+        self.fonts: Dict[Tuple[str, int, Any], tkFont.Font] = {}
+        self.zoom = 1.0
+
+    def _scaled(self, size: int, tier) -> int:
+        if tier == FONT_LAYOUT:
+            return size
+        return max(6, int(size * self.zoom))
+
+    def get(self, family: str, size: int, tier=LOD_FULL) -> tkFont.Font: # the font for this spec, created on first use
+        key = (family, size, tier)
+        font = self.fonts.get(key)
+        if font is None:
+            # the name spells out the spec, so it can key caches (see truncate_text_to_fit)
+            font = tkFont.Font(name=f"branch-{family}-{size}-{tier}", family=family, size=self._scaled(size, tier))
+            self.fonts[key] = font
+        elif tier != FONT_LAYOUT and font.cget("size") != self._scaled(size, tier):
+            font.configure(size=self._scaled(size, tier))
+        return font
+
+    def set_zoom(self, zoom: float, tier): # resizes only the current tier's fonts; others catch up in get()
+        self.zoom = zoom
+        for (family, size, font_tier), font in self.fonts.items():
+            if font_tier == tier:
+                font.configure(size=self._scaled(size, tier))
+
+def sync_frozen(live: Dict, frozen: Dict, keys: Optional[set] = None) -> Dict:
+    # brings a deep-copied mirror of `live` up to date; returns {key: old frozen value or _ABSENT} for what changed.
+    # Only `keys` are compared when given (the caller knows nothing else was touched), otherwise everything is.
+    # changed entries are replaced, never modified, so older shallow copies of `frozen` stay valid snapshots
+    changed = {}
+    if keys is None:
+        for key, value in live.items():
+            if key not in frozen:
+                changed[key] = _ABSENT
+            elif frozen[key] != value:
+                changed[key] = frozen[key]
+        for key in frozen.keys() - live.keys():
+            changed[key] = frozen[key]
+    else:
+        for key in keys:
+            if key not in live:
+                if key in frozen:
+                    changed[key] = frozen[key]
+            elif key not in frozen:
+                changed[key] = _ABSENT
+            elif frozen[key] != live[key]:
+                changed[key] = frozen[key]
+    for key in changed:
+        if key in live:
+            frozen[key] = copy.deepcopy(live[key])
+        else:
+            del frozen[key]
+    return changed
+
+def write_atomic(path: str, write: Callable, binary: bool = False): # temp file + fsync + rename: the target is always either the old or the new file
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with (os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_json_atomic(path: str, data, indent=2):
+    write_atomic(path, lambda f: json.dump(data, f, indent=indent))
+
+class BackgroundWriter: # runs file writes on one worker thread, in the order they were queued; results reach the Tk thread through after()
+    def __init__(self, widget: tk.Misc):
+        self.widget = widget
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._results: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pending = 0 # queued writes whose results haven't been delivered yet
+
+    @property
+    def busy(self) -> bool:
+        return self._pending > 0
+
+    def submit(self, write: Callable, args: Tuple, on_done: Optional[Callable[[Optional[Exception]], None]] = None):
+        # queues write(*args); on_done(error or None) is called on the Tk thread once it has run
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._pending += 1
+        self._jobs.put((write, args, on_done))
+        if self._pending == 1:
+            self.widget.after(100, self._poll)
+
+    def flush(self): # waits for every queued write and delivers the results now (before a save replaces what they wrote to)
+        self._jobs.join()
+        self._deliver()
+
+    def _run(self): # runs off the Tk thread; no widget access here
+        while True:
+            write, args, on_done = self._jobs.get()
+            try:
+                write(*args)
+                error = None
+            except Exception as e:
+                error = e
+            self._results.put((on_done, error))
+            self._jobs.task_done()
+
+    def _deliver(self):
+        while True:
+            try:
+                on_done, error = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._pending -= 1
+            if on_done is not None:
+                on_done(error)
+
+    def _poll(self):
+        self._deliver()
+        if self._pending:
+            self.widget.after(100, self._poll)
+
+def journal_path(story_path: str) -> str: # edit journal that sits next to a story file (story.json -> story.json.journal, so story.branchb gets its own)
+    return story_path + ".journal"
+
+def append_journal(path: str, records: List[Dict[str, Any]]): # one compact JSON record per line, fsynced
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def replay_journal(path: str, story: Dict[str, Any]) -> int: # applies a journal to loaded save data in place; returns the number of records applied
+    applied = 0
+    story_nodes = story["nodes"]
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break # a torn last line from a crash mid-append
+            op = record.get("op")
+            if op == "node":
+                story_nodes[record["id"]] = record["data"]
+            elif op == "move":
+                if record["id"] in story_nodes:
+                    story_nodes[record["id"]]["x"] = record["x"]
+                    story_nodes[record["id"]]["y"] = record["y"]
+            elif op == "rename":
+                if record["id"] in story_nodes:
+                    story_nodes[record["to"]] = story_nodes.pop(record["id"])
+            elif op == "del":
+                story_nodes.pop(record["id"], None)
+            elif op == "vars":
+                story["vars_store"] = record["vars"]
+                story["inventory"] = record["inventory"]
+            elif op == "start":
+                story["start_node"] = record["id"]
+            else:
+                continue
+            applied += 1
+    return applied
+
+def changed_line_range(old: List[str], new: List[str]) -> Tuple[int, int]:
+    # [first, last) range of `new` that differs from `old`, found by trimming the common prefix and suffix
+    first, limit = 0, min(len(old), len(new))
+    while first < limit and old[first] == new[first]:
+        first += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > first and new_end > first and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1; new_end -= 1
+    return first, new_end
+
 class VisualEditor(tk.Frame):
     def make_collapsible_section(self, parent, title): # makes a collpasible section, such as what you see in the Node Inspector.
         container = tk.Frame(parent, bg=self.theme['inspector_container'])
@@ -691,26 +2984,40 @@ class VisualEditor(tk.Frame):
         self.selected_node: Optional[int] = None
         self.dragging = False
         self.drag_offset = (0,0)
-        self.node_base_fonts: Dict[int, tkFont.Font] = {}  
-        self.current_zoom = 1.0 # all zoom features are commented out due to bugs that will be worked on in the future.
+        self.fonts = FontRegistry() # node/comment text fonts, shared by every item and resized on zoom
+        self.current_zoom = 1.0 # canvas coords = model coords * current_zoom
+        self.lod_tier = LOD_FULL
         self.multi_select_rect = None
         self.multi_selected_nodes = set() # set of multi selected nodes
-        self.undo_stack = [] # undo stack, or 'undo list'
+        self.undo_stack = [] # undo stack, or 'undo list'; entries hold inverse patches, not snapshots
+        self._undo_base = None # copy of the story as of the last undo boundary, diffed to build patches
+        self._undo_open = False # the top undo entry is still collecting changes
+        self._undo_txn = False # a begin_undo() transaction (a drag, a batch edit) owns the open entry
+        self._undo_typing = None # what the open entry is collecting inspector typing for, if anything
+        self._journal_pending: List[Dict[str, Any]] = [] # edit journal records not yet on disk
+        self._journal_start = START_NODE # start node as of the last journal record / save
+        self.writer = BackgroundWriter(self) # journal appends (autosave) run here, off the Tk thread
+        self._save_generation = 0 # bumped whenever the journal is compacted or replaced (save, load)
         self._highlight_job = None # For debouncing syntax highlighting
+        self._highlight_lines: Optional[List[str]] = None # options lines as of the last highlight pass (None: re-tag everything)
+        self._highlight_dirty: set = set() # lines the cursor was on when edited; re-tagged even if their text came back the same (cut + paste)
         self.theme = {} # define 'self.theme' for later use
-        self.editor_vars_backup = None
-        self.play_timer_job = None
-        self.play_lifetime_jobs = []
-        self.lifetime_start_times = {}
-        self.last_rendered_node = None        
-        self.editor_inventory_backup = None
-        self.nodes_backup = None
+        self.play_engine: Optional[StoryEngine] = None
+        self.play_session: Optional[PlaySession] = None
+        self.play_tick_job = None
+        self.play_tick_time = 0.0
 
         # --- comment system state ---
         self.selected_comment = None
         self.resizing_comment = False
         self.comment_rects = {}
         self.comment_texts = {}
+        self.comment_wraps: Dict[float, int] = {} # comment width -> drawn comment texts tagged 'wrap_<width>', so set_zoom can rewrap them per width
+
+        # spatial indexes (model coordinates), kept in sync by redraw()
+        self.node_grid = SpatialGrid()
+        self.comment_grid = SpatialGrid()
+        self.edge_grid = SpatialGrid(cell=1024) # every (low id, high id) node pair with an edge, drawn or not, by the box around both nodes
 
         # load theme.json if existing, otherwise, load 'default' theme.
         if not os.path.exists(THEME_PATH):
@@ -761,6 +3068,9 @@ class VisualEditor(tk.Frame):
         # Node Counter
         self.node_count_label = ctk.CTkLabel(self.toolbar, text="Nodes: 0", text_color='#ffffff')
         self.node_count_label.pack(side='right', padx=6)
+        self.load_progress = ttk.Progressbar(self.toolbar, length=120, maximum=1.0) # shown while a story loads
+        self._load_token = 0 # bumped per load; a loader thread whose token is stale stops
+        self._load_snapshot: Optional[Dict[str, Any]] = None # the story that was open before a load, put back if the load fails
 
         # default settings
         self.settings = DEFAULT_SETTINGS.copy()
@@ -781,6 +3091,15 @@ class VisualEditor(tk.Frame):
         )
         self.new_story_btn.pack(side="left")
 
+        self.problems_btn = ctk.CTkButton(
+            self.toolbar, text="Check Story",
+            command=self.open_problems_panel, width=90, height=25,
+            fg_color="gray25", hover_color="gray35"
+        )
+        self.problems_btn.pack(side="left")
+        self.problems_win: Optional[tk.Toplevel] = None
+        self._lint_token = 0 # bumped per lint run; results from an older run are dropped
+
         self.versiondisp = ctk.CTkLabel(self.toolbar, text=f'{VERSION} |', text_color='#ffffff').pack(side='right')
 
         self.menubar = tk.Menu(self.master)
@@ -802,6 +3121,15 @@ class VisualEditor(tk.Frame):
         self.app_menu.add_command(label="Quit", command=self.master.quit)
         self.app_menu.add_separator()
         self.app_menu.add_command(label="Clear all nodes.", command=self.reset_all)
+
+        # Analyze Menu
+        self.show_unreachable = tk.BooleanVar(value=False)
+        self.unreachable_nodes: set = set() # outlined on the canvas while show_unreachable is on
+        self._graph_cache: Dict[int, Tuple] = {} # node_exits per undo-base node, reused by analyze_graph
+        self.analyze_menu = tk.Menu(self.menubar, tearoff=0)
+        self.menubar.add_cascade(label="Analyze", menu=self.analyze_menu)
+        self.analyze_menu.add_checkbutton(label="Highlight Unreachable Nodes", variable=self.show_unreachable, command=self.update_reachability)
+        self.analyze_menu.add_command(label="Story Graph Report", command=self.show_graph_report)
          
         self.paned = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
         self.paned.pack(fill=tk.BOTH, expand=True)
@@ -809,7 +3137,7 @@ class VisualEditor(tk.Frame):
         # Canvas Frame Definition
         canvas_frame = tk.Frame(self.paned)
         self.canvas = tk.Canvas(canvas_frame, bg='#101010', width=900, height=600,
-                                scrollregion=(-100000,-100000,100000,100000))
+                                scrollregion=CANVAS_SCROLLREGION)
         self.canvas.pack(fill=tk.BOTH, expand=True)
 
         # Node Menu (right clicking on a node)
@@ -920,6 +3248,9 @@ class VisualEditor(tk.Frame):
 
         # Canvas Keybinds
         self.canvas.bind("<ButtonPress-2>", self.start_pan)
+        self.canvas.bind("<Control-MouseWheel>", self.canvas_zoom)
+        self.canvas.bind("<Control-Button-4>", self.canvas_zoom)
+        self.canvas.bind("<Control-Button-5>", self.canvas_zoom)
         self.canvas.bind("<B2-Motion>", self.do_pan)
         self.canvas.tag_bind("node", "<Button-3>", self.node_right_click)
         self.canvas.bind("<Shift-ButtonPress-1>", self.multi_select_start)
@@ -953,7 +3284,14 @@ class VisualEditor(tk.Frame):
         # Define nodes and edges initally
         self.node_rects: Dict[int, int] = {}
         self.node_texts: Dict[int, int] = {}
-        self.edge_items: List[int] = []
+        self.edge_items: Dict[Tuple[int, int], List[int]] = {} # (low id, high id) -> line items between the two nodes
+        self.node_scene: Dict[int, Tuple] = {} # what each node's items last showed, see redraw()
+        self.edge_scene: Dict[Tuple[int, int], Tuple] = {}
+        self.comment_scene: Dict[int, Tuple] = {}
+        self.cluster_edges: Dict[Tuple, Tuple[int, int]] = {} # dot tier: cell pair -> (line item, width)
+        self.view_rect = (0.0, 0.0, 0.0, 0.0)
+        self._viewport_job = None
+        self.canvas.bind("<Configure>", self.schedule_viewport_update, add="+")
 
         # Load theme.json if the path exists, otherwise, load 'default' theme.
         if not os.path.exists(THEME_PATH):
@@ -983,33 +3321,66 @@ class VisualEditor(tk.Frame):
             interval = max(30, int(self.settings.get("autosave_time", 300)))  # min 30s
             self.after(interval * 1000, self.autosave)
             
-    def autosave(self):
-        global CURRENT_FILE
-        if CURRENT_FILE:  # only if project has a file
-            try:
-                data = {
-                    "nodes": nodes,
-                    "vars_store": vars_store,
-                    "inventory": inventory
-                }
-                # make autosave path
-                base, ext = os.path.splitext(CURRENT_FILE)
-                autosave_path = base + ".autosave.json"
-
-                with open(autosave_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=2)
-
-                self.show_toast(f"Autosaved : {os.path.basename(autosave_path)}", color="green")
-
-            except Exception as e:
-                self.show_toast(f"Autosave failed: {e}", color="red")
+    def autosave(self): # appends the edits since the last one to the story's journal, on a worker thread
+        if CURRENT_FILE and not self.writer.busy:  # only if project has a file (and the last write finished)
+            if not self._undo_txn:
+                self._close_undo_entry() # so a half-finished undo step's edits are journaled too
+            records = self._journal_pending
+            if START_NODE != self._journal_start:
+                records.append({"op": "start", "id": START_NODE})
+                self._journal_start = START_NODE
+            if records:
+                self._journal_pending = []
+                path = journal_path(CURRENT_FILE)
+                generation = self._save_generation
+                self.writer.submit(append_journal, (path, records), lambda error: self._autosave_done(path, records, generation, error))
 
         self.schedule_autosave()  # reschedule
 
+    def _journal_patch(self, patch: Dict[str, Any]): # queues journal records for what an undo patch says changed (the base holds the new values)
+        # comments aren't part of a saved story (saves hold nodes, variables, inventory and the start node), so the
+        # journal doesn't cover them either; comment edits are only undoable
+        if not CURRENT_FILE:
+            return
+        current = self._undo_base["nodes"]
+        records = []
+        added, removed = {}, {}
+        for nid, old in patch.get("nodes", {}).items():
+            new = current.get(nid, _ABSENT)
+            if new is _ABSENT:
+                removed[nid] = old
+            elif old is _ABSENT:
+                added[nid] = new
+            elif {**old, "x": new.get("x"), "y": new.get("y")} == new:
+                records.append({"op": "move", "id": nid, "x": new.get("x"), "y": new.get("y")})
+            else:
+                records.append({"op": "node", "id": nid, "data": new})
+        for old_id, old in list(removed.items()):
+            for new_id, new in added.items():
+                if new == old:
+                    records.append({"op": "rename", "id": old_id, "to": new_id})
+                    del removed[old_id], added[new_id]
+                    break
+        records.extend({"op": "node", "id": nid, "data": new} for nid, new in added.items())
+        records.extend({"op": "del", "id": nid} for nid in removed)
+        if "vars" in patch or "inventory" in patch:
+            records.append({"op": "vars", "vars": self._undo_base["vars"], "inventory": self._undo_base["inventory"]})
+        self._journal_pending.extend(records)
+
+    def _autosave_done(self, path: str, records: List[Dict[str, Any]], generation: int, error: Optional[Exception]):
+        if error is None:
+            self.show_toast(f"Autosaved : {os.path.basename(path)}", color="green")
+        else:
+            # retried on the next autosave, unless a save has since written those edits (and newer ones) to the story file
+            if path == journal_path(CURRENT_FILE or "") and generation == self._save_generation:
+                self._journal_pending[:0] = records
+            self.show_toast(f"Autosave failed: {error}", color="red")
+
     def new_story(self):
         global CURRENT_FILE
         if messagebox.askyesno("New Story", "Start a new story? Unsaved changes will be lost."):
             nodes.clear(); vars_store.clear(); inventory.clear()
+            story_graph.rebuild(nodes)
             CURRENT_FILE = None  # reset file path
             self.redraw()
         self.update_title()                
@@ -1030,28 +3401,32 @@ class VisualEditor(tk.Frame):
         self.redraw()
 
     def start_canvas_or_comment(self, event):
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        self.moving_comment = None
-        for cid, data in comments.items():
-            w, h = data.get("w", COMMENT_W), data.get("h", COMMENT_H)
-            if data["x"] <= x <= data["x"] + w and data["y"] <= y <= data["y"] + h:
-                self.moving_comment = cid
-                self.comment_drag_start = (x, y)
-                self.comment_orig_pos = (data["x"], data["y"])
-                break
+        x, y = self.event_to_model(event)
+        self.moving_comment = self.get_comment_at(*self.model_to_canvas(x, y))
+        if self.moving_comment is not None:
+            data = comments[self.moving_comment]
+            self.comment_drag_start = (x, y)
+            self.comment_orig_pos = (data["x"], data["y"])
+
+    def event_to_model(self, event) -> Tuple[float, float]: # mouse event -> story (model) coordinates
+        scale = self.current_zoom
+        return self.canvas.canvasx(event.x) / scale, self.canvas.canvasy(event.y) / scale
+
+    def model_to_canvas(self, x: float, y: float) -> Tuple[float, float]:
+        return x * self.current_zoom, y * self.current_zoom
 
     def move_comment(self, event):
         if self.moving_comment is None:
             return
         cid = self.moving_comment
         data = comments[cid]
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        x, y = self.event_to_model(event)
         dx = x - self.comment_drag_start[0]
         dy = y - self.comment_drag_start[1]
         orig_x, orig_y = self.comment_orig_pos
         data["x"] = orig_x + dx
         data["y"] = orig_y + dy
-        self.redraw()
+        self.refresh_comment(cid)
 
     def stop_moving_comment(self, event):
         self.moving_comment = None
@@ -1079,11 +3454,10 @@ class VisualEditor(tk.Frame):
         self.apply_vars_text()
 
     def change_every_node_color(self, color: str):
-        self.push_undo()
-        targets = nodes
-        for nid in targets:
-            if nid is not None:
+        with self.undo_transaction():
+            for nid in nodes:
                 nodes[nid]["color"] = color
+                story_graph.touch(nid)
         self.redraw()        
 
     def themepreset(self, preset: str, changetype=None):
@@ -1592,9 +3966,10 @@ class VisualEditor(tk.Frame):
         self.canvas.focus_set()
 
     def reset_all(self):
-        if messagebox.askyesno('Reset All?', f'Continuing will delete all {len(self.node_rects)} nodes. Are you SURE?'):
+        if messagebox.askyesno('Reset All?', f'Continuing will delete all {len(nodes)} nodes. Are you SURE?'):
             self.push_undo()
             nodes.clear(); vars_store.clear(); inventory.clear()
+            story_graph.rebuild(nodes)
             self.redraw()
 
     def apply_keybinds(self):
@@ -1676,69 +4051,20 @@ class VisualEditor(tk.Frame):
                                     command=lambda: self.settings.update({"autosave_enabled": autosave_enabled_var.get()}))
         chk_autosave.pack(anchor="w", pady=2, padx=4)
 
+        # Undo Settings
+        tk.Label(win, text="Undo memory (MB):").pack(anchor="w", padx=4, pady=(10,0))
+        undo_mem_var = tk.StringVar(value=str(self.settings.get("undo_memory_mb", 64)))
+        tk.Entry(win, textvariable=undo_mem_var).pack(anchor="w", padx=4)
 
-    def is_valid_action(self, s: str) -> bool:
-        s = s.strip()
-        if not s: return True
-
-        # Check against known action patterns
-        if re.match(r"^if\(", s): return True
-        if s.startswith("chance(") and s.endswith(")"): return True
-        if s.startswith("weighted(") and s.endswith(")"): return True
-        if s.startswith("randr(") and s.endswith(")"): return True
-        if s.startswith("rands(") and s.endswith(")"): return True
-        if s.startswith("clamp(") and s.endswith(")"): return True
-        if s.startswith("consume(") and s.endswith(")"): return True
-        if s.startswith("rlet:"): return True
-        if s == "clearinv": return True
-        # Assignment: var=... var+=...
-        if re.match(r"^[A-Za-z_][A-Za-z0-9_]*\s*([\+\-\*/]?=)", s): return True
-        
-        # Check for keyword:value patterns
-        m = self.error_pattern.match(s)
-        if m:
-            keyword = m.group(1)
-            # Only certain keywords are valid as top-level actions
-            return keyword in {'add_item', 'remove_item', 'goto', 'once', 'repeat', 'set'}
-        
-        return False
-
-    def highlight_line_errors(self, line: str, line_num: int):
-        stripped_line = line.strip()
-        if not stripped_line or stripped_line.startswith('#'):
-            return
+        def save_undo_memory():
+            try:
+                self.settings["undo_memory_mb"] = max(1, int(undo_mem_var.get()))
+            except ValueError:
+                self.settings["undo_memory_mb"] = 64
+            self._trim_undo()
 
-        # --- Check 1: Too many pipe separators ---
-        if line.count('|') > 3:
-            self.options_text.tag_add("syntax_error", f"{line_num}.0", f"{line_num}.{len(line)}")
-            return
+        tk.Button(win, text="Apply", command=save_undo_memory).pack(anchor="w", padx=4, pady=(2,8))
 
-        # --- Check 2: Unbalanced brackets/parentheses ---
-        stack = []
-        pairs = {'(': ')', '[': ']', '{': '}'}
-        for idx, char in enumerate(line):
-            if char in pairs:
-                stack.append((char, idx))
-            elif char in pairs.values():
-                if not stack or pairs[stack.pop()[0]] != char:
-                    self.options_text.tag_add("syntax_error", f"{line_num}.{idx}", f"{line_num}.{idx+1}")
-        for _, idx in stack: # Highlight unclosed opening brackets
-            self.options_text.tag_add("syntax_error", f"{line_num}.{idx}", f"{line_num}.{idx+1}")
-
-        # --- Check 3: Invalid actions in the action part ---
-        parts = line.split('|')
-        if len(parts) > 3:
-            actions_string = parts[3]
-            pipe_indices = [i for i, char in enumerate(line) if char == '|']
-            if len(pipe_indices) >= 3:
-                actions_start_index = pipe_indices[2] + 1
-                for match in re.finditer(r'[^;&]+', actions_string):
-                    action = match.group(0).strip()
-                    if not action: continue
-                    
-                    if not self.is_valid_action(action):
-                        start, end = match.span()
-                        self.options_text.tag_add("syntax_error", f"{line_num}.{actions_start_index + start}", f"{line_num}.{actions_start_index + end}")
 
     def _configure_syntax_highlighting(self):
         self.syntax_tags = [
@@ -1759,26 +4085,15 @@ class VisualEditor(tk.Frame):
         self.options_text.tag_configure("syntax_error", foreground=self.theme.get("syntax_error", "#f44747"), underline=True)
         self.options_text.tag_configure("syntax_function_name", foreground=self.theme.get("syntax_variable", "#9cdcfe")) # Use variable color for function names
         
-        self.known_keywords = {
-            'if', 'once', 'repeat', 'chance', 'weighted', 'randr', 'rands', 'goto',
-            'add_item', 'remove_item', 'clearinv', 'set', 'not_has_item', 'has_item',
-            'clamp', 'consume', 'rlet', 'hlet'
+        # tokenize_line token kind -> tag
+        self.token_tags = {
+            "comment": "syntax_comment", "variable": "syntax_variable", "function": "syntax_function_name",
+            "string": "syntax_string", "keyword": "syntax_keyword", "number": "syntax_number",
+            "separator": "syntax_separator", "operator": "syntax_operator",
         }
         
-        # Patterns for highlighting. Order matters.
-        self.highlight_patterns = [
-            ("syntax_comment", re.compile(r'#.*')),
-            ("syntax_variable", re.compile(r'\{[A-Za-z_][A-Za-z0-9_]*\}')),
-            ("syntax_function_name_pattern", re.compile(r'&([A-Za-z_][A-Za-z0-9_]*)\(')),
-            ("syntax_string", re.compile(r'"[^"]*"|\'[^\']*\'')),
-            ("syntax_keyword", re.compile(r'\b(' + '|'.join(self.known_keywords) + r')\b')),
-            ("syntax_number", re.compile(r'\b-?\d+(\.\d+)?\b')),
-            ("syntax_separator", re.compile(r'\||>>?|[:&;()]')),
-            ("syntax_operator", re.compile(r'[\+\-\*/]?=')),
-        ]
-        
-        self.error_pattern = re.compile(r'\b([a-zA-Z_]+)(?=:)\b')
-        self.known_action_prefixes = {'add_item', 'remove_item', 'goto', 'once', 'repeat', 'set', 'var', 'has_item', 'not_has_item', 'weighted', 'randr', 'rands', 'clamp', 'consume', 'rlet', 'hlet'}
+        self._line_token_cache: Dict[str, List[Tuple[str, int, int]]] = {} # options line text -> its (tag, start, end) spans
+        self._line_token_version = ACTION_REGISTRY_VERSION # registry the cached spans were parsed with
 
         # Bind events
         self.options_text.bind("<<Modified>>", self._schedule_highlight, add="+")
@@ -1792,31 +4107,55 @@ class VisualEditor(tk.Frame):
         if self.options_text.edit_modified():
             # Reset the flag so we can catch the next modification.
             self.options_text.edit_modified(False)
+            self._highlight_dirty.add(int(self.options_text.index("insert").split(".")[0]))
             
             # Debounce the actual highlighting work.
             if self._highlight_job:
                 self.after_cancel(self._highlight_job)
             self._highlight_job = self.after(150, self._highlight_syntax)
 
+    def _line_tokens(self, line: str) -> List[Tuple[str, int, int]]: # (tag, start, end) spans of one options line, cached by its text
+        tokens = self._line_token_cache.get(line)
+        if tokens is None:
+            syntax = parse_option_syntax(line) # one tokenize + parse gives both the colors and the errors
+            tokens = [(self.token_tags[kind], start, end) for kind, start, end in syntax.tokens if kind in self.token_tags]
+            tokens.extend(("syntax_error", start, end) for start, end, _ in syntax.errors)
+            if len(self._line_token_cache) >= LINE_TOKEN_CACHE_MAX:
+                self._line_token_cache.clear()
+            self._line_token_cache[line] = tokens
+        return tokens
+
     def _highlight_syntax(self):
+        # re-tags only the lines that changed since the last pass; lines are tokenized on their own, so an edit never affects other lines
         if not self.options_text.winfo_exists(): return
         self._highlight_job = None
-        
+
+        lines = self.options_text.get("1.0", "end-1c").split("\n")
+        if self._line_token_version != ACTION_REGISTRY_VERSION:
+            # an action was registered since the spans were cached: any line may parse differently now
+            self._line_token_cache.clear()
+            self._line_token_version = ACTION_REGISTRY_VERSION
+            self._highlight_lines = None
+        if self._highlight_lines is None:
+            first, last = 0, len(lines)
+        else:
+            first, last = changed_line_range(self._highlight_lines, lines)
+            for line_num in self._highlight_dirty:
+                if line_num <= len(lines):
+                    first, last = (min(first, line_num - 1), max(last, line_num)) if first < last else (line_num - 1, line_num)
+        self._highlight_lines = lines
+        self._highlight_dirty.clear()
+        if first >= last:
+            return
+
         for tag in self.syntax_tags:
-            self.options_text.tag_remove(tag, "1.0", "end")
-
-        for i, line in enumerate(self.options_text.get("1.0", "end-1c").splitlines()):
-            line_num = i + 1
-            for tag, pattern in self.highlight_patterns:
-                for match in pattern.finditer(line):
-                    if tag == "syntax_function_name_pattern":
-                        # Apply 'syntax_function_name' tag to the captured group (the function name)
-                        func_name_start, func_name_end = match.span(1)
-                        self.options_text.tag_add("syntax_function_name", f"{line_num}.{func_name_start}", f"{line_num}.{func_name_end}")
-                    else:
-                        start, end = match.span()
-                        self.options_text.tag_add(tag, f"{line_num}.{start}", f"{line_num}.{end}")
-            self.highlight_line_errors(line, line_num)
+            self.options_text.tag_remove(tag, f"{first + 1}.0", f"{last + 1}.0")
+        spans: Dict[str, List[str]] = {}
+        for line_num in range(first + 1, last + 1):
+            for tag, start, end in self._line_tokens(lines[line_num - 1]):
+                spans.setdefault(tag, []).extend((f"{line_num}.{start}", f"{line_num}.{end}"))
+        for tag, indexes in spans.items():
+            self.options_text.tag_add(tag, *indexes)
 
     def open_themecontrol(self):
         self.win = tk.Toplevel(self)
@@ -1839,7 +4178,7 @@ class VisualEditor(tk.Frame):
         tk.Button(self.win, text='90s', command=lambda: self.themepreset('90s', 1)).pack(side=tk.TOP, pady=4)
 
     def update_node_count(self):
-        self.node_count_label.configure(text=f"Nodes: {len(self.node_rects)}")
+        self.node_count_label.configure(text=f"Nodes: {len(nodes)}")
 
     def save_theme(self):
         try:
@@ -1880,7 +4219,7 @@ class VisualEditor(tk.Frame):
     def add_node_prompt(self):
         self._apply_pending_inspector_edits()
         w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
-        x, y = self.canvas.canvasx(w / 2), self.canvas.canvasy(h / 2)        
+        x, y = self.canvas.canvasx(w / 2) / self.current_zoom, self.canvas.canvasy(h / 2) / self.current_zoom
         nid = simpledialog.askinteger("Add Node", "Node ID (int):", minvalue=1)
         if nid is None:
             return
@@ -1888,6 +4227,7 @@ class VisualEditor(tk.Frame):
             if not messagebox.askyesno("Overwrite?", f"Node {nid} exists — overwrite?"):
                 return
         self.selected_node = nid
+        self.push_undo()
 
         # Color logic
         if self.settings.get('udtdnc', False) == False:
@@ -1903,69 +4243,187 @@ class VisualEditor(tk.Frame):
             "options": [],
             "color": color     
         }
+        story_graph.update_node(nid)
         #create_node(nid, f'Node {nid}', x, y, )
-        self.push_undo()
         self.redraw()
 
-    def push_undo(self):
-        state = {
-            "nodes": copy.deepcopy(nodes),
-            "vars": vars_store.copy(),
-            "inventory": inventory.copy(),
-            "comments": copy.deepcopy(comments),
+    def _undo_diff(self) -> Dict[str, Any]: # old values of whatever changed since the last undo boundary; moves the base up to now
+        base = self._undo_base
+        touched = story_graph.take_touched() # every node edit goes through update_node() or touch()
+        if base is None:
+            self._undo_base = {"nodes": copy.deepcopy(nodes), "comments": copy.deepcopy(comments),
+                               "vars": vars_store.copy(), "inventory": inventory.copy()}
+            return {}
+        patch: Dict[str, Any] = {}
+        for name, live in (("nodes", nodes), ("comments", comments)):
+            changed = sync_frozen(live, base[name], touched if name == "nodes" else None)
+            if changed:
+                patch[name] = changed
+        if base["vars"] != vars_store:
+            patch["vars"] = base["vars"]
+            base["vars"] = vars_store.copy()
+        if base["inventory"] != inventory:
+            patch["inventory"] = base["inventory"]
+            base["inventory"] = inventory.copy()
+        return patch
+
+    def _apply_undo_patch(self, patch: Dict[str, Any]) -> Dict[str, Any]: # restores a patch's old values; returns the patch that reverses it
+        base = self._undo_base
+        inverse: Dict[str, Any] = {}
+        for name, live in (("nodes", nodes), ("comments", comments)):
+            changes = patch.get(name)
+            if not changes:
+                continue
+            old = base[name]
+            inverse[name] = {key: old.get(key, _ABSENT) for key in changes}
+            for key, value in changes.items():
+                # patch values are shared with the base and other entries; the live dicts only ever get copies
+                if value is _ABSENT:
+                    live.pop(key, None)
+                    old.pop(key, None)
+                else:
+                    live[key] = copy.deepcopy(value)
+                    old[key] = value
+                if name == "nodes":
+                    story_graph.update_node(key)
+        if "vars" in patch:
+            inverse["vars"] = base["vars"]
+            base["vars"] = patch["vars"]
+            vars_store.clear(); vars_store.update(patch["vars"])
+        if "inventory" in patch:
+            inverse["inventory"] = base["inventory"]
+            base["inventory"] = patch["inventory"]
+            inventory[:] = patch["inventory"]
+        self._journal_patch(inverse)
+        return inverse
+
+    @staticmethod
+    def _merge_undo_patches(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]: # second wins where both touch the same thing
+        merged = {**first, **second}
+        for name in ("nodes", "comments"):
+            if name in first and name in second:
+                merged[name] = {**first[name], **second[name]}
+        return merged
+
+    @staticmethod
+    def _undo_patch_size(patch: Dict[str, Any]) -> int: # rough bytes held by a patch
+        size = 64
+        for name, changes in patch.items():
+            values = changes.values() if name in ("nodes", "comments") else [changes]
+            for value in values:
+                size += 16 if value is _ABSENT else len(repr(value))
+        return size
+
+    def _close_undo_entry(self): # the open entry (if any) becomes "everything changed since push_undo"
+        patch = self._undo_diff()
+        self._undo_txn = False
+        if self._undo_open:
+            self._undo_open = False
+            if not patch:
+                # nothing changed (a click without a drag): no undo step, and redo history survives
+                self.undo_stack.pop()
+                return patch
+            entry = self.undo_stack[-1]
+            entry["patch"] = patch
+            entry["size"] = self._undo_patch_size(patch)
+            self.redo_stack.clear()
+            self._journal_patch(patch)
+        elif patch:
+            # untracked edits (no push_undo) get reverted by the next undo or redo, like restoring a snapshot would
+            for stack in (self.undo_stack, self.redo_stack):
+                if stack:
+                    entry = stack[-1]
+                    entry["patch"] = self._merge_undo_patches(patch, entry["patch"])
+                    entry["size"] = self._undo_patch_size(entry["patch"])
+            self._journal_patch(patch)
+        if patch and self.show_unreachable.get():
+            self._refresh_reachability()
+        return patch
+
+    def _trim_undo(self): # drops the oldest entries once the stack is over the memory cap
+        cap = float(self.settings.get("undo_memory_mb", 64)) * 1024 * 1024
+        total = sum(entry["size"] for entry in self.undo_stack)
+        while total > cap and len(self.undo_stack) > 1:
+            total -= self.undo_stack.pop(0)["size"]
+
+    def push_undo(self): # marks the start of an undoable change; its patch is worked out at the next boundary
+        if self._undo_txn:
+            return # part of the open transaction
+        self._close_undo_entry()
+        self._trim_undo()
+        self.undo_stack.append({
+            "patch": {},
+            "size": 64,
             "selected_node": self.selected_node,
             "selected_comment": self.selected_comment
-        }
-        self.undo_stack.append(state)
-        self.redo_stack.clear()
+        })
+        self._undo_open = True
+        self._undo_typing = None
+
+    def begin_undo(self) -> bool: # opens a transaction: everything up to end_undo() is one undo step; False if one is already open
+        if self._undo_txn:
+            return False
+        self.push_undo()
+        self._undo_txn = True
+        return True
+
+    def end_undo(self): # closes the transaction; if nothing changed it leaves no undo step behind
+        if self._undo_txn:
+            self._close_undo_entry()
+
+    @contextmanager
+    def undo_transaction(self): # with-block form of begin_undo/end_undo for batch edits; joins an outer transaction
+        began = self.begin_undo()
+        try:
+            yield
+        finally:
+            if began:
+                self.end_undo()
+
+    def _typing_undo(self, target): # consecutive inspector edits to the same node/comment/vars coalesce into one step
+        if self._undo_open and self._undo_typing == target:
+            return
+        self.push_undo()
+        if not self._undo_txn:
+            self._undo_typing = target
 
     def undo(self):
-        global nodes, vars_store, inventory, comments
+        # changes made since the entry was recorded (including untracked ones) are undone with it
+        self._close_undo_entry()
         if not self.undo_stack:
             return
-        
+
+        state = self.undo_stack.pop()
+        inverse = self._apply_undo_patch(state["patch"])
+
         # save current state to redo
         self.redo_stack.append({
-            "nodes": copy.deepcopy(nodes),
-            "vars": vars_store.copy(),
-            "inventory": inventory.copy(),
-            "comments": copy.deepcopy(comments),
+            "patch": inverse,
+            "size": self._undo_patch_size(inverse),
             "selected_node": self.selected_node,
             "selected_comment": self.selected_comment
         })
-
-        # restore undo state
-        state = self.undo_stack.pop()
-        nodes = {int(k): v for k, v in state["nodes"].items()}
-        vars_store = state["vars"]
-        inventory[:] = state["inventory"]
-        comments = {int(k): v for k, v in state["comments"].items()}
         self.selected_node = state["selected_node"]
         self.selected_comment = state["selected_comment"]
 
         self.redraw()
 
     def redo(self):
-        global nodes, vars_store, inventory, comments
+        self._close_undo_entry()
         if not self.redo_stack:
             return
-        
+
+        state = self.redo_stack.pop()
+        inverse = self._apply_undo_patch(state["patch"])
+
         # save current state to undo
         self.undo_stack.append({
-            "nodes": copy.deepcopy(nodes),
-            "vars": vars_store.copy(),
-            "inventory": inventory.copy(),
-            "comments": copy.deepcopy(comments),
+            "patch": inverse,
+            "size": self._undo_patch_size(inverse),
             "selected_node": self.selected_node,
             "selected_comment": self.selected_comment
         })
-
-        # restore redo state
-        state = self.redo_stack.pop()
-        nodes = {int(k): v for k, v in state["nodes"].items()}
-        vars_store = state["vars"]
-        inventory[:] = state["inventory"]
-        comments = {int(k): v for k, v in state["comments"].items()}
+        self._trim_undo()
         self.selected_node = state["selected_node"]
         self.selected_comment = state["selected_comment"]
 
@@ -1978,11 +4436,16 @@ class VisualEditor(tk.Frame):
         canvas_w = self.canvas.winfo_width()
         canvas_h = self.canvas.winfo_height()
 
-        bbox = self.canvas.bbox("all")
-        if not bbox:
+        # content bounds come from the spatial indexes; off-screen items have no canvas items to measure
+        scale = self.current_zoom
+        rects = list(self.node_grid.rects.values()) + list(self.comment_grid.rects.values())
+        if not rects:
             return
 
-        left, top, right, bottom = bbox
+        left = min(r[0] for r in rects) * scale
+        top = min(r[1] for r in rects) * scale
+        right = max(r[2] for r in rects) * scale
+        bottom = max(r[3] for r in rects) * scale
         total_w = right - left
         total_h = bottom - top
 
@@ -2019,13 +4482,124 @@ class VisualEditor(tk.Frame):
 
         self.canvas.xview_moveto(frac_x)
         self.canvas.yview_moveto(frac_y)
+        self.update_viewport()
+
+    def open_problems_panel(self): # the Problems window; (re)checks the whole story each time it's opened
+        if self.problems_win is None or not self.problems_win.winfo_exists():
+            win = self.problems_win = tk.Toplevel(self)
+            win.title("Problems")
+            win.geometry("760x320")
+            top = tk.Frame(win)
+            top.pack(fill="x")
+            tk.Button(top, text="Check Again", command=self.run_story_lint).pack(side="left", padx=4, pady=4)
+            self.problems_status = tk.Label(top, text="", anchor="w")
+            self.problems_status.pack(side="left", fill="x", expand=True, padx=4)
+
+            body = tk.Frame(win)
+            body.pack(fill="both", expand=True)
+            tree = self.problems_tree = ttk.Treeview(body, columns=("node", "line", "severity", "message"), show="headings")
+            for col, width in (("node", 60), ("line", 50), ("severity", 70), ("message", 560)):
+                tree.heading(col, text=col.title())
+                tree.column(col, width=width, stretch=(col == "message"))
+            scroll = ttk.Scrollbar(body, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scroll.set)
+            scroll.pack(side="right", fill="y")
+            tree.pack(side="left", fill="both", expand=True)
+            tree.bind("<Double-1>", self._open_problem)
+        self.problems_win.lift()
+        self.run_story_lint()
+
+    def run_story_lint(self): # lints a snapshot of the story off the Tk thread; problems stream into the panel as chunks finish
+        self._apply_pending_inspector_edits()
+        if not self._undo_txn:
+            self._close_undo_entry() # the undo base is now the current story, and its values are never mutated in place
+        base = self._undo_base
+        data = {"nodes": dict(base["nodes"]), "vars_store": dict(base["vars"]), "start_node": START_NODE}
+        self._lint_token += 1
+        token = self._lint_token
+        self.problems_tree.delete(*self.problems_tree.get_children())
+        self.problems_status.configure(text=f"Checking {len(data['nodes'])} nodes…")
+
+        results: "queue.Queue" = queue.Queue()
+        threading.Thread(target=self._lint_worker, args=(data, token, results), daemon=True).start()
+        self.after(50, self._poll_lint, token, results, [0, 0])
+
+    def _analyze_base(self) -> Dict: # analyze_graph over the undo base; only nodes changed since the last call are re-read
+        base = self._undo_base
+        return analyze_graph(base["nodes"], START_NODE, base["vars"], self._graph_cache)
+
+    def _refresh_reachability(self): # re-outlines just the nodes whose reachability changed
+        unreachable = set(self._analyze_base()["unreachable"]) if self.show_unreachable.get() else set()
+        changed = unreachable ^ self.unreachable_nodes
+        self.unreachable_nodes = unreachable
+        if changed:
+            self.refresh_nodes(changed)
+
+    def update_reachability(self): # toggled from the Analyze menu, and after anything that moves the start node
+        self._apply_pending_inspector_edits()
+        if not self._undo_txn:
+            self._close_undo_entry() # brings the undo base up to date (and refreshes, if there was anything new)
+        self._refresh_reachability()
+        if self.show_unreachable.get():
+            count = len(self.unreachable_nodes)
+            self.show_toast(f"{count} unreachable node(s)" if count else "Every node can be reached")
+
+    def show_graph_report(self): # reachability, cycles and trapped cycles of the current story
+        self._apply_pending_inspector_edits()
+        if not self._undo_txn:
+            self._close_undo_entry()
+        messagebox.showinfo("Story Graph", format_analysis(self._analyze_base()))
+
+    def _lint_worker(self, data: Dict, token: int, results: "queue.Queue"): # runs off the Tk thread; no widget access here
+        try:
+            lint_story(data, on_chunk=lambda problems, done, total: results.put(("chunk", problems, (done, total))))
+            results.put(("done", None, None))
+        except Exception as e:
+            results.put(("error", e, None))
+
+    def _poll_lint(self, token: int, results: "queue.Queue", counts: List[int]):
+        if token != self._lint_token or self.problems_win is None or not self.problems_win.winfo_exists():
+            return
+        while True:
+            try:
+                kind, payload, progress = results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "chunk":
+                for nid, line, severity, message in payload:
+                    self.problems_tree.insert("", "end", values=(nid, line or "", severity, message))
+                    counts[severity == "warning"] += 1
+                self.problems_status.configure(text=f"Checked {progress[0]}/{progress[1]} nodes: {counts[0]} error(s), {counts[1]} warning(s)")
+            elif kind == "done":
+                if not counts[0] and not counts[1]:
+                    self.problems_status.configure(text="No problems found.")
+                return
+            else:
+                self.problems_status.configure(text=f"Check failed: {payload}")
+                return
+        self.after(50, self._poll_lint, token, results, counts)
+
+    def _open_problem(self, event=None): # jumps to the node (and options line) of the double-clicked problem
+        item = self.problems_tree.focus()
+        if not item:
+            return
+        nid, line = self.problems_tree.item(item, "values")[:2]
+        self.focus_node(int(nid))
+        if line and self.selected_node == int(nid):
+            self.options_text.tag_remove("sel", "1.0", "end")
+            self.options_text.tag_add("sel", f"{line}.0", f"{line}.end")
+            self.options_text.mark_set("insert", f"{line}.0")
+            self.options_text.see(f"{line}.0")
+            self.options_text.focus_set()
 
     def search_node(self, event=None):
         self._apply_pending_inspector_edits()
         nid_str = self.search_var.get().strip()
         if not nid_str.isdigit():
             return
-        nid = int(nid_str)
+        self.focus_node(int(nid_str))
+
+    def focus_node(self, nid: int): # selects a node, shows it in the inspector and centers the canvas on it
         if nid not in nodes:
             return
 
@@ -2040,17 +4614,17 @@ class VisualEditor(tk.Frame):
 
         node = nodes[nid]
         # nodes store top-left x,y — center on node center
-        cx = node.get("x", 50) + (NODE_W / 2)
-        cy = node.get("y", 50) + (NODE_H / 2)
+        cx, cy = self.model_to_canvas(node.get("x", 50) + (NODE_W / 2), node.get("y", 50) + (NODE_H / 2))
 
-        # center (this will also set scrollregion to bbox("all") internally)
+        # center (this will also set scrollregion to the story's bounds internally)
         self.center_canvas_on(cx, cy)
 
         # optional: flash a highlight rectangle so it's obvious which node was found
         try:
+            z = self.current_zoom
             hl = self.canvas.create_rectangle(
-                node.get("x",50), node.get("y",50),
-                node.get("x",50) + NODE_W, node.get("y",50) + NODE_H,
+                node.get("x",50) * z, node.get("y",50) * z,
+                (node.get("x",50) + NODE_W) * z, (node.get("y",50) + NODE_H) * z,
                 outline=self.theme.get('node_selected_outline', '#00ff00'),
                 width=3, tags=("search_highlight",)
             )
@@ -2080,10 +4654,8 @@ class VisualEditor(tk.Frame):
         if y1 < y0: y0, y1 = y1, y0
 
         self.multi_selected_nodes.clear()
-        for nid, data in nodes.items():
-            nx, ny = data["x"], data["y"]
-            if (nx + NODE_W >= x0 and nx <= x1) and (ny + NODE_H >= y0 and ny <= y1):
-                self.multi_selected_nodes.add(nid)
+        scale = self.current_zoom
+        self.multi_selected_nodes.update(self.node_grid.query_rect(x0 / scale, y0 / scale, x1 / scale, y1 / scale))
 
         if self.multi_select_rect:
             self.canvas.delete(self.multi_select_rect)
@@ -2106,15 +4678,7 @@ class VisualEditor(tk.Frame):
     def node_right_click(self, event): # this is called when you right-click a node
         cx = self.canvas.canvasx(event.x)
         cy = self.canvas.canvasy(event.y)
-        clicked = self.canvas.find_overlapping(cx, cy, cx, cy)
-        clicked_node = None
-        for item in clicked:
-            for t in self.canvas.gettags(item):
-                if t.isdigit():
-                    clicked_node = int(t)
-                    break
-            if clicked_node:
-                break
+        clicked_node = self.get_node_at(cx, cy)
 
         if clicked_node is None:
             return "break"  
@@ -2144,11 +4708,6 @@ class VisualEditor(tk.Frame):
             self.show_toast("Invalid start node", color="red")
             return
 
-        # stash backups like normal play mode does
-        self.editor_vars_backup = copy.deepcopy(vars_store)
-        self.editor_inventory_backup = inventory.copy()
-        self.nodes_backup = copy.deepcopy(nodes)
-
         # override the play start
         self.play_current = node_id
 
@@ -2170,6 +4729,7 @@ class VisualEditor(tk.Frame):
                     src["connections"] = []
                 if node_id not in src["connections"]:
                     src["connections"].append(node_id)
+                    story_graph.touch(self.connecting_from)
                     self.show_toast(f"Connected {self.connecting_from} > {node_id}", color="green")
                 else:
                     self.show_toast(f"Already connected {self.connecting_from} > {node_id}", color="yellow")
@@ -2196,19 +4756,7 @@ class VisualEditor(tk.Frame):
     def comment_right_click(self, event):
         cx = self.canvas.canvasx(event.x)
         cy = self.canvas.canvasy(event.y)
-        clicked = self.canvas.find_overlapping(cx, cy, cx, cy)
-        clicked_comment = None
-
-        for item in clicked:
-            for t in self.canvas.gettags(item):
-                if t.startswith("comment"):
-                    # tags look like ("comment", "3"), so grab second tag
-                    for tag in self.canvas.gettags(item):
-                        if tag.isdigit():
-                            clicked_comment = int(tag)
-                            break
-            if clicked_comment is not None:
-                break
+        clicked_comment = self.get_comment_at(cx, cy)
 
         if clicked_comment is None:
             return "break"
@@ -2223,10 +4771,8 @@ class VisualEditor(tk.Frame):
 
     def background_right_click(self, event): # this is called when you right-click the background.
         cx, cy = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        clicked = self.canvas.find_overlapping(cx, cy, cx, cy)
-        for item in clicked:
-            if any(t.isdigit() for t in self.canvas.gettags(item)):
-                return "break"  
+        if self.get_node_at(cx, cy) is not None or self.get_comment_at(cx, cy) is not None:
+            return "break"  
 
         self.bg_menu.tk_popup(event.x_root, event.y_root)
         return "break"
@@ -2235,15 +4781,7 @@ class VisualEditor(tk.Frame):
         if cid not in comments:
             return
         # clear handles, canvas items, and stored refs
-        self.clear_comment_handles(cid)
-        if hasattr(self, "comment_rects") and cid in self.comment_rects:
-            try: self.canvas.delete(self.comment_rects[cid])
-            except: pass
-            del self.comment_rects[cid]
-        if hasattr(self, "comment_texts") and cid in self.comment_texts:
-            try: self.canvas.delete(self.comment_texts[cid])
-            except: pass
-            del self.comment_texts[cid]
+        self._remove_comment_items(cid)
         # finally remove from the dict
         del comments[cid]
         if self.selected_comment == cid:
@@ -2261,15 +4799,9 @@ class VisualEditor(tk.Frame):
             # Delete from the global nodes dictionary
             if nid in nodes:
                 del nodes[nid]
+                story_graph.remove_node(nid)
             # Delete associated canvas items immediately to prevent visual glitches
-            if nid in self.node_rects:
-                self.canvas.delete(self.node_rects[nid])
-                del self.node_rects[nid]
-            if nid in self.node_texts:
-                self.canvas.delete(self.node_texts[nid])
-                del self.node_texts[nid]
-            if nid in self.node_base_fonts:
-                del self.node_base_fonts[nid]
+            self._remove_node_items(nid)
 
         self.selected_node = None
         self.multi_selected_nodes.clear() # Ensure this is cleared
@@ -2313,12 +4845,14 @@ class VisualEditor(tk.Frame):
         self._apply_pending_inspector_edits()
         targets = self.multi_selected_nodes if self.multi_selected_nodes else {self.selected_node}
         new_ids = []
-        for nid in targets:
-            new_id = max(nodes.keys(), default=0) + 1
-            data = nodes[nid].copy()
-            data["x"] += 20; data["y"] += 20
-            nodes[new_id] = data
-            new_ids.append(new_id)
+        with self.undo_transaction():
+            for nid in targets:
+                new_id = max(nodes.keys(), default=0) + 1
+                data = copy.deepcopy(nodes[nid])
+                data["x"] += 20; data["y"] += 20
+                nodes[new_id] = data
+                story_graph.update_node(new_id)
+                new_ids.append(new_id)
         self.selected_node = new_ids[0] if new_ids else None
         self.multi_selected_nodes.clear()
         self.redraw()
@@ -2343,36 +4877,15 @@ class VisualEditor(tk.Frame):
 
         self.push_undo()
 
-        # Move the node data to the new ID
-        nodes[new_id] = nodes.pop(old_id)
-
-        # Update all references to the old ID across all nodes
-        for nid, data in nodes.items():
-            options_changed = False
-            
-            # 1. Update the parsed options list
-            for opt in data.get("options", []):
-                next_val = opt.get("next")
-                if next_val is None: continue
-
-                if isinstance(next_val, str) and "/" in next_val:
-                    parts = [p.strip() for p in next_val.split("/")]
-                    if str(old_id) in parts:
-                        new_parts = [str(new_id) if p == str(old_id) else p for p in parts]
-                        opt["next"] = "/".join(new_parts)
-                        options_changed = True
-                elif str(next_val) == str(old_id):
-                    opt["next"] = str(new_id)
-                    options_changed = True
-            
-            # 2. If references were found, regenerate the raw_options string to match
-            if options_changed:
-                data["raw_options"] = "\n".join([format_option_line(opt) for opt in data["options"]])
+        # Move the node data to the new ID and repoint the leaves that referenced it
+        rename_node(old_id, new_id)
 
         # Update START_NODE if it was the changed node
         global START_NODE
         if START_NODE == old_id:
             START_NODE = new_id
+            if self.show_unreachable.get():
+                self.update_reachability()
 
         # Update selection state
         self.selected_node = new_id
@@ -2382,56 +4895,56 @@ class VisualEditor(tk.Frame):
 
     def duplicate_node(self, nid): # duplicate a node
         new_id = max(nodes.keys()) + 1
-        data = nodes[nid].copy()
+        self.push_undo()
+        data = copy.deepcopy(nodes[nid])
         data["x"] += 20; data["y"] += 20  
         nodes[new_id] = data
+        story_graph.update_node(new_id)
         self.redraw()
 
-    def canvas_zoom(self, event): # do 'zoom'
-        if self.settings['disable_zooming'] == False:
-            x = self.canvas.canvasx(event.x)
-            y = self.canvas.canvasy(event.y)
-            factor = 1.1 if event.delta > 0 else 0.9
-            self.current_zoom *= factor
-
-            
-            self.canvas.scale("all", x, y, factor, factor)
-            #self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
-            
-            for nid, txt_id in self.node_texts.items():
-                font_obj = self.node_base_fonts[nid]
-                new_size = max(6, int(BASE_FONT_SIZE * self.current_zoom))
-                font_obj.configure(size=new_size)
-                
-                if self.current_zoom < 0.6:
-                    self.canvas.itemconfig(txt_id, text=str(nid))
-                else:
-                    header = nodes[nid].get("header", "")
-                    self.canvas.itemconfig(txt_id, text=f"{nid}: {header}")
-        else:
-            pass
-            #self.reset_zoom() 
+    def set_zoom(self, zoom: float): # rescales every scene item with one canvas.scale(); update_viewport() does the rest
+        factor = zoom / self.current_zoom
+        self.current_zoom = zoom
+        self.canvas.scale("scene", 0, 0, factor, factor)
+        self.fonts.set_zoom(zoom, lod_tier(zoom))
+        self.canvas.itemconfigure("node_text", width=(NODE_W - 12) * zoom)
+        for w in self.comment_wraps:
+            self.canvas.itemconfigure(f"wrap_{w}", width=(w - 10) * zoom)
+
+    def scroll_canvas_to(self, left, top): # scrolls so canvas point (left, top) is the view's top-left corner
+        self.canvas.configure(scrollregion=CANVAS_SCROLLREGION)
+        x0, y0, x1, y1 = CANVAS_SCROLLREGION
+        self.canvas.xview_moveto((left - x0) / (x1 - x0))
+        self.canvas.yview_moveto((top - y0) / (y1 - y0))
+
+    def canvas_zoom(self, event): # do 'zoom', keeping the point under the mouse where it is
+        if self.settings.get('disable_zooming', False):
+            return
+        zoom_in = event.delta > 0 if getattr(event, "delta", 0) else getattr(event, "num", None) == 4
+        new_zoom = min(ZOOM_MAX, max(ZOOM_MIN, self.current_zoom * (1.1 if zoom_in else 0.9)))
+        if new_zoom == self.current_zoom:
+            return
+        mx = self.canvas.canvasx(event.x) / self.current_zoom
+        my = self.canvas.canvasy(event.y) / self.current_zoom
+        self.set_zoom(new_zoom)
+        self.scroll_canvas_to(mx * new_zoom - event.x, my * new_zoom - event.y)
+        self.update_viewport()
 
     def reset_zoom(self): # resets zoom.
-        #if self.settings['disable_zoom'] == False: 
-        factor = 1.0 / self.current_zoom
-        self.current_zoom = 1.0
-        cx = self.canvas.canvasx(self.canvas.winfo_width() / 2)
-        cy = self.canvas.canvasy(self.canvas.winfo_height() / 2)
-        self.canvas.scale("all", cx, cy, factor, factor)
-        #self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        for nid, font_obj in self.node_base_fonts.items():
-            font_obj.configure(size=BASE_FONT_SIZE)  
-        for nid, txt_id in self.node_texts.items():
-            header = nodes[nid].get("header", "")
-            self.canvas.itemconfig(txt_id, text=f"{nid}: {header}")
+        w2, h2 = self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2
+        mx = self.canvas.canvasx(w2) / self.current_zoom
+        my = self.canvas.canvasy(h2) / self.current_zoom
+        self.set_zoom(1.0)
+        self.scroll_canvas_to(mx - w2, my - h2)
+        self.update_viewport()
     
     def apply_preset_color(self, color: str): # apply preset color (in the inspector there's "Preset Colors".)
         targets = self.multi_selected_nodes if self.multi_selected_nodes else {self.selected_node}
-        for nid in targets:
-            if nid is not None:
-                nodes[nid]["color"] = color
+        with self.undo_transaction():
+            for nid in targets:
+                if nid is not None:
+                    nodes[nid]["color"] = color
+                    story_graph.touch(nid)
         self.redraw()
 
     def pick_node_color(self): # picks the node color
@@ -2440,7 +4953,9 @@ class VisualEditor(tk.Frame):
         node = nodes[self.selected_node]
         color = colorchooser.askcolor(color=node.get("color","#222222"))[1]  
         if color:
+            self.push_undo()
             node["color"] = color
+            story_graph.touch(self.selected_node)
             self.redraw()
 
     def start_pan(self, event): # start panning
@@ -2448,6 +4963,7 @@ class VisualEditor(tk.Frame):
 
     def do_pan(self, event): # do panning
         self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.schedule_viewport_update()
 
     def delete_selected_node(self): # delete the selected node
         if self.selected_node is None:
@@ -2467,6 +4983,8 @@ class VisualEditor(tk.Frame):
         global START_NODE
         if self.selected_node is not None:
             START_NODE = self.selected_node
+            if self.show_unreachable.get():
+                self.update_reachability()
     
     def _apply_pending_inspector_edits(self):
         if self.updating: return
@@ -2485,6 +5003,7 @@ class VisualEditor(tk.Frame):
 
         header = self.header_text.get("1.0", tk.END).strip()
         opts_text = self.options_text.get("1.0", tk.END).strip()
+        self._typing_undo(("node", self.selected_node))
         
         nodes[self.selected_node]["raw_options"] = opts_text # Store raw text to preserve comments
 
@@ -2497,11 +5016,13 @@ class VisualEditor(tk.Frame):
 
         nodes[self.selected_node]["header"] = header
         nodes[self.selected_node]["options"] = opts
+        story_graph.update_node(self.selected_node)
         if redraw_canvas:
             self.redraw()
 
     def apply_vars_text(self): # apply edits for vars_list
         raw = self.vars_list.get("1.0", tk.END).strip().splitlines()
+        self._typing_undo("vars")
         vars_store.clear(); inventory.clear()
         for line in raw:
             line = line.strip()
@@ -2539,12 +5060,12 @@ class VisualEditor(tk.Frame):
 
         # Cursor position if event is provided
         if event is not None:
-            x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+            x, y = self.event_to_model(event)
         else:
             # Fallback: center of canvas
             if x is None or y is None:
                 w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
-                x, y = self.canvas.canvasx(w / 2), self.canvas.canvasy(h / 2)
+                x, y = self.canvas.canvasx(w / 2) / self.current_zoom, self.canvas.canvasy(h / 2) / self.current_zoom
 
         # Color logic
         if self.settings.get('udtdnc', False) == False:
@@ -2560,16 +5081,40 @@ class VisualEditor(tk.Frame):
             "options": [],
             "color": color     
         }
+        story_graph.update_node(new_id)
 
         self.selected_node = new_id
         self.load_selected_into_inspector()
         self.redraw()
         self.update_node_count()
 
-    def truncate_text_to_fit(self, text, font, max_w, max_h):
+    def truncate_text_to_fit(self, text, font, max_w, max_h): # font comes from self.fonts, whose names identify the spec
         if self.settings.get('disable_text_truncation', False):
             return text
 
+        key = (text, str(font), max_w, max_h)
+        cached = _LAYOUT_CACHE.get(key)
+        if cached is not None:
+            _LAYOUT_CACHE.move_to_end(key)
+            return cached
+        result = self._layout_text(text, font, max_w, max_h)
+        _LAYOUT_CACHE[key] = result
+        if len(_LAYOUT_CACHE) > _LAYOUT_CACHE_MAX:
+            _LAYOUT_CACHE.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _fit_prefix(font, text: str, max_w, suffix: str = "") -> int: # longest n with font.measure(text[:n] + suffix) <= max_w (binary search)
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if font.measure(text[:mid] + suffix) <= max_w:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _layout_text(self, text, font, max_w, max_h):
         linespace = font.metrics("linespace")
         max_lines = max(1, int(max_h / linespace))
         
@@ -2605,13 +5150,7 @@ class VisualEditor(tk.Frame):
                         if len(final_lines) >= max_lines:
                             truncated = True; break
                         
-                        split_idx = len(temp_word)
-                        for i in range(1, len(temp_word) + 1):
-                            if font.measure(temp_word[:i]) > max_w:
-                                split_idx = i - 1
-                                break
-                        
-                        split_idx = max(1, split_idx)
+                        split_idx = max(1, self._fit_prefix(font, temp_word, max_w))
                         final_lines.append(temp_word[:split_idx])
                         temp_word = temp_word[split_idx:]
                     if truncated: break
@@ -2646,8 +5185,7 @@ class VisualEditor(tk.Frame):
             last_line = final_lines[-1]
             
             if not last_line.endswith("..."):
-                while font.measure(last_line + "...") > max_w and last_line:
-                    last_line = last_line[:-1]
+                last_line = last_line[:self._fit_prefix(font, last_line, max_w, "...")]
                 final_lines[-1] = (last_line + "...") if last_line else "..."
 
         return "\n".join(final_lines)
@@ -2664,205 +5202,415 @@ class VisualEditor(tk.Frame):
                 pass
         data["handles"] = {}
 
-    def redraw(self):
-        # Clear all existing edges
-        for item in self.edge_items:
-            self.canvas.delete(item)
-        self.edge_items.clear()
-
-        # Clear all existing node rectangles and texts, then re-create only for existing nodes
-        for nid in list(self.node_rects.keys()): # Iterate over a copy of keys to allow modification
-            if nid not in nodes:
-                self.canvas.delete(self.node_rects.pop(nid, None))
-                self.canvas.delete(self.node_texts.pop(nid, None))
-                self.node_base_fonts.pop(nid, None)
-
-        # --- Update or create nodes ---
+    # ------- scene -------
+    # Every node, edge and comment remembers what its canvas items last showed
+    # (node_scene / edge_scene / comment_scene), so redraw() only spends Tk calls
+    # on items that actually changed. Drags go through refresh_nodes() and
+    # refresh_comment(), which only look at the moved items and their edges.
+    # Only items inside the view (plus CULL_MARGIN) have canvas items at all;
+    # update_viewport() creates/destroys them as the view pans or zooms.
+    # Scene items are drawn at model coords * current_zoom and all carry the
+    # "scene" tag, so zooming is one canvas.scale() call (see set_zoom) and a
+    # level-of-detail change is one canvas.delete("scene").
+
+    def redraw(self): # bring every canvas item in line with nodes/comments
+        for nid in [nid for nid in self.node_grid.rects if nid not in nodes]:
+            self._remove_node_items(nid)
         for nid, data in nodes.items():
-            x = data.get("x", 50)
-            y = data.get("y", 50)
-            node_color = data.get("color") or self.theme.get('default_node_color', '#222222')
-
-            # Node rectangle
-            if nid in self.node_rects:
-                self.canvas.coords(self.node_rects[nid], x, y, x + NODE_W, y + NODE_H)
-                self.canvas.itemconfig(self.node_rects[nid], fill=node_color)
-            else:
-                rect = self.canvas.create_rectangle(
-                    x, y, x + NODE_W, y + NODE_H,
-                    fill=node_color, outline=self.theme['node_outline'], width=2,
-                    tags=("node", str(nid))
-                )
-                self.node_rects[nid] = rect
+            x, y = data.get("x", 50), data.get("y", 50)
+            self.node_grid.insert(nid, x, y, x + NODE_W, y + NODE_H)
+
+        pairs = set()
+        for nid in nodes:
+            for tgt in story_graph.edges(nid, vars_store):
+                if tgt in nodes:
+                    pairs.add((nid, tgt) if nid <= tgt else (tgt, nid))
+        for pair in [pair for pair in self.edge_grid.rects if pair not in pairs]:
+            self.edge_grid.remove(pair)
+            self._remove_edge_items(pair)
+        for pair in pairs:
+            self.edge_grid.insert(pair, *self._edge_rect(pair))
+
+        for cid in [cid for cid in self.comment_grid.rects if cid not in comments]:
+            self._remove_comment_items(cid)
+        for cid, data in comments.items():
+            w, h = max(30, data.get("w", COMMENT_W)), max(20, data.get("h", COMMENT_H))
+            data["w"], data["h"] = w, h
+            self.comment_grid.insert(cid, data["x"], data["y"], data["x"] + w, data["y"] + h)
 
-            # Node text
-            font_obj = self.node_base_fonts.get(nid) or tkFont.Font(family="TkDefaultFont", size=11)
-            self.node_base_fonts[nid] = font_obj
-            full_text = f"{nid}: {data.get('header','')}"
-            display_text = self.truncate_text_to_fit(full_text, font_obj, NODE_W-12, NODE_H-4)
+        self.update_viewport(redraw=True)
 
-            if nid in self.node_texts:
-                self.canvas.itemconfig(self.node_texts[nid], text=display_text, fill=self.theme['node_text_fill'])
-                self.canvas.coords(self.node_texts[nid], x + 10, y + 10)
+    def visible_rect(self) -> Tuple[float, float, float, float]: # the part of the story (model coords) that gets canvas items
+        scale = self.current_zoom
+        x0 = self.canvas.canvasx(0) / scale - CULL_MARGIN
+        y0 = self.canvas.canvasy(0) / scale - CULL_MARGIN
+        x1 = self.canvas.canvasx(self.canvas.winfo_width()) / scale + CULL_MARGIN
+        y1 = self.canvas.canvasy(self.canvas.winfo_height()) / scale + CULL_MARGIN
+        return x0, y0, x1, y1
+
+    def update_viewport(self, redraw: bool = False):
+        # create items that came into view and destroy the ones that left it; only the grids' hits for the view are
+        # looked at, and items already drawn are left alone unless redraw() asks for them to be brought up to date
+        self._viewport_job = None
+        tier = lod_tier(self.current_zoom)
+        if tier != self.lod_tier:
+            self._clear_scene()
+            self.lod_tier = tier
+        vx0, vy0, vx1, vy1 = self.view_rect = self.visible_rect()
+
+        visible = set(self.node_grid.query_rect(vx0, vy0, vx1, vy1))
+        for nid in [nid for nid in self.node_scene if nid not in visible]:
+            self._hide_node(nid)
+        for nid in visible:
+            if redraw or nid not in self.node_scene:
+                self._draw_node(nid)
+
+        visible = self.edge_grid.query_rect(vx0, vy0, vx1, vy1)
+        if tier == LOD_DOTS:
+            self._draw_cluster_edges(visible)
+        else:
+            shown = set(visible)
+            for pair in [pair for pair in self.edge_scene if pair not in shown]:
+                self._remove_edge_items(pair)
+            for pair in visible:
+                if redraw or pair not in self.edge_scene:
+                    self._draw_edge(pair)
+
+        visible = set(self.comment_grid.query_rect(vx0, vy0, vx1, vy1))
+        for cid in [cid for cid in self.comment_scene if cid not in visible]:
+            self._hide_comment(cid)
+        for cid in visible:
+            if redraw or cid not in self.comment_scene:
+                self._draw_comment(cid)
+
+    def schedule_viewport_update(self, event=None): # coalesces bursts of pan/resize events into one update
+        if self._viewport_job is None:
+            self._viewport_job = self.after_idle(self.update_viewport)
+
+    def _clear_scene(self): # drop every scene item at once (level-of-detail switch)
+        self.canvas.delete("scene")
+        for cid in self.comment_scene:
+            if cid in comments:
+                comments[cid]["handles"] = {}
+        for table in (self.node_rects, self.node_texts, self.edge_items, self.comment_rects, self.comment_texts,
+                      self.comment_wraps, self.node_scene, self.edge_scene, self.comment_scene, self.cluster_edges):
+            table.clear()
+
+    def _edge_rect(self, pair: Tuple[int, int]) -> Tuple[float, float, float, float]: # the box around both nodes of an edge
+        a, b = nodes[pair[0]], nodes[pair[1]]
+        ax, ay, bx, by = a.get("x", 50), a.get("y", 50), b.get("x", 50), b.get("y", 50)
+        return min(ax, bx), min(ay, by), max(ax, bx) + NODE_W, max(ay, by) + NODE_H
+
+    def _edge_in_view(self, pair: Tuple[int, int]) -> bool:
+        x0, y0, x1, y1 = self.edge_grid.rects[pair]
+        vx0, vy0, vx1, vy1 = self.view_rect
+        return x1 >= vx0 and x0 <= vx1 and y1 >= vy0 and y0 <= vy1
+
+    def _node_in_view(self, nid: int) -> bool:
+        x0, y0, x1, y1 = self.node_grid.rects[nid]
+        vx0, vy0, vx1, vy1 = self.view_rect
+        return x1 >= vx0 and x0 <= vx1 and y1 >= vy0 and y0 <= vy1
+
+    def refresh_nodes(self, nids): # redraw just these nodes and the edges touching them (e.g. while dragging)
+        pairs = set()
+        for nid in nids:
+            if nid not in nodes:
+                continue
+            data = nodes[nid]
+            x, y = data.get("x", 50), data.get("y", 50)
+            self.node_grid.insert(nid, x, y, x + NODE_W, y + NODE_H)
+            if self._node_in_view(nid):
+                self._draw_node(nid)
+            else:
+                self._hide_node(nid)
+            for tgt in story_graph.edges(nid, vars_store):
+                pairs.add((nid, tgt) if nid <= tgt else (tgt, nid))
+            for src in story_graph.predecessors(nid):
+                pairs.add((nid, src) if nid <= src else (src, nid))
+            for src in story_graph.var_targets: # variable targets aren't in the reverse index
+                if nid in story_graph.edges(src, vars_store):
+                    pairs.add((nid, src) if nid <= src else (src, nid))
+        pairs = [pair for pair in pairs if pair[0] in nodes and pair[1] in nodes]
+        for pair in pairs:
+            self.edge_grid.insert(pair, *self._edge_rect(pair))
+        if self.lod_tier == LOD_DOTS:
+            self.schedule_viewport_update() # cluster edges are rebuilt as a whole
+            return
+        for pair in pairs:
+            if self._edge_in_view(pair):
+                self._draw_edge(pair)
             else:
-                txt = self.canvas.create_text(
-                    x + 10, y + 10, anchor="nw",
-                    text=display_text,
-                    fill=self.theme['node_text_fill'],
-                    width=NODE_W - 12,
-                    font=font_obj,
-                    tags=("node_text", str(nid))
+                self._remove_edge_items(pair)
+
+    def refresh_comment(self, cid): # redraw just this comment (e.g. while dragging or resizing it)
+        if cid in comments:
+            data = comments[cid]
+            self.comment_grid.insert(cid, data["x"], data["y"], data["x"] + data["w"], data["y"] + data["h"])
+            self._draw_comment(cid)
+
+    def _draw_node(self, nid: int):
+        data = nodes[nid]
+        x = data.get("x", 50)
+        y = data.get("y", 50)
+        node_color = data.get("color") or self.theme.get('default_node_color', '#222222')
+
+        # Selection outlines
+        if nid == self.selected_node:
+            outline, width = self.theme['node_selected_outline'], 3
+        elif nid in self.multi_selected_nodes:
+            outline, width = self.theme['multi_selected_outline'], 3
+        elif nid in self.unreachable_nodes:
+            outline, width = self.theme.get('unreachable_outline', '#ff5555'), 3
+        else:
+            outline, width = self.theme['node_outline'], 2
+        text_key = (data.get('header', ''), self.theme['node_text_fill'], self.settings.get('disable_text_truncation', False))
+        key = (x, y, node_color, outline, width, text_key)
+        old = self.node_scene.get(nid)
+        if old == key:
+            return
+        self.node_scene[nid] = key
+        z = self.current_zoom
+
+        if self.lod_tier == LOD_DOTS: # plain colored dot
+            cx, cy, r = (x + NODE_W / 2) * z, (y + NODE_H / 2) * z, LOD_DOT_RADIUS
+            if old is None:
+                self.node_rects[nid] = self.canvas.create_oval(
+                    cx - r, cy - r, cx + r, cy + r, fill=node_color, outline=outline, width=width - 1,
+                    tags=("scene", "node", str(nid))
                 )
-                self.node_texts[nid] = txt
+                return
+            self.canvas.coords(self.node_rects[nid], cx - r, cy - r, cx + r, cy + r)
+            self.canvas.itemconfig(self.node_rects[nid], fill=node_color, outline=outline, width=width - 1)
+            return
 
-            # Selection outlines
-            if nid == self.selected_node:
-                self.canvas.itemconfig(self.node_rects[nid], outline=self.theme['node_selected_outline'], width=3)
-            elif nid in self.multi_selected_nodes:
-                self.canvas.itemconfig(self.node_rects[nid], outline=self.theme['multi_selected_outline'], width=3)
+        # Node text: the full (truncated) header, or just the id when zoomed out
+        if old is None or old[5] != text_key:
+            if self.lod_tier == LOD_ID:
+                display_text = str(nid)
             else:
-                self.canvas.itemconfig(self.node_rects[nid], outline=self.theme['node_outline'], width=2)
+                full_text = f"{nid}: {text_key[0]}"
+                display_text = self.truncate_text_to_fit(full_text, self.fonts.get("TkDefaultFont", BASE_FONT_SIZE, FONT_LAYOUT), NODE_W-12, NODE_H-4)
+        else:
+            display_text = None
 
-        # --- Update edges ---
-        # (The clearing of old edges is moved to the beginning of the function)
-        seen_edges = set()
-        COLOR1 = self.theme.get('from_lines', '#00ced1')
-        COLOR2 = self.theme.get('to_lines', '#ffa500')
-        RANDOM_EDGE_COLOR = self.theme.get('randomEdgeFromColor', '#8e44ff')
+        if old is None:
+            self.node_rects[nid] = self.canvas.create_rectangle(
+                x * z, y * z, (x + NODE_W) * z, (y + NODE_H) * z,
+                fill=node_color, outline=outline, width=width,
+                tags=("scene", "node", str(nid))
+            )
+            self.node_texts[nid] = self.canvas.create_text(
+                (x + 10) * z, (y + 10) * z, anchor="nw",
+                text=display_text,
+                fill=text_key[1],
+                width=(NODE_W - 12) * z,
+                font=self.fonts.get("TkDefaultFont", BASE_FONT_SIZE, self.lod_tier),
+                tags=("scene", "node_text", str(nid))
+            )
+            return
 
-        for nid, data in nodes.items():
-            x1 = data.get("x", 50) + NODE_W // 2
-            y1 = data.get("y", 50) + NODE_H // 2
-            for opt in data.get("options", []):
-                nxt_raw = opt.get("next")
-                if not nxt_raw:
-                    continue
-                is_multi_choice = isinstance(nxt_raw, str) and "/" in nxt_raw
-                next_nodes = []
+        if old[:2] != (x, y):
+            self.canvas.coords(self.node_rects[nid], x * z, y * z, (x + NODE_W) * z, (y + NODE_H) * z)
+            self.canvas.coords(self.node_texts[nid], (x + 10) * z, (y + 10) * z)
+        if old[2:5] != (node_color, outline, width):
+            self.canvas.itemconfig(self.node_rects[nid], fill=node_color, outline=outline, width=width)
+        if display_text is not None:
+            self.canvas.itemconfig(self.node_texts[nid], text=display_text, fill=text_key[1])
+
+    def _remove_node_items(self, nid: int): # the node is gone
+        self.node_grid.remove(nid)
+        self._hide_node(nid)
+
+    def _hide_node(self, nid: int): # the node left the view; drop its canvas items
+        self.node_scene.pop(nid, None)
+        for items in (self.node_rects, self.node_texts):
+            item = items.pop(nid, None)
+            if item is not None:
+                self.canvas.delete(item)
+
+    def _edge_shape(self, a: int, b: int): # ('both'|'one', src, tgt, random) for the leaves between a and b, or None
+        if a not in nodes or b not in nodes:
+            return None
+        ab = story_graph.edges(a, vars_store).get(b)
+        ba = story_graph.edges(b, vars_store).get(a)
+        if ab is not None and ba is not None:
+            return ("both", a, b, ab)
+        if ab is not None:
+            return ("one", a, b, ab)
+        if ba is not None:
+            return ("one", b, a, ba)
+        return None
 
-                if isinstance(nxt_raw, str) and "/" in nxt_raw:
-                    for part in nxt_raw.split("/"):
-                        try:
-                            next_nodes.append(int(part.strip()))
-                        except:
-                            val = vars_store.get(part.strip())
-                            if val is not None:
-                                try: next_nodes.append(int(val))
-                                except: pass
-                else:
-                    try:
-                        next_nodes.append(int(nxt_raw))
-                    except:
-                        val = vars_store.get(nxt_raw)
-                        if val is not None:
-                            try: next_nodes.append(int(val))
-                            except: pass
-
-                for tgt in next_nodes:
-                    if tgt not in nodes or (nid, tgt) in seen_edges:
-                        continue
-                    x2 = nodes[tgt].get("x", 50) + NODE_W // 2
-                    y2 = nodes[tgt].get("y", 50) + NODE_H // 2
-
-                    reverse_exists = False
-                    for ropt in nodes[tgt].get("options", []):
-                        rnext = ropt.get("next")
-                        if rnext is None: continue
-                        if isinstance(rnext, str) and "/" in rnext:
-                            if str(nid) in [p.strip() for p in rnext.split("/")]:
-                                reverse_exists = True
-                                break
-                        else:
-                            if str(nid) == str(rnext):
-                                reverse_exists = True
-                                break
-
-                    from_color = RANDOM_EDGE_COLOR if is_multi_choice else COLOR1
-                    if reverse_exists:
-                        line = self.canvas.create_line(x1, y1, x2, y2, width=3, fill=from_color, smooth=True)
-                        self.edge_items.append(line)
-                        self.canvas.tag_lower(line)
-                        seen_edges.add((nid, tgt))
-                        seen_edges.add((tgt, nid))
-                    else:
-                        mid_x = (x1 + x2) / 2
-                        mid_y = (y1 + y2) / 2
-                        line1 = self.canvas.create_line(x1, y1, mid_x, mid_y, width=3, fill=from_color, smooth=True)
-                        line2 = self.canvas.create_line(mid_x, mid_y, x2, y2, width=3, fill=COLOR2, smooth=True, arrow=tk.LAST)
-                        self.edge_items.extend([line1, line2])
-                        self.canvas.tag_lower(line1)
-                        self.canvas.tag_lower(line2)
-                        seen_edges.add((nid, tgt))
-
-        # --- Update comments ---
-
-        # Clear stale handles from previous frame so they don't accumulate
-        for cid in list(comments.keys()):
-            self.clear_comment_handles(cid)
-
-        # Clear canvas items for comments that no longer exist
-        for cid_item in list(self.comment_rects.keys()):
-            if cid_item not in comments:
-                self.canvas.delete(self.comment_rects.pop(cid_item, None))
-                self.canvas.delete(self.comment_texts.pop(cid_item, None))
-
-        # --- Update comments ---
-        for cid, data in comments.items():
-            x, y = data["x"], data["y"]
-            w, h = max(30, data.get("w", COMMENT_W)), max(20, data.get("h", COMMENT_H))
-            data["w"], data["h"] = w, h
+    def _draw_edge(self, pair: Tuple[int, int]):
+        shape = self._edge_shape(*pair)
+        if shape is None:
+            self._remove_edge_items(pair)
+            return
+        kind, src, tgt, is_multi_choice = shape
+        x1 = nodes[src].get("x", 50) + NODE_W // 2
+        y1 = nodes[src].get("y", 50) + NODE_H // 2
+        x2 = nodes[tgt].get("x", 50) + NODE_W // 2
+        y2 = nodes[tgt].get("y", 50) + NODE_H // 2
+        COLOR2 = self.theme.get('to_lines', '#ffa500')
+        from_color = self.theme.get('randomEdgeFromColor', '#8e44ff') if is_multi_choice else self.theme.get('from_lines', '#00ced1')
 
-            # Rectangle (reuse if exists)
-            if cid in getattr(self, "comment_rects", {}):
-                self.canvas.coords(self.comment_rects[cid], x, y, x + w, y + h)
+        key = (kind, x1, y1, x2, y2, from_color, COLOR2)
+        old = self.edge_scene.get(pair)
+        if old == key:
+            return
+        z = self.current_zoom
+        x1, y1, x2, y2 = x1 * z, y1 * z, x2 * z, y2 * z
+        items = self.edge_items.get(pair)
+        if old is not None and old[0] == kind and items:
+            if kind == "both":
+                self.canvas.coords(items[0], x1, y1, x2, y2)
+                self.canvas.itemconfig(items[0], fill=from_color)
             else:
-                if not hasattr(self, "comment_rects"):
-                    self.comment_rects = {}
-                rect_id = self.canvas.create_rectangle(
-                    x, y, x + w, y + h,
-                    fill="#FFA500", outline="#FFCC66", width=2,
-                    tags=("comment", str(cid))
-                )
-                self.comment_rects[cid] = rect_id
+                mid_x = (x1 + x2) / 2
+                mid_y = (y1 + y2) / 2
+                self.canvas.coords(items[0], x1, y1, mid_x, mid_y)
+                self.canvas.coords(items[1], mid_x, mid_y, x2, y2)
+                self.canvas.itemconfig(items[0], fill=from_color)
+                self.canvas.itemconfig(items[1], fill=COLOR2)
+            self.edge_scene[pair] = key
+            return
+
+        self._remove_edge_items(pair)
+        if kind == "both":
+            line = self.canvas.create_line(x1, y1, x2, y2, width=3, fill=from_color, smooth=True, tags=("scene",))
+            items = [line]
+        else:
+            mid_x = (x1 + x2) / 2
+            mid_y = (y1 + y2) / 2
+            line1 = self.canvas.create_line(x1, y1, mid_x, mid_y, width=3, fill=from_color, smooth=True, tags=("scene",))
+            line2 = self.canvas.create_line(mid_x, mid_y, x2, y2, width=3, fill=COLOR2, smooth=True, arrow=tk.LAST, tags=("scene",))
+            items = [line1, line2]
+        for item in items:
+            self.canvas.tag_lower(item)
+        self.edge_items[pair] = items
+        self.edge_scene[pair] = key
+
+    def _remove_edge_items(self, pair: Tuple[int, int]):
+        self.edge_scene.pop(pair, None)
+        for item in self.edge_items.pop(pair, ()):
+            self.canvas.delete(item)
+
+    def _draw_cluster_edges(self, pairs): # far zoom: one line per pair of LOD_CLUSTER_SIZE cells that have edges (in view) between them
+        cell = LOD_CLUSTER_SIZE
+        counts: Dict[Tuple, int] = {}
+        for pair in pairs:
+            a, b = nodes[pair[0]], nodes[pair[1]]
+            ca = (int((a.get("x", 50) + NODE_W / 2) // cell), int((a.get("y", 50) + NODE_H / 2) // cell))
+            cb = (int((b.get("x", 50) + NODE_W / 2) // cell), int((b.get("y", 50) + NODE_H / 2) // cell))
+            if ca != cb:
+                key = (ca, cb) if ca <= cb else (cb, ca)
+                counts[key] = counts.get(key, 0) + 1
+
+        for key in [key for key in self.cluster_edges if key not in counts]:
+            self.canvas.delete(self.cluster_edges.pop(key)[0])
+        z = self.current_zoom
+        color = self.theme.get('from_lines', '#00ced1')
+        for key, n in counts.items():
+            width = min(1 + n.bit_length(), 8)
+            old = self.cluster_edges.get(key)
+            if old is not None:
+                if old[1] != width:
+                    self.canvas.itemconfig(old[0], width=width)
+                    self.cluster_edges[key] = (old[0], width)
+                continue
+            (gx1, gy1), (gx2, gy2) = key
+            line = self.canvas.create_line((gx1 + 0.5) * cell * z, (gy1 + 0.5) * cell * z,
+                                           (gx2 + 0.5) * cell * z, (gy2 + 0.5) * cell * z,
+                                           width=width, fill=color, tags=("scene",))
+            self.canvas.tag_lower(line)
+            self.cluster_edges[key] = (line, width)
+
+    def _draw_comment(self, cid: int):
+        data = comments[cid]
+        x, y = data["x"], data["y"]
+        w, h = max(30, data.get("w", COMMENT_W)), max(20, data.get("h", COMMENT_H))
+        data["w"], data["h"] = w, h
+
+        text_key = (data.get("text", ""), self.settings.get('disable_text_truncation', False))
+        key = (x, y, w, h, text_key, cid == self.selected_comment)
+        old = self.comment_scene.get(cid)
+        if old == key:
+            return
+        self.comment_scene[cid] = key
+        z = self.current_zoom
+        show_text = self.lod_tier == LOD_FULL
 
-            # Text (truncated)
-            font_obj = tkFont.Font(family="Arial", size=10)
-            display_text = self.truncate_text_to_fit(data.get("text",""), font_obj, w-10, h-10)
+        # Text (truncated)
+        if show_text and (old is None or old[2:5] != key[2:5]):
+            display_text = self.truncate_text_to_fit(text_key[0], self.fonts.get("Arial", 10, FONT_LAYOUT), w-10, h-10)
+        else:
+            display_text = None
 
-            if cid in getattr(self, "comment_texts", {}):
-                self.canvas.itemconfig(self.comment_texts[cid], text=display_text)
-                self.canvas.coords(self.comment_texts[cid], x + 5, y + 5)
-            else:
-                if not hasattr(self, "comment_texts"):
-                    self.comment_texts = {}
-                text_id = self.canvas.create_text(
-                    x + 5, y + 5, anchor="nw", text=display_text,
-                    font=font_obj, width=w-10, fill="#333333",
-                    tags=("comment_text", str(cid))
+        if old is None:
+            self.comment_rects[cid] = self.canvas.create_rectangle(
+                x * z, y * z, (x + w) * z, (y + h) * z,
+                fill="#FFA500", outline="#FFCC66", width=2,
+                tags=("scene", "comment", str(cid))
+            )
+            if show_text:
+                self.comment_texts[cid] = self.canvas.create_text(
+                    (x + 5) * z, (y + 5) * z, anchor="nw", text=display_text,
+                    font=self.fonts.get("Arial", 10, self.lod_tier), width=(w-10) * z, fill="#333333",
+                    tags=("scene", "comment_text", str(cid), f"wrap_{float(w)}")
                 )
-                self.comment_texts[cid] = text_id
-
-            # Create handles only for the selected comment
-            if cid == self.selected_comment:
-                handles = {}
-                # Handles are created relative to the comment's current position and size
-                handles["nw"] = self.canvas.create_rectangle(x-HANDLE_SIZE, y-HANDLE_SIZE, x+HANDLE_SIZE, y+HANDLE_SIZE, fill="#222", tags=(f"handle_{cid}", "nw"))
-                handles["ne"] = self.canvas.create_rectangle(x+w-HANDLE_SIZE, y-HANDLE_SIZE, x+w+HANDLE_SIZE, y+HANDLE_SIZE, fill="#222", tags=(f"handle_{cid}", "ne"))
-                handles["sw"] = self.canvas.create_rectangle(x-HANDLE_SIZE, y+h-HANDLE_SIZE, x+HANDLE_SIZE, y+h+HANDLE_SIZE, fill="#222", tags=(f"handle_{cid}", "sw"))
-                handles["se"] = self.canvas.create_rectangle(x+w-HANDLE_SIZE, y+h-HANDLE_SIZE, x+w+HANDLE_SIZE, y+h+HANDLE_SIZE, fill="#222", tags=(f"handle_{cid}", "se"))
-                data["handles"] = handles
-            else:
-                # ensure no handles stored for unselected comments
-                data["handles"] = {}
+                self._count_wrap(w, 1)
+        else:
+            if old[:4] != key[:4]:
+                self.canvas.coords(self.comment_rects[cid], x * z, y * z, (x + w) * z, (y + h) * z)
+                if show_text:
+                    self.canvas.coords(self.comment_texts[cid], (x + 5) * z, (y + 5) * z)
+            if cid in self.comment_texts and old[2] != w:
+                item = self.comment_texts[cid]
+                self.canvas.dtag(item, f"wrap_{float(old[2])}")
+                self.canvas.addtag_withtag(f"wrap_{float(w)}", item)
+                self._count_wrap(old[2], -1)
+                self._count_wrap(w, 1)
+            if display_text is not None:
+                self.canvas.itemconfig(self.comment_texts[cid], text=display_text, width=(w-10) * z)
+
+        # Handles only for the selected comment, relative to its current position and size
+        self.clear_comment_handles(cid)
+        if cid == self.selected_comment:
+            x, y, w, h = x * z, y * z, w * z, h * z
+            handles = {}
+            handles["nw"] = self.canvas.create_rectangle(x-HANDLE_SIZE, y-HANDLE_SIZE, x+HANDLE_SIZE, y+HANDLE_SIZE, fill="#222", tags=("scene", f"handle_{cid}", "nw"))
+            handles["ne"] = self.canvas.create_rectangle(x+w-HANDLE_SIZE, y-HANDLE_SIZE, x+w+HANDLE_SIZE, y+HANDLE_SIZE, fill="#222", tags=("scene", f"handle_{cid}", "ne"))
+            handles["sw"] = self.canvas.create_rectangle(x-HANDLE_SIZE, y+h-HANDLE_SIZE, x+HANDLE_SIZE, y+h+HANDLE_SIZE, fill="#222", tags=("scene", f"handle_{cid}", "sw"))
+            handles["se"] = self.canvas.create_rectangle(x+w-HANDLE_SIZE, y+h-HANDLE_SIZE, x+w+HANDLE_SIZE, y+h+HANDLE_SIZE, fill="#222", tags=("scene", f"handle_{cid}", "se"))
+            data["handles"] = handles
+
+    def _remove_comment_items(self, cid: int): # the comment is gone
+        self.comment_grid.remove(cid)
+        self._hide_comment(cid)
+
+    def _count_wrap(self, w: float, n: int):
+        w = float(w) # the same width as an int or a float is one tag
+        left = self.comment_wraps.get(w, 0) + n
+        if left:
+            self.comment_wraps[w] = left
+        else:
+            self.comment_wraps.pop(w, None)
+
+    def _hide_comment(self, cid: int): # the comment left the view; drop its canvas items
+        old = self.comment_scene.pop(cid, None)
+        if cid in self.comment_texts:
+            self._count_wrap(old[2], -1)
+        self.clear_comment_handles(cid)
+        for items in (self.comment_rects, self.comment_texts):
+            item = items.pop(cid, None)
+            if item is not None:
+                self.canvas.delete(item)
 
     def select_comment(self, event): # selects a comment
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        for cid, data in comments.items():
-            w, h = data.get("w", COMMENT_W), data.get("h", COMMENT_H)
-            if data["x"] <= x <= data["x"] + w and data["y"] <= y <= data["y"] + h:
-                self.selected_comment = cid
-                self.load_comment_into_inspector()
-                break
+        cid = self.get_comment_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if cid is not None:
+            self.selected_comment = cid
+            self.load_comment_into_inspector()
 
     def load_comment_into_inspector(self):
         if self.selected_comment is None: 
@@ -2873,17 +5621,20 @@ class VisualEditor(tk.Frame):
 
     def apply_comment_edits(self, redraw_canvas=True): # apply comment edits to the comment
         if self.selected_comment is None: return
+        self._typing_undo(("comment", self.selected_comment))
         comments[self.selected_comment]["text"] = self.header_text.get("1.0", tk.END).strip()
         if redraw_canvas:
             self.redraw()
 
     def get_node_at(self, x, y): # gets node at (usually at mouse)
         scale = self.current_zoom
-        for nid, data in nodes.items():
-            nx, ny = data.get("x", 50) * scale, data.get("y", 50) * scale
-            if nx <= x <= nx + NODE_W * scale and ny <= y <= ny + NODE_H * scale:
-                return nid
-        return None
+        hits = self.node_grid.query_point(x / scale, y / scale)
+        return hits[0] if hits else None
+
+    def get_comment_at(self, x, y): # gets comment at (usually at mouse)
+        scale = self.current_zoom
+        hits = self.comment_grid.query_point(x / scale, y / scale)
+        return hits[0] if hits else None
 
     def start_resize(self, event): # start resizing (comment)
         self.resizing_comment = None
@@ -2904,15 +5655,16 @@ class VisualEditor(tk.Frame):
                             break
 
         if self.resizing_comment:
-            self.resize_start = (x, y)  # canvas coords
+            self.begin_undo() # ended by canvas_mouse_up
+            self.resize_start = (x / self.current_zoom, y / self.current_zoom)  # model coords
             comment = comments[self.resizing_comment]
             self.orig_pos = (comment["x"], comment["y"], comment["w"], comment["h"])
 
     def do_resize(self, event): # do resizing (comment)
         if not self.resizing_comment: return
 
-        # convert mouse coords to canvas coords
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        # convert mouse coords to model coords
+        x, y = self.event_to_model(event)
         dx = x - self.resize_start[0]
         dy = y - self.resize_start[1]
 
@@ -2945,7 +5697,7 @@ class VisualEditor(tk.Frame):
             comment["w"] = new_w
             comment["h"] = new_h
 
-        self.redraw()
+        self.refresh_comment(cid)
 
     def stop_resize(self, event): # stop resizing (comment)
         self.resizing_comment = None
@@ -2960,16 +5712,18 @@ class VisualEditor(tk.Frame):
         self.dragging_comment = False
         
         # Check if clicked on a comment
-        for cid, c in comments.items():
-            if c["x"] <= cx <= c.get("x", 0) + c.get("w", 150) and c["y"] <= cy <= c.get("y", 0) + c.get("h", 50):
-                self.selected_comment = cid
-                self.dragging_comment = True
-                self.comment_offset = (cx - c["x"], cy - c["y"])
-                self.selected_node = None        # deselect any node
-                self.multi_selected_nodes.clear()  # clear multi-selection
-                self.load_comment_into_inspector()
-                self.redraw()
-                return
+        cid = self.get_comment_at(cx, cy)
+        if cid is not None:
+            c = comments[cid]
+            self.selected_comment = cid
+            self.dragging_comment = True
+            self.comment_offset = (cx / self.current_zoom - c["x"], cy / self.current_zoom - c["y"])
+            self.begin_undo() # the drag is one undo step; ended on mouse up
+            self.selected_node = None        # deselect any node
+            self.multi_selected_nodes.clear()  # clear multi-selection
+            self.load_comment_into_inspector()
+            self.redraw()
+            return
 
         if getattr(self, "mode", None) == "disconnect" and hasattr(self, "disconnect_source"):
             if clicked_node is not None and clicked_node != self.disconnect_source:
@@ -2978,6 +5732,7 @@ class VisualEditor(tk.Frame):
                 nodes[self.disconnect_source]["options"] = [
                     o for o in src_opts if o.get("next") != str(clicked_node)
                 ]
+                story_graph.update_node(self.disconnect_source)
                 self.redraw()
                 self.load_selected_into_inspector()
                 self.show_toast(f"Disconnected {self.disconnect_source} > {clicked_node}", color="red")
@@ -2997,6 +5752,7 @@ class VisualEditor(tk.Frame):
                     "condition": "",
                     "actions": []
                 })
+                story_graph.update_node(source)
                 self.selected_node = source
                 self.load_selected_into_inspector()
                 self.redraw()
@@ -3014,16 +5770,16 @@ class VisualEditor(tk.Frame):
                 
                 self.dragging_multi = True
                 self.drag_offsets_multi = {
-                    nid: (cx - nodes[nid]["x"], cy - nodes[nid]["y"])
+                    nid: (cx / self.current_zoom - nodes[nid]["x"], cy / self.current_zoom - nodes[nid]["y"])
                     for nid in self.multi_selected_nodes
                 }
             else:
                 
                 self.dragging_multi = False
                 node_x, node_y = nodes[clicked_node].get("x", 50), nodes[clicked_node].get("y", 50)
-                self.drag_offset = (cx - node_x, cy - node_y)
+                self.drag_offset = (cx / self.current_zoom - node_x, cy / self.current_zoom - node_y)
                 self.multi_selected_nodes.clear()
-            self.push_undo()
+            self.begin_undo() # the drag is one undo step; ended on mouse up
             self.load_selected_into_inspector()
             self.redraw()
         else:
@@ -3047,12 +5803,12 @@ class VisualEditor(tk.Frame):
 
         # Cursor position if event is provided
         if event is not None:
-            x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+            x, y = self.event_to_model(event)
         else:
             # Fallback: center of canvas
             if x is None or y is None:
                 w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
-                x, y = self.canvas.canvasx(w / 2), self.canvas.canvasy(h / 2)
+                x, y = self.canvas.canvasx(w / 2) / self.current_zoom, self.canvas.canvasy(h / 2) / self.current_zoom
 
         cid = max(comments.keys(), default=0) + 1
         width = self.settings.get('default_comment_w', COMMENT_W)
@@ -3093,16 +5849,15 @@ class VisualEditor(tk.Frame):
                 break
 
     def canvas_mouse_move(self, event): # called on mouse_move
-        cx, cy = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        scale = self.current_zoom
+        mx, my = self.event_to_model(event)
 
         # comment drag first
         if getattr(self, "dragging_comment", False) and self.selected_comment is not None:
             if getattr(self, "resizing_comment", None) is None:  # only drag if NOT resizing
                 ox, oy = self.comment_offset
-                comments[self.selected_comment]["x"] = cx - ox
-                comments[self.selected_comment]["y"] = cy - oy
-                self.redraw()
+                comments[self.selected_comment]["x"] = mx - ox
+                comments[self.selected_comment]["y"] = my - oy
+                self.refresh_comment(self.selected_comment)
             return
 
         if not getattr(self, "dragging", False) or (self.selected_node is None and not self.dragging_multi):
@@ -3110,18 +5865,21 @@ class VisualEditor(tk.Frame):
 
         if getattr(self, "dragging_multi", False):
             for nid, (ox, oy) in self.drag_offsets_multi.items():
-                nodes[nid]["x"] = int((cx - ox) / scale)
-                nodes[nid]["y"] = int((cy - oy) / scale)
+                nodes[nid]["x"] = int(mx - ox)
+                nodes[nid]["y"] = int(my - oy)
+                story_graph.touch(nid)
+            self.refresh_nodes(self.drag_offsets_multi)
         elif self.selected_node is not None:
             ox, oy = self.drag_offset
-            nodes[self.selected_node]["x"] = int((cx - ox) / scale)
-            nodes[self.selected_node]["y"] = int((cy - oy) / scale)
-
-        self.redraw()
+            nodes[self.selected_node]["x"] = int(mx - ox)
+            nodes[self.selected_node]["y"] = int(my - oy)
+            story_graph.touch(self.selected_node)
+            self.refresh_nodes((self.selected_node,))
 
     def canvas_mouse_up(self, event): # called on mouse_up
         self.dragging_comment = False
         self.dragging = False
+        self.end_undo()
 
     def load_selected_into_inspector(self): # load selected node into inspector
         if self.selected_node is None:
@@ -3139,6 +5897,7 @@ class VisualEditor(tk.Frame):
             for opt in data.get("options",[]):
                 self.options_text.insert(tk.END, format_option_line(opt) + "\n")
         
+        self._highlight_lines = None # the old text and its tags are gone
         self._schedule_highlight()
         
         self.vars_list.delete("1.0", tk.END)
@@ -3152,6 +5911,7 @@ class VisualEditor(tk.Frame):
         self.id_label.config(text="ID: -")
         self.header_text.delete("1.0", tk.END)
         self.options_text.delete("1.0", tk.END)
+        self._highlight_lines = None
         self._schedule_highlight()
         if keepVarsList == False:
             self.vars_list.delete("1.0", tk.END)
@@ -3230,7 +5990,7 @@ class VisualEditor(tk.Frame):
             # first-time save, ask user where
             filepath = filedialog.asksaveasfilename(
                 defaultextension=".json",
-                filetypes=[("Branch Story Files", "*.json"), ("All Files", "*.*")]
+                filetypes=[("Branch Story Files", "*.json"), ("Branch Binary Story", "*" + BINARY_STORY_EXT), ("Branch Project Database", "*" + SQLITE_STORY_EXT), ("All Files", "*.*")]
             )
             if not filepath:
                 return
@@ -3242,11 +6002,23 @@ class VisualEditor(tk.Frame):
         data = {
             "nodes": nodes,
             "vars_store": vars_store,
-            "inventory": inventory
+            "inventory": inventory,
+            "start_node": START_NODE
         }
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
+            self.writer.flush() # a journal append still queued must not land after the compaction
+            if filepath.endswith(BINARY_STORY_EXT):
+                write_story_binary(filepath, data)
+            elif filepath.endswith(SQLITE_STORY_EXT):
+                write_story_sqlite(filepath, data)
+            else:
+                write_json_atomic(filepath, data)
+            # the journal is compacted into the file we just wrote
+            self._journal_pending.clear()
+            self._journal_start = START_NODE
+            self._save_generation += 1
+            if os.path.exists(journal_path(filepath)):
+                os.remove(journal_path(filepath))
             self.show_toast(f"Saved to {filepath}")
         except Exception as e:
             self.show_toast("Failed to save!", color="red")
@@ -3257,7 +6029,7 @@ class VisualEditor(tk.Frame):
         global CURRENT_FILE
         filepath = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("Branch Story Files", "*.json"), ("All Files", "*.*")]
+            filetypes=[("Branch Story Files", "*.json"), ("Branch Binary Story", "*" + BINARY_STORY_EXT), ("Branch Project Database", "*" + SQLITE_STORY_EXT), ("All Files", "*.*")]
         )
         if not filepath:
             return
@@ -3266,47 +6038,165 @@ class VisualEditor(tk.Frame):
         self.update_title()
 
     def load_story_dialog(self):
-        global CURRENT_FILE
         filepath = filedialog.askopenfilename(
-            filetypes=[("Branch Story Files", "*.json"), ("All Files", "*.*")]
+            filetypes=[("Branch Story Files", "*.json"), ("Branch Binary Story", "*" + BINARY_STORY_EXT), ("Branch Project Database", "*" + SQLITE_STORY_EXT), ("All Files", "*.*")]
         )
         if not filepath:
             return
+        # unsaved edits live in the story's journal, which the load offers to replay (old .autosave.json files are ignored)
+        self.start_story_load(filepath)
 
-        base, ext = os.path.splitext(filepath)
-        autosave_path = base + ".autosave.json"
+    def start_story_load(self, filepath: str): # clears the editor, then streams the story in from a worker thread
+        global CURRENT_FILE
+        self._apply_pending_inspector_edits()
+        self._load_token += 1
+        token = self._load_token
+        if self._load_snapshot is None: # a load that replaces an unfinished one falls back to what was open before both
+            if not self._undo_txn:
+                self._close_undo_entry()
+            self._load_snapshot = {
+                "nodes": dict(nodes), "vars": dict(vars_store), "inventory": list(inventory), "file": CURRENT_FILE,
+                "undo": (list(self.undo_stack), list(self.redo_stack), self._undo_base),
+                "journal": (self._journal_pending, self._journal_start),
+            }
+            self._journal_pending = []
+        CURRENT_FILE = None # nothing is journaled until the load finishes
+        nodes.clear(); vars_store.clear(); inventory.clear()
+        story_graph.rebuild(nodes)
+        # a new story starts a new undo history; its base is filled in batch by batch instead of with one big copy at the end
+        self.undo_stack.clear(); self.redo_stack.clear()
+        self._undo_open = self._undo_txn = False
+        self._undo_base = {"nodes": {}, "comments": copy.deepcopy(comments), "vars": {}, "inventory": []}
+        self.selected_node = None
+        self.multi_selected_nodes.clear()
+        self.clear_inspector(True)
+        self.redraw()
+        self.load_progress["value"] = 0
+        self.load_progress.pack(side='right', padx=6)
 
-        # Decide which file to load
-        load_path = filepath
-        if os.path.exists(autosave_path):
-            if messagebox.askyesno(
-                "Autosave Found",
-                f"An autosave exists for {os.path.basename(filepath)}.\n\nLoad the autosave instead?"
-            ):
-                load_path = autosave_path
+        results: "queue.Queue" = queue.Queue()
+        threading.Thread(target=self._story_load_worker, args=(filepath, token, results), daemon=True).start()
+        self.after(10, self._poll_story_load, filepath, token, results, {})
 
-        # Try loading
+    def _story_load_worker(self, path: str, token: int, results: "queue.Queue"): # runs off the Tk thread; no widget access here
+        batch = []
+        fraction = 0.0
         try:
-            with open(load_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            nodes.clear(); nodes.update(data.get("nodes", {}))
-            vars_store.clear(); vars_store.update(data.get("vars_store", {}))
-            inventory.clear(); inventory.extend(data.get("inventory", []))
-            CURRENT_FILE = filepath  # always point to the main file
-            self.selected_node = None
-            self.redraw()
-            self.update_node_count()
-            self.load_selected_into_inspector()
-            self.update_title()
+            for kind, key, val, fraction in iter_story_file(path):
+                if token != self._load_token:
+                    return # superseded by another load
+                if kind == "meta":
+                    results.put(("meta", (key, val), fraction))
+                    continue
+                batch.append((key, val))
+                if len(batch) >= LOAD_BATCH:
+                    results.put(("nodes", batch, fraction))
+                    batch = []
+            results.put(("nodes", batch, 1.0))
+            results.put(("done", None, 1.0))
+        except Exception as e:
+            results.put(("error", e, fraction))
 
-            # Toast
-            if load_path == autosave_path:
-                self.show_toast(f"Loaded autosave for {os.path.basename(filepath)}", color="blue")
+    def _poll_story_load(self, filepath: str, token: int, results: "queue.Queue", meta: Dict[str, Any]):
+        # adds what the loader thread produced, a time slice per tick, so the editor keeps responding
+        if token != self._load_token:
+            return
+        deadline = time.perf_counter() + LOAD_FRAME_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                kind, payload, fraction = results.get_nowait()
+            except queue.Empty:
+                break
+            self.load_progress["value"] = fraction
+            if kind == "meta":
+                meta[payload[0]] = payload[1]
+            elif kind == "nodes":
+                nodes.update(payload)
+                base = self._undo_base["nodes"]
+                for nid, data in payload:
+                    story_graph.update_node(nid)
+                    base[nid] = copy.deepcopy(data)
+                self.refresh_nodes([nid for nid, _ in payload])
+                self.node_count_label.configure(text=f"Loading… {len(nodes)} nodes")
+            elif kind == "done":
+                self._finish_story_load(filepath, meta)
+                return
             else:
-                self.show_toast(f"Loaded {filepath}")
+                self._restore_load_snapshot()
+                self.show_toast(f"Failed to load: {payload}", color="red")
+                return
+        self.after(10, self._poll_story_load, filepath, token, results, meta)
 
-        except Exception as e:
-            self.show_toast(f"Failed to load: {e}", color="red")
+    def _restore_load_snapshot(self): # a load failed part way: put back the story that was open before it
+        global CURRENT_FILE
+        snapshot, self._load_snapshot = self._load_snapshot, None
+        nodes.clear(); nodes.update(snapshot["nodes"])
+        vars_store.clear(); vars_store.update(snapshot["vars"])
+        inventory.clear(); inventory.extend(snapshot["inventory"])
+        story_graph.rebuild(nodes)
+        CURRENT_FILE = snapshot["file"]
+        self.undo_stack[:], self.redo_stack[:], self._undo_base = snapshot["undo"]
+        self._journal_pending, self._journal_start = snapshot["journal"]
+        self.selected_node = None
+        self.multi_selected_nodes.clear()
+        self.load_progress.pack_forget()
+        if self.show_unreachable.get():
+            self.unreachable_nodes = set(self._analyze_base()["unreachable"])
+        self.redraw()
+        self.update_node_count()
+        self.clear_inspector(True)
+        self.update_title()
+
+    def _finish_story_load(self, filepath: str, meta: Dict[str, Any]):
+        global CURRENT_FILE, START_NODE
+        self._load_snapshot = None # the story that was open before is gone for good
+        self._close_undo_entry() # edits made while the story was loading keep their undo step
+        story = {
+            "nodes": nodes,
+            "vars_store": meta.get("vars_store", {}),
+            "inventory": meta.get("inventory", []),
+            "start_node": meta.get("start_node", START_NODE)
+        }
+
+        # Edits that were journaled but never saved (the editor closed or crashed)
+        recovered = 0
+        jpath = journal_path(filepath)
+        if os.path.exists(jpath):
+            if messagebox.askyesno(
+                "Unsaved Edits Found",
+                f"{os.path.basename(filepath)} has edits that were never saved.\n\nRecover them?"
+            ):
+                recovered = replay_journal(jpath, story)
+                story_graph.rebuild(nodes)
+            else:
+                os.replace(jpath, jpath + ".discarded") # kept around, but no longer replayed
+
+        vars_store.clear(); vars_store.update(story["vars_store"])
+        inventory.clear(); inventory.extend(story["inventory"])
+        START_NODE = story["start_node"]
+        CURRENT_FILE = filepath  # always point to the main file
+        # what was just loaded (and recovered) is the new undo base, and already on disk: don't journal it again
+        base = self._undo_base
+        if recovered:
+            sync_frozen(nodes, base["nodes"])
+        base["vars"] = vars_store.copy()
+        base["inventory"] = inventory.copy()
+        self._journal_pending.clear()
+        self._journal_start = START_NODE
+        self._save_generation += 1
+        self.load_progress.pack_forget()
+        if self.show_unreachable.get():
+            self.unreachable_nodes = set(self._analyze_base()["unreachable"]) # drawn by the redraw below
+        self.redraw()
+        self.update_node_count()
+        self.load_selected_into_inspector()
+        self.update_title()
+
+        # Toast
+        if recovered:
+            self.show_toast(f"Loaded {filepath} and recovered {recovered} unsaved edits", color="blue")
+        else:
+            self.show_toast(f"Loaded {filepath}")
 
     def toggle_mode(self): # toggle mode (play>editor, editor>play)
         if self.mode == "editor":
@@ -3315,15 +6205,32 @@ class VisualEditor(tk.Frame):
         else:
             self.enter_editor_mode()
 
+    def new_play_engine(self) -> StoryEngine: # builds a StoryEngine over the current story, starting from the Variables & Inventory box
+        default_vars, default_inventory = {}, []
+        defaults = self.vars_list.get("1.0", tk.END).strip().splitlines()
+        for line in defaults:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("inv:"):
+                item = line.split(":", 1)[1].strip()
+                if item:
+                    default_inventory.append(item)
+            elif "=" in line:
+                name, val = line.split("=", 1)
+                name, val = name.strip(), val.strip()
+                try:
+                    default_vars[name] = safe_eval_expr(val, default_vars)
+                except Exception:
+                    default_vars[name] = val
+        return StoryEngine(nodes, START_NODE, default_vars, default_inventory)
+
     def enter_play_mode(self):  # enter play mode
         self._apply_pending_inspector_edits()
-        self.editor_vars_backup = copy.deepcopy(vars_store)
-        self.editor_inventory_backup = inventory.copy()
-        self.nodes_backup = copy.deepcopy(nodes)
 
         self.mode = "play"
         self.mode_button.configure(text="Switch to Editor Mode")
-        self.reset_state()
+        self.play_engine = self.new_play_engine()
 
         dark_bg = "#1e1e1e"
         fg = "#e0e0e0"
@@ -3385,194 +6292,89 @@ class VisualEditor(tk.Frame):
 
         # State + first render
         self.play_current = getattr(self, "play_current", START_NODE)
-        self.play_path = []
+        self.play_session = self.play_engine.start(self.play_current)
         self.play_render_current()
 
     def enter_editor_mode(self): # enter editor mode
-        global vars_store, inventory, nodes
         self.mode = "editor"
         self.mode_button.configure(text="Switch to Play Mode")
 
-        # Restore the editor's variable state from backup and nodes incase headers have been changed
-        if self.editor_vars_backup is not None:
-            vars_store = self.editor_vars_backup
-            self.editor_vars_backup = None
-        if self.editor_inventory_backup is not None:
-            inventory = self.editor_inventory_backup
-            self.editor_inventory_backup = None
-        if self.nodes_backup is not None:
-            nodes = self.nodes_backup
-            self.nodes_backup = None
+        # Play mode runs on its own PlaySession, so the editor's variables, inventory and nodes were never touched
+        self.play_session = None
 
         try:
             self.play_window.destroy()
         except Exception:
             pass
 
-        # Refresh the inspector to show the restored values
         self.load_selected_into_inspector()
 
     def close_play(self): # close play
-        # Cancel any pending timer job when closing the play window
-        if hasattr(self, 'play_timer_job') and self.play_timer_job:
-            self.after_cancel(self.play_timer_job)
-            self.play_timer_job = None
-
-        # Cancel any pending choice-level lifetime jobs
-        if hasattr(self, 'play_lifetime_jobs'):
-            for job in self.play_lifetime_jobs:
-                self.after_cancel(job)
-            self.play_lifetime_jobs = []
-            self.lifetime_start_times = {}
-
+        self._cancel_play_tick()
         self.enter_editor_mode()
 
-    def reset_state(self): # reset state (variables and inventory for play mode)
-        vars_store.clear()
-        inventory.clear()
-        defaults = self.vars_list.get("1.0", tk.END).strip().splitlines()
-        for line in defaults:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("inv:"):
-                item = line.split(":", 1)[1].strip()
-                if item:
-                    inventory.append(item)
-            elif "=" in line:
-                name, val = line.split("=", 1)
-                name, val = name.strip(), val.strip()
-                try:
-                    vars_store[name] = safe_eval_expr(val, vars_store)
-                except Exception:
-                    vars_store[name] = val
-
     def play_restart(self): # restart the play [mode] session
-        # Cancel any pending timer job on restart
-        if hasattr(self, 'play_timer_job') and self.play_timer_job:
-            self.after_cancel(self.play_timer_job)
-            self.play_timer_job = None
-
-        # Cancel any pending choice-level lifetime jobs
-        if hasattr(self, 'play_lifetime_jobs'):
-            for job in self.play_lifetime_jobs:
-                self.after_cancel(job)
-            self.play_lifetime_jobs = []
-            self.lifetime_start_times = {}
-
-        self.reset_state()
-        self.play_current = START_NODE; self.play_path = []; self.play_render_current()
+        self._cancel_play_tick()
+        self.play_engine = self.new_play_engine()
+        self.play_current = START_NODE
+        self.play_session = self.play_engine.start(self.play_current)
+        self.play_render_current()
 
     @staticmethod
-    def substitute_vars(text: str) -> str: # substitute variables, used for inline variable support such as "Clicks: {CLICKS}" ({CLICKS} gets replaced with the variable 'CLICKS' if it exists)
-        if not text:
-            return ""
-        def repl(match):
-            key = match.group(1)
-            return str(vars_store.get(key, f"{{{key}}}"))
-        return re.sub(r"\{(\w+)\}", repl, text)
-    
+    def substitute_vars(text: str, variables: Optional[Dict[str, Any]] = None) -> str:
+        return substitute_vars(text, variables)
+
+    def _cancel_play_tick(self):
+        if self.play_tick_job:
+            self.after_cancel(self.play_tick_job)
+            self.play_tick_job = None
+
+    def _schedule_play_tick(self): # wake up when the session's timer or next lifetime() is due
+        self._cancel_play_tick()
+        delay = self.play_session.next_event_in() if self.play_session else None
+        if delay is not None:
+            self.play_tick_time = time.monotonic()
+            self.play_tick_job = self.after(int(delay * 1000), self._play_tick)
+
+    def _play_tick(self):
+        self.play_tick_job = None
+        if not hasattr(self, 'play_window') or not self.play_window.winfo_exists() or self.play_session is None:
+            return
+        now = time.monotonic()
+        elapsed, self.play_tick_time = now - self.play_tick_time, now
+        if self.play_session.tick(elapsed):
+            self.play_render_current()
+        else:
+            self._schedule_play_tick()
+
     def play_render_current(self):
-        # Cancel any pending timer from the previous node
-        if hasattr(self, 'play_timer_job') and self.play_timer_job:
-            self.after_cancel(self.play_timer_job)
-            self.play_timer_job = None
-
-        # On new node, reset lifetime timers
-        if not hasattr(self, 'last_rendered_node') or self.last_rendered_node != self.play_current:
-            if hasattr(self, 'play_lifetime_jobs'):
-                for job in self.play_lifetime_jobs:
-                    self.after_cancel(job)
-                self.play_lifetime_jobs = []
-            if hasattr(self, 'lifetime_start_times'):
-                self.lifetime_start_times = {}
-            self.last_rendered_node = self.play_current
-
-        # Run instant leaves
-        self.play_current = run_instant_leaves(self.play_current)
-
-        if self.play_current not in nodes:
+        session = self.play_session
+        self.play_current = session.current
+        self._schedule_play_tick()
+
+        # clear old choices
+        for w in self.choice_frame.winfo_children():
+            w.destroy()
+
+        if session.end_reason == "missing":
             if self.settings.get('show_path', True):
                 self.play_header.configure(
-                    text=f"[END] Node {self.play_current} not found. Path: {' -> '.join(map(str,self.play_path))}"
+                    text=f"[END] Node {session.current} not found. Path: {' -> '.join(map(str, session.path))}"
                 )
             else:
-                self.play_header.configure(text=f"[END] Node {self.play_current} not found.")
-            for w in self.choice_frame.winfo_children():
-                w.destroy()
+                self.play_header.configure(text=f"[END] Node {session.current} not found.")
             return
 
-        node = nodes[self.play_current]
-        self.play_path.append(self.play_current)
+        if session.end_reason == "end":
+            self.play_header.config(text="[THE END]")
+            tk.Button(self.choice_frame, text="Play Again", command=self.play_restart).pack(pady=(6,0))
+            tk.Button(self.choice_frame, text="Close Play", command=self.close_play).pack(pady=(6,0))
+            return
 
         # substitute variables in header
-        self.play_header.configure(text=self.substitute_vars(node.get("header", "")))
-
-        # Scan for and set up a node-level timer
-        for opt_raw in node.get("options", []):
-            opt = parse_option_line(opt_raw)
-            if opt and opt.get("instant") and "timer" in opt:
-                seconds = opt.get("timer")
-                actions = opt.get("actions", [])
-                sep = opt.get("separator", ">")
-                if seconds and actions:
-                    self.play_timer_job = self.after(
-                        int(seconds * 1000),
-                        lambda a=actions, s=sep: self._execute_timed_action(a, s)
-                    )
-                    break  # Only one timer per node is supported
-
-        # Gather visible leaves
-        visible = []
-        for i, opt_raw in enumerate(node.get("options", [])):
-            opt = parse_option_line(opt_raw)
-            if not opt or opt.get("instant"):
-                continue
-            cond_str = opt.get("condition", "") or ""
-
-            # Handle lifetime(N) condition
-            lifetime_match = re.search(r'lifetime\((\d+)\)', cond_str)
-            if lifetime_match:
-                lifetime_seconds = int(lifetime_match.group(1))
-                key = (self.play_current, i)
-
-                start_time = self.lifetime_start_times.get(key)
-                if start_time:
-                    if time.time() - start_time >= lifetime_seconds:
-                        continue
-                else:
-                    self.lifetime_start_times[key] = time.time()
-                    job = self.after(lifetime_seconds * 1000, self.play_render_current)
-                    self.play_lifetime_jobs.append(job)
-
-                cond_str = cond_str[:lifetime_match.start()] + cond_str[lifetime_match.end():]
-
-            cond_parts = [p.strip() for p in re.split(r'[&;]', cond_str) if p.strip()]
-            other_conds = []
-            chance_passed = True
-
-            for part in cond_parts:
-                if part.startswith('chance(') and part.endswith(')'):
-                    try:
-                        chance_val = float(part[7:-1])
-                        if random.uniform(0, 100) > chance_val:
-                            chance_passed = False
-                            break
-                    except (ValueError, IndexError):
-                        pass
-                else:
-                    other_conds.append(part)
-
-            if not chance_passed:
-                continue
-
-            remaining_cond = " & ".join(other_conds)
-            if evaluate_condition(remaining_cond, node):
-                visible.append(opt)
+        self.play_header.configure(text=substitute_vars(session.header, session.vars))
 
-        # clear old choices
-        for w in self.choice_frame.winfo_children():
-            w.destroy()
+        visible = session.visible_options()
 
         # end screen
         if not visible:
@@ -3581,7 +6383,7 @@ class VisualEditor(tk.Frame):
             if self.settings.get("show_path", True):
                 ctk.CTkLabel(
                     self.choice_frame,
-                    text="Path: " + " -> ".join(map(str, self.play_path))
+                    text="Path: " + " -> ".join(map(str, session.path))
                 ).pack(pady=(0, 6))
 
             ctk.CTkButton(
@@ -3612,13 +6414,13 @@ class VisualEditor(tk.Frame):
             return
 
         # visible choices
-        for opt in visible:
-            opt_text = self.substitute_vars(opt.get("text", "choice"))
+        for i, opt in enumerate(visible):
+            opt_text = substitute_vars(opt.get("text", "choice"), session.vars)
             ctk.CTkButton(
                 self.choice_frame,
                 text=opt_text,
                 anchor="w",
-                command=lambda o=opt: self.play_pick(o),
+                command=lambda i=i: self.play_pick(i),
                 width=100,      
                 height=28,     
                 fg_color="#1e1e1e",  
@@ -3626,60 +6428,16 @@ class VisualEditor(tk.Frame):
                 text_color="white",   
                 corner_radius=6      
             ).pack(pady=2)
-        
-    def _execute_timed_action(self, actions: List[str], sep: str = ">"):
-        if not hasattr(self, 'play_window') or not self.play_window.winfo_exists():
-            return
-
-        self.play_timer_job = None  # Clear job ref
-
-        current_node = nodes.get(self.play_current)
-        if current_node:
-            for act in actions:
-                handle_action_with_separators(act, sep, current_node)
 
-        if "__goto" in vars_store:
-            nxt = resolve_next(vars_store.pop("__goto"))
-            if nxt is not None:
-                self.play_current = nxt
-                self.play_render_current()
-        else:
-            self.play_render_current()
-
-    def play_pick(self, opt):
-            # A choice was picked, so cancel any active timer.
-            if hasattr(self, 'play_timer_job') and self.play_timer_job:
-                self.after_cancel(self.play_timer_job)
-                self.play_timer_job = None
-
-            # Cancel any pending choice-level lifetime jobs
-            if hasattr(self, 'play_lifetime_jobs'):
-                for job in self.play_lifetime_jobs:
-                    self.after_cancel(job)
-                self.play_lifetime_jobs = []
-                # No need to clear lifetime_start_times here, it's handled by play_render_current on node change
-
-            # Get the current node data
-            current_node = nodes.get(self.play_current)
-            if current_node:
-                # Execute actions associated with the chosen option, passing the current node
-                execute_actions(opt.get("actions", []), current_node)
-
-            nxt = resolve_next(opt.get("next"))
-            if nxt is None:
-                self.play_header.config(text="[THE END]")
-                for w in self.choice_frame.winfo_children():
-                    w.destroy()
-                tk.Button(self.choice_frame, text="Play Again", command=self.play_restart).pack(pady=(6,0))
-                tk.Button(self.choice_frame, text="Close Play", command=self.close_play).pack(pady=(6,0))
-                return
-
-            # run instant leaves in the next node (cascading)
-            self.play_current = run_instant_leaves(nxt)
-            self.play_render_current()
+    def play_pick(self, index: int):
+        # A choice was picked, so cancel any pending timer/lifetime wake-up.
+        self._cancel_play_tick()
+        self.play_session.pick(index)
+        self.play_render_current()
             
     def build_example(self): # builds an example scene
         nodes.clear(); vars_store.clear(); inventory.clear()
+        story_graph.rebuild(nodes)
 
         node_color = self.theme.get('default_node_color', '#222222')
 
@@ -3703,6 +6461,35 @@ class VisualEditor(tk.Frame):
         self.redraw()
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Branch CYOA maker")
+    parser.add_argument("--simulate", metavar="STORY", help="run random playthroughs of a saved story instead of opening the editor")
+    parser.add_argument("--solve", metavar="STORY", help="compute exact ending probabilities of a saved story (needs NumPy)")
+    parser.add_argument("--analyze", metavar="STORY", help="report unreachable nodes, cycles and cycles that can never be left")
+    parser.add_argument("--lint", metavar="STORY", help="check a saved story for problems (invalid actions, missing nodes, unset variables, unreachable nodes)")
+    parser.add_argument("-n", "--runs", type=int, default=1000, help="number of playthroughs (default: 1000)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", default="0", help="base seed; the same seed gives the same results (default: 0)")
+    parser.add_argument("--policy", choices=sorted(SIM_POLICIES), default="random", help="how choices are picked (default: random)")
+    parser.add_argument("--max-steps", type=int, default=1000, help="steps before a run counts as stuck (default: 1000)")
+    args = parser.parse_args()
+
+    if args.simulate:
+        data = args.simulate if is_binary_story(args.simulate) or is_sqlite_story(args.simulate) else load_story_file(args.simulate)
+        result = simulate_story(data, args.runs, args.workers, args.seed, args.policy, args.max_steps)
+        print(format_simulation(result))
+        return
+    if args.solve:
+        data = load_story_file(args.solve)
+        print(format_solution(solve_endings(data)))
+        return
+    if args.analyze:
+        print(format_analysis(analyze_story(load_story_file(args.analyze))))
+        return
+    if args.lint:
+        print(format_lint(lint_story(load_story_file(args.lint), args.workers)))
+        return
+
     root = tk.Tk()
     root.geometry("1200x700")
     app = VisualEditor(root)
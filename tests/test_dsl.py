@@ -0,0 +1,119 @@
+import os, random, sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Branch
+
+
+def state(vars_store=None, inventory=None):
+    return SimpleNamespace(vars=dict(vars_store or {"x": 1}), inventory=list(inventory or ["key", "rope"]), rng=random.Random(0))
+
+
+def run(actions, vars_store=None, inventory=None, times=1):
+    st = state(vars_store, inventory)
+    for _ in range(times):
+        Branch.execute_actions(actions, {"header": "Hello"}, st)
+    return st.vars, st.inventory
+
+
+@pytest.fixture
+def registry():
+    # register_action changes module-wide tables; put them back afterwards
+    saved = dict(Branch.ACTION_PARSERS), dict(Branch.ACTION_BUILDERS), set(Branch.DSL_KEYWORDS)
+    yield
+    for table, old in zip((Branch.ACTION_PARSERS, Branch.ACTION_BUILDERS, Branch.DSL_KEYWORDS), saved):
+        table.clear()
+        table.update(old)
+    Branch._ACTION_CACHE.clear()
+
+
+@pytest.mark.parametrize("line, kind, option", [
+    ("Go north | 2 | has_item:key | x+=1; add_item:map", "leaf",
+     {"text": "Go north", "next": "2", "condition": "has_item:key", "actions": ["x+=1", "add_item:map"], "instant": False}),
+    ("Wait |", "leaf", {"text": "Wait", "next": None, "condition": None, "actions": [], "instant": False}),
+    ("Look | 3/4 | !has_item:key & x>1 | once:gold+=5 & if(x>0)>>y=1;z=2", "leaf",
+     {"text": "Look", "next": "3/4", "condition": "!has_item:key & x>1",
+      "actions": ["once:gold+=5", "if(x>0)>>y=1", "z=2"], "instant": False}),
+    ("@timer(2.5):>goto:3", "timer", {"instant": True, "timer": 2.5, "actions": ["goto:3"], "separator": ">"}),
+    ("  @x=1>goto:4", "instant", {"instant": True, "actions": ["x=1>goto:4"]}),
+    ("# note", "comment", None),
+    ("   ", "blank", None),
+])
+def test_parse_option_syntax_leaves(line, kind, option):
+    syntax = Branch.parse_option_syntax(line)
+    assert syntax.kind == kind
+    assert syntax.option == option
+    assert syntax.errors == []
+    assert Branch.parse_option_line(line) == option
+
+
+def test_parsed_actions_carry_their_columns():
+    line = "Look | 3/4 | x>1 | once:gold+=5 & if(x>0)>>y=1;z=2"
+    actions = Branch.parse_option_syntax(line).actions
+    assert [(a.kind, a.start, a.end, a.args) for a in actions] == [
+        ("once", 19, 31, {"key": "gold+=5"}),
+        ("if_then", 34, 46, {"cond": "x>0"}),
+        ("assign", 47, 50, {"name": "z", "op": "=", "rhs": "2"}),
+    ]
+    assert line[19:31] == "once:gold+=5"
+
+
+@pytest.mark.parametrize("line, errors", [
+    ("Look | 1 | | add_item:", [(13, 22, "add_item needs an item name")]),
+    ("a | 1 | | | extra", [(0, 17, "too many '|' separators (a leaf is TEXT | NEXT | CONDITION | ACTIONS)")]),
+])
+def test_parse_option_syntax_errors(line, errors):
+    assert Branch.parse_option_syntax(line).errors == errors
+
+
+@pytest.mark.parametrize("actions, vars_store, inventory", [
+    (["x+=2", "add_item:map", "remove_item:key", "rename_item:rope,ladder", "set:flag=true", "clamp(x:0,2)"],
+     {"x": 2, "flag": True}, ["map", "ladder"]),
+    (["if(x>0)>y=1", "if(x>5):<a=1>a=2", "if(has_item:key)<k=1>", "chance(100)>c=1", "chance(0)>d=1>d=2"],
+     {"x": 1, "y": 1, "a": 2, "k": 1, "c": 1, "d": 2}, ["key", "rope"]),
+    (["repeat:3>n+=1", "goto:7"], {"x": 1, "n": 3, "__goto": "7"}, ["key", "rope"]),
+    (["consume(key:opened=1)", "consume(gem:never=1)", 'name="Ann"', "w = x*10+1"],
+     {"x": 1, "opened": 1, "name": "Ann", "w": 11}, ["rope"]),
+    (["clearinv", "add_item:a&add_item:b"], {"x": 1}, ["a", "b"]),
+])
+def test_execute_actions_states(actions, vars_store, inventory):
+    assert run(actions) == (vars_store, inventory)
+
+
+def test_once_runs_once():
+    vars_store, _ = run(["once:z+=1"], times=3)
+    assert vars_store["z"] == 1
+
+
+def test_registered_action_parses_and_runs(registry):
+    def build(action):
+        def shout(current_node, state):
+            state.vars.setdefault("log", []).append(action.args["arg"])
+        return shout
+
+    Branch.register_action("shout", build)
+    assert "shout" in Branch.DSL_KEYWORDS
+    syntax = Branch.parse_option_syntax("Yell | 2 | | shout:Hi; shout(there) & x+=1")
+    assert syntax.errors == []
+    assert [(a.kind, a.args) for a in syntax.actions] == [
+        ("shout", {"arg": "Hi"}), ("shout", {"arg": "there"}), ("assign", {"name": "x", "op": "+=", "rhs": "1"}),
+    ]
+    assert run(syntax.option["actions"]) == ({"x": 2, "log": ["Hi", "there"]}, ["key", "rope"])
+
+
+def test_registering_again_replaces_compiled_actions(registry):
+    Branch.register_action("bump", lambda action: lambda node, state: state.vars.update(n=1))
+    assert run(["bump"])[0]["n"] == 1
+    Branch.register_action("bump", lambda action: lambda node, state: state.vars.update(n=2))
+    assert run(["bump"])[0]["n"] == 2
+
+
+def test_custom_parser_can_leave_text_to_assignments(registry):
+    def parse(sub, offset):
+        return Branch.Action("double", offset, offset + len(sub)) if sub == "double" else None
+
+    Branch.register_action("double", lambda action: lambda node, state: state.vars.update(x=state.vars["x"] * 2), parse)
+    assert run(["double", "double"]) == ({"x": 4}, ["key", "rope"])
+    assert run(["double=5"]) == ({"x": 1, "double": 5}, ["key", "rope"]) # not claimed by the parser: an assignment
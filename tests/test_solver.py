@@ -0,0 +1,68 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Branch
+
+pytest.importorskip("numpy")
+
+
+def story(first_options, vars_store=None):
+    return {
+        "nodes": {
+            "1": {"header": "start", "text": "", "options": first_options},
+            "2": {"header": "two", "text": "", "options": []},
+            "3": {"header": "three", "text": "", "options": []},
+        },
+        "vars_store": vars_store or {},
+        "start_node": 1,
+    }
+
+
+def simulated_endings(data, runs=4000):
+    result = Branch.simulate_story(data, runs=runs, workers=1, seed=0)
+    return {node: n / result["runs"] for node, n in result["endings"].items()}
+
+
+@pytest.mark.parametrize("options, expected", [
+    # a goto back to the node itself stays there and shows its choices
+    (["@goto:1/2", "go | 3"], {2: 0.5, 3: 0.5}),
+    # '>' runs only the first action, so the goto never happens
+    (["@x=1;goto:2", "go | 3"], {3: 1.0}),
+    (["@goto:2", "go | 3"], {2: 1.0}),
+    # waiting for a timer is a choice like any leaf, and its goto leaves the node
+    (["@timer(1):>goto:2"], {2: 1.0}),
+    (["@timer(1):>goto:2", "go | 3"], {2: 0.5, 3: 0.5}),
+])
+def test_solver_agrees_with_simulator(options, expected):
+    data = story(options)
+    solved = Branch.solve_endings(data)["endings"]
+    assert solved == pytest.approx(expected)
+    simulated = simulated_endings(data)
+    assert set(simulated) == set(expected)
+    for node, p in expected.items():
+        assert simulated[node] == pytest.approx(p, abs=0.03)
+
+
+def test_variable_next_is_unresolved_not_an_ending():
+    result = Branch.solve_endings(story(["a | target", "b | 3"], {"target": 2}))
+    assert result["endings"] == pytest.approx({3: 0.5})
+    assert result["unresolved"] == pytest.approx({1: 0.5})
+    assert result["variable_dependent"] == [1]
+
+
+def test_timer_without_goto_is_not_an_ending():
+    result = Branch.solve_endings(story(["@timer(1):>x=1"]))
+    assert result["endings"] == {}
+    assert result["stuck"] == pytest.approx({("loop", 1): 1.0})
+
+
+def test_large_loops_are_iterated_to_the_same_answer(monkeypatch):
+    data = story(["again | 2", "on | 3"])
+    data["nodes"]["2"]["options"] = ["back | 1", "stop |"]
+    dense = Branch.solve_endings(data)
+    monkeypatch.setattr(Branch, "SOLVER_DENSE_MAX", 0)
+    iterated = Branch.solve_endings(data)
+    assert iterated["endings"] == pytest.approx(dense["endings"])
+    assert iterated["expected_visits"] == pytest.approx(dense["expected_visits"])
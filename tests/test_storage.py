@@ -0,0 +1,157 @@
+import json, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Branch
+
+
+def story():
+    return {
+        "nodes": {
+            "1": {"header": "Start", "text": "Où aller ? 🌲", "x": 40, "y": 60.5, "color": "#222222",
+                  "options": [{"text": "Left", "next": "2"}, {"instant": True, "actions": ["gold+=5", "goto:3"]},
+                              {"text": "Right", "next": "2/3", "actions": []}]},
+            "2": {"header": "", "text": "", "x": -120, "y": 0, "options": [], "extra": [None, True, False, 1.25, 2 ** 70]},
+            "3": {"header": "End", "text": "line one\nline two", "options": [{"text": "again", "next": "target"}], "notes": {"a": {"b": [1, "2"]}}},
+            "-4": {"header": "negative id", "text": "", "options": []},
+        },
+        "vars_store": {"gold": 0, "target": 1, "name": "Ann", "ratio": 0.5},
+        "inventory": ["key", "key", "map"],
+        "start_node": 1,
+    }
+
+
+def as_loaded(data):
+    # what the editor holds after a load: the same data with integer node ids
+    data = json.loads(json.dumps(data))
+    data["nodes"] = {int(nid): node for nid, node in data["nodes"].items()}
+    return data
+
+
+@pytest.mark.parametrize("ext, write", [
+    (".json", Branch.write_json_atomic),
+    (Branch.BINARY_STORY_EXT, Branch.write_story_binary),
+    (Branch.SQLITE_STORY_EXT, Branch.write_story_sqlite),
+])
+def test_story_files_round_trip(tmp_path, ext, write):
+    path = str(tmp_path / ("story" + ext))
+    write(path, story())
+    assert as_loaded(Branch.load_story_file(path)) == as_loaded(story())
+
+    events = list(Branch.iter_story_file(path))
+    streamed = {key: val for kind, key, val, _ in events if kind == "meta"}
+    streamed["nodes"] = {key: val for kind, key, val, _ in events if kind == "node"}
+    assert streamed == as_loaded(story())
+
+
+def test_mapped_binary_story_round_trips(tmp_path, monkeypatch):
+    path = str(tmp_path / ("story" + Branch.BINARY_STORY_EXT))
+    Branch.write_story_binary(path, story())
+    monkeypatch.setattr(Branch, "MAPPED_NODE_CACHE", 2) # nodes get evicted and decoded again
+    expected = as_loaded(story())["nodes"]
+    with Branch.BinaryStory(path, mapped=True) as mapped:
+        for _ in range(3):
+            assert {nid: mapped[nid] for nid in mapped} == expected
+        assert mapped.position(-4) == (0.0, 0.0)
+        assert mapped.position(2) == (-120.0, 0.0)
+
+
+def test_mapped_node_cache_keeps_recently_used_nodes(tmp_path, monkeypatch):
+    path = str(tmp_path / ("story" + Branch.BINARY_STORY_EXT))
+    Branch.write_story_binary(path, story())
+    monkeypatch.setattr(Branch, "MAPPED_NODE_CACHE", 2)
+    with Branch.BinaryStory(path, mapped=True) as mapped:
+        first = mapped[1]
+        mapped[2]
+        mapped[1] # a hit: node 2 is now the least recently used
+        mapped[3]
+        assert list(mapped._decoded) == [1, 3]
+        assert mapped[1] is first
+
+
+def test_sqlite_story_round_trips_through_its_cache(tmp_path):
+    path = str(tmp_path / ("story" + Branch.SQLITE_STORY_EXT))
+    Branch.write_story_sqlite(path, story())
+    expected = as_loaded(story())
+    with Branch.SqliteStory(path, cache_size=1) as db:
+        assert {nid: db[nid] for nid in db} == expected["nodes"]
+        assert as_loaded(db.export_data()) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [3, Branch.STREAM_CHUNK_SIZE])
+def test_iter_story_json_rejects_every_truncation(tmp_path, chunk_size):
+    text = json.dumps(story(), indent=2, ensure_ascii=False)
+    path = tmp_path / "story.json"
+    path.write_text(text, encoding="utf-8")
+    assert len(list(Branch.iter_story_json(str(path), chunk_size))) == len(story()["nodes"]) + 3
+
+    raw = text.encode("utf-8")
+    for cut in range(len(raw)):
+        path.write_bytes(raw[:cut])
+        with pytest.raises(ValueError):
+            list(Branch.iter_story_json(str(path), chunk_size))
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "[]",
+    '{"nodes": []}',
+    '{"nodes": {"one": {}}}',
+    '{"nodes": {"1": {}} "start_node": 1}',
+    '{"nodes": {"1": {"header": }}}',
+    '{"start_node": 1,}',
+])
+def test_iter_story_json_rejects_malformed_files(tmp_path, text):
+    path = tmp_path / "story.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(Branch.iter_story_json(str(path)))
+
+
+@pytest.mark.parametrize("ext, write", [
+    (".json", Branch.write_json_atomic),
+    (Branch.BINARY_STORY_EXT, Branch.write_story_binary),
+    (Branch.SQLITE_STORY_EXT, Branch.write_story_sqlite),
+])
+def test_journal_replay_matches_a_full_save(tmp_path, ext, write):
+    path = str(tmp_path / ("story" + ext))
+    write(path, story())
+
+    edited = as_loaded(story())
+    records = []
+    edited["nodes"][5] = {"header": "new", "text": "", "options": [{"text": "back", "next": "1"}]}
+    records.append({"op": "node", "id": 5, "data": edited["nodes"][5]})
+    edited["nodes"][1]["x"], edited["nodes"][1]["y"] = 300, 310
+    records.append({"op": "move", "id": 1, "x": 300, "y": 310})
+    edited["nodes"][30] = edited["nodes"].pop(3)
+    records.append({"op": "rename", "id": 3, "to": 30})
+    del edited["nodes"][-4]
+    records.append({"op": "del", "id": -4})
+    edited["vars_store"]["gold"] = 7
+    edited["inventory"].append("lamp")
+    records.append({"op": "vars", "vars": edited["vars_store"], "inventory": edited["inventory"]})
+    edited["start_node"] = 2
+    records.append({"op": "start", "id": 2})
+    jpath = Branch.journal_path(path)
+    Branch.append_journal(jpath, records[:3])
+    Branch.append_journal(jpath, records[3:])
+    with open(jpath, "a", encoding="utf-8") as f:
+        f.write('{"op": "del", "id"') # torn by a crash mid-append
+
+    # what a load does: stream the saved file in, then replay the journal over it
+    replayed = {"vars_store": {}, "inventory": [], "nodes": {}}
+    for kind, key, val, _ in Branch.iter_story_file(path):
+        if kind == "meta":
+            replayed[key] = val
+        else:
+            replayed["nodes"][key] = val
+    assert Branch.replay_journal(jpath, replayed) == len(records)
+
+    saved = str(tmp_path / ("saved" + ext))
+    write(saved, edited)
+    assert as_loaded(replayed) == as_loaded(Branch.load_story_file(saved))
+
+
+def test_journal_sits_next_to_each_story_file():
+    assert Branch.journal_path("stories/a.json") != Branch.journal_path("stories/a" + Branch.BINARY_STORY_EXT)